@@ -1,16 +1,25 @@
 """
 主应用程序类
 """
+import signal
 import time
-import cv2
 from typing import Optional
 from config.config import Config
 from utils.logger import Logger
-from utils.performance import PerformanceMonitor
+from utils.performance import PerformanceMonitor, AdaptiveController, StageTracer, get_process_stats
+from utils.metrics import MetricsExporter, MetricsWriter
 from core.camera import CameraManager
-from core.detector import YOLODetector
+from core.detector import YOLODetector, annotate_frame
 from core.analyzer import QwenAnalyzer
+from core.async_analyzer import AsyncQwenAnalyzer
 from core.display import DisplayManager
+from core.pipeline import ProcessPipeline
+from core.renderer import RenderThread
+from core.recorder import ClipRecorder
+from core.store import DetectionStore
+from core.motion import ChangeDetector
+from core.tracker import MultiObjectTracker
+from core.scheduler import AnalysisScheduler
 from models.data_models import DetectionInfo
 
 class RealtimeVLMApp:
@@ -21,21 +30,51 @@ class RealtimeVLMApp:
         config.validate()
         
         self.config = config
-        self.logger = Logger(config.log_level, config.log_file)
+        self.logger = Logger.from_config(config)
+        self.tracer = StageTracer(config.stage_tracing)
         
-        # 初始化各个组件
-        self.camera_manager = CameraManager(config, self.logger)
-        self.detector = YOLODetector(config, self.logger)
-        self.analyzer = QwenAnalyzer(config, self.logger)
-        self.display_manager = DisplayManager(config)
+        # 初始化各个组件 (多进程模式下采集和检测在子进程中进行)
+        self.process_pipeline = config.pipeline_mode == "process"
+        if self.process_pipeline:
+            self.camera_manager = ProcessPipeline(config, self.logger)
+            self.detector = None
+        else:
+            self.camera_manager = CameraManager(config, self.logger)
+            self.detector = YOLODetector(config, self.logger, self.tracer)
+        analyzer_class = AsyncQwenAnalyzer if config.analyzer_mode == "async" else QwenAnalyzer
+        self.analyzer = analyzer_class(config, self.logger, tracer=self.tracer)
+        self.display_manager = DisplayManager(config, self.logger)
+        self.renderer = RenderThread(
+            self.display_manager,
+            lambda frame, detection_info: annotate_frame(config, frame, detection_info, copy=False),
+            self._get_display_status, self.logger, self.tracer
+        ) if config.use_render_thread() else None
+        self.recorder = ClipRecorder(config, self.logger) if config.record_enabled else None
+        self.change_detector = ChangeDetector(config) if config.motion_gating and not self.process_pipeline else None
+        self.tracker = MultiObjectTracker(config) if config.tracking_enabled and not self.process_pipeline else None
+        self.scheduler = AnalysisScheduler(config) if config.analysis_trigger == "event" else None
+        self.adaptive_controller = AdaptiveController(config, self.logger) if config.adaptive_enabled else None
+        if self.adaptive_controller is not None and self.process_pipeline:
+            self.adaptive_controller.add_listener(self.camera_manager.apply_settings)
         self.performance_monitor = PerformanceMonitor(
             self.logger, 
             config.performance_window_size, 
-            config.fps_warning_threshold
+            config.fps_warning_threshold,
+            self.adaptive_controller,
+            self.tracer
         )
+        self.metrics_exporter = MetricsExporter(config, self.logger) if config.metrics_enabled else None
+        self.store = DetectionStore(config, self.logger) if config.store_enabled else None
         
         # 状态变量
         self.last_analysis_time = 0
+        self.last_detection = None
+        self.frames_since_detection = 0
+        self.detector_calls = 0
+        self.frame_count = 0
+        self.latest_detection_info: Optional[DetectionInfo] = None
+        # 各类别检测数在所有帧上的累计 (供指标导出)，出现新类别时整体替换，指标线程遍历时字典大小不变
+        self.class_totals = {class_name: 0 for class_name in self.display_manager.all_classes}
         self.running = False
         
     def initialize(self) -> bool:
@@ -43,12 +82,28 @@ class RealtimeVLMApp:
         self.logger.info("正在初始化应用程序...")
         
         try:
-            # 初始化摄像头
+            # 初始化帧源
             if not self.camera_manager.initialize():
                 return False
             
             # 启动分析器
             self.analyzer.start_worker()
+            if self.store is not None:
+                self.store.start()
+            
+            # 启动显示后端 (无界面模式下为HTTP预览服务)
+            if self.display_manager.preview_server is not None:
+                self.display_manager.preview_server.set_status_provider(self._get_status)
+            self.display_manager.start()
+            if self.renderer is not None:
+                self.renderer.start()
+            if self.recorder is not None:
+                self.recorder.start()
+                if self.display_manager.preview_server is not None:
+                    self.display_manager.preview_server.set_record_handler(self.recorder.trigger)
+            if self.metrics_exporter is not None:
+                self.metrics_exporter.add_collector(self._collect_metrics)
+                self.metrics_exporter.start()
             
             # 记录系统信息
             self._log_system_info()
@@ -58,12 +113,17 @@ class RealtimeVLMApp:
             
         except Exception as e:
             self.logger.error(f"应用程序初始化失败: {e}")
+            # 如预览或指标端口被占用，释放已启动的组件
+            self._stop_components()
             return False
     
     def _log_system_info(self):
         """记录系统信息"""
         camera_info = self.camera_manager.get_camera_info()
-        model_info = self.detector.get_model_info()
+        model_info = self.detector.get_model_info() if self.detector is not None else {
+            'model_path': self.config.model_path,
+            'backend': self.config.inference_backend
+        }
         
         self.logger.info(f"摄像头信息: {camera_info}")
         self.logger.info(f"模型信息: {model_info}")
@@ -76,7 +136,13 @@ class RealtimeVLMApp:
             return
         
         self.running = True
-        self.logger.info("开始实时检测，按 'q' 退出...")
+        self._install_signal_handlers()
+        if self.display_manager.headless:
+            self.logger.info("开始实时检测 (无界面模式)，发送 SIGINT/SIGTERM 退出...")
+        else:
+            self.logger.info("开始实时检测，按 'q' 退出...")
+        if self.recorder is not None:
+            self.logger.info("手动触发录像: " + ("POST /record" if self.display_manager.headless else "按 'r' 键"))
         
         try:
             self._main_loop()
@@ -87,98 +153,356 @@ class RealtimeVLMApp:
         finally:
             self._cleanup()
     
+    def _install_signal_handlers(self):
+        """SIGINT/SIGTERM 触发优雅退出，主循环在当前帧结束后停止"""
+        def handle_signal(signum, frame):
+            self.logger.info(f"收到信号 {signal.Signals(signum).name}，正在退出...")
+            self.running = False
+        
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                signal.signal(signum, handle_signal)
+            except ValueError:
+                # 非主线程中无法注册信号处理
+                pass
+    
     def _main_loop(self):
         """主处理循环"""
-        frame_count = 0
+        self.frame_count = 0
         
         while self.running:
             loop_start_time = time.time()
             
             # 读取帧
-            success, frame = self.camera_manager.read_frame()
-            if not success:
-                self.logger.error("读取帧失败")
+            with self.tracer.span('capture'):
+                packet = self.camera_manager.read_packet()
+            if packet is None:
+                if self.camera_manager.is_finished():
+                    self.logger.info("帧源已播放完毕")
+                    break
+                if self.camera_manager.is_alive():
+                    # 采集端仍在运行，只是暂时没有新帧，继续等待
+                    self.logger.warning("等待新帧超时", key="read_timeout")
+                    if self._poll_keys():
+                        break
+                    continue
+                self.logger.error("读取帧失败", key="read_failure")
                 break
+            frame = packet.frame
             
             # YOLO检测
-            processed_frame, detection_info = self.detector.detect(frame)
+            if self.process_pipeline:
+                # 检测结果由检测进程随帧附带
+                detection_info = packet.detection_info
+                processed_frame = frame
+                if self.config.draw_detections and self.renderer is None:
+                    processed_frame = annotate_frame(self.config, frame, detection_info)
+            else:
+                processed_frame, detection_info = self._detect(frame)
+            
+            self.latest_detection_info = detection_info
+            if self.metrics_exporter is not None and detection_info is not None:
+                for class_name, count in detection_info.counts.items():
+                    if class_name in self.class_totals:
+                        self.class_totals[class_name] += count
+                    else:
+                        self.class_totals = {**self.class_totals, class_name: count}
             
             # 定时分析
-            self._handle_analysis(processed_frame, detection_info, frame_count)
+            analysis_frame = frame if self.config.payload_raw_frame else processed_frame
+            self.analyzer.record_frame(analysis_frame, detection_info)
+            self._handle_analysis(analysis_frame, detection_info, self.frame_count)
+            
+            # 事件录像 (只做缩小入队，压缩和写盘在后台线程)
+            if self.recorder is not None:
+                with self.tracer.span('record'):
+                    if self.config.record_keywords:
+                        self.recorder.observe_analysis(self.analyzer.get_current_analysis())
+                    self.recorder.push(frame, detection_info)
             
             # 性能监控
             frame_time = time.time() - loop_start_time
             self.performance_monitor.record_frame_time(frame_time)
             self.performance_monitor.check_performance()
             
+            # 持久化 (只入队，由后台线程批量写入)
+            if self.store is not None:
+                self.store.record_frame(self.frame_count, detection_info, frame_time)
+                for result in self.analyzer.pop_results():
+                    self.store.record_analysis(result)
+            
             # 显示处理
             self._handle_display(processed_frame, detection_info, frame_time)
             
-            frame_count += 1
+            self.frame_count += 1
             
             # 检查退出条件
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                self.logger.info("检测到 'q' 键按下，正在退出...")
+            if self._poll_keys():
                 break
     
+    def _poll_keys(self) -> bool:
+        """处理按键，按下 'q' 时返回True"""
+        key = self.renderer.poll_key() if self.renderer is not None else self.display_manager.poll_key()
+        if key == ord('q'):
+            self.logger.info("检测到 'q' 键按下，正在退出...")
+            return True
+        if key == ord('r') and self.recorder is not None:
+            self.recorder.trigger("手动 (按键)")
+        return False
+    
+    def _detect(self, frame):
+        """执行检测，画面静止时复用上一次结果，按检测间隔在中间帧使用跟踪外推
+        
+        只缓存检测结果，复用时在当前帧上重新绘制: 上一帧所在的采集槽位可能已被覆盖。
+        """
+        detection_info = self._detection_info(frame)
+        # 启用渲染线程时由渲染线程绘制检测框
+        if self.config.draw_detections and self.renderer is None:
+            return self.detector.annotate(frame, detection_info), detection_info
+        return frame, detection_info
+    
+    def _detection_info(self, frame) -> Optional[DetectionInfo]:
+        if self.change_detector is not None:
+            changed = self.change_detector.should_infer(frame)
+            if not changed and self.last_detection is not None:
+                return self.last_detection
+        
+        self.frames_since_detection += 1
+        run_detector = (self.last_detection is None
+                        or self.frames_since_detection >= self.config.detection_stride)
+        if run_detector:
+            self.frames_since_detection = 0
+            self.detector_calls += 1
+            if self.change_detector is not None:
+                self.change_detector.commit()
+            _, detection_info = self.detector.detect(frame, annotate=False)
+            if self.tracker is not None:
+                detection_info = self.tracker.update(detection_info)
+        elif self.tracker is not None:
+            detection_info = self.tracker.predict()
+        else:
+            return self.last_detection
+        
+        self.last_detection = detection_info
+        return detection_info
+    
     def _handle_analysis(self, frame, detection_info: Optional[DetectionInfo], frame_count: int):
         """处理分析逻辑"""
         current_time = time.time()
+        trigger = None
+        if self.scheduler is not None:
+            # 事件驱动: 由调度器根据bad占比变化决定是否分析
+            trigger = self.scheduler.update(detection_info, current_time)
+            due = trigger is not None
+        else:
+            due = current_time - self.last_analysis_time >= self.config.analysis_interval
         should_analyze = (
-            current_time - self.last_analysis_time >= self.config.analysis_interval
+            due
             and detection_info is not None
             and not detection_info.is_empty()
             and not self.analyzer.is_busy()
         )
         
         if should_analyze:
+            if self.renderer is not None and self.config.draw_detections and not self.config.payload_raw_frame:
+                # 推理线程不再绘制检测框，仅在提交分析时为分析帧标注
+                frame = annotate_frame(self.config, frame, detection_info)
             if self.analyzer.add_analysis_task(frame, detection_info):
-                self.logger.info(f"已提交第{frame_count}帧进行后台分析")
+                if trigger is not None:
+                    self.logger.info(f"已提交第{frame_count}帧进行后台分析 (触发: {trigger.reason}, "
+                                     f"bad占比 {trigger.bad_fraction:.0%}, 合并 {trigger.coalesced} 次)")
+                    self.scheduler.mark_fired(current_time)
+                else:
+                    self.logger.info(f"已提交第{frame_count}帧进行后台分析")
                 self.last_analysis_time = current_time
             else:
-                self.logger.warning("提交分析任务失败")
+                self.logger.warning("提交分析任务失败", key="analysis_submit")
     
     def _handle_display(self, frame, detection_info: Optional[DetectionInfo], 
                        frame_time: float):
         """处理显示逻辑"""
+        # 无界面模式下没有预览客户端时跳过绘制和编码
+        if not self.display_manager.has_viewer():
+            return
+        
+        fps = self.performance_monitor.get_current_fps()
+        if self.renderer is not None:
+            # 采集缓冲区槽位会被复用，交给渲染线程前需拷贝
+            self.renderer.submit(frame.copy(), detection_info, fps)
+            return
+        
         # 获取当前状态
-        fps = self.performance_monitor.get_current_fps(frame_time)
-        current_analysis = self.analyzer.get_current_analysis()
-        is_analyzing = self.analyzer.is_busy()
-        status_text = "正在分析中..." if is_analyzing else "分析空闲"
+        status_text, current_analysis, is_analyzing = self._get_display_status()
         
         # 绘制信息覆盖层
-        display_frame = self.display_manager.draw_info_overlay(
-            frame, fps, detection_info, status_text, current_analysis, is_analyzing
-        )
+        with self.tracer.span('overlay'):
+            display_frame = self.display_manager.draw_info_overlay(
+                frame, fps, detection_info, status_text, current_analysis, is_analyzing
+            )
         
         # 调整显示大小并显示
-        display_frame = self.display_manager.resize_for_display(display_frame)
-        self.display_manager.show_frame(display_frame)
+        with self.tracer.span('display'):
+            display_frame = self.display_manager.resize_for_display(display_frame)
+            self.display_manager.show_frame(display_frame)
+    
+    def _get_display_status(self):
+        """覆盖层所需的分析状态: (状态文本, 当前分析结果, 是否正在分析)"""
+        is_analyzing = self.analyzer.is_analyzing
+        status_text = "正在分析中..." if is_analyzing else "分析空闲"
+        return status_text, self.analyzer.get_current_analysis(), is_analyzing
+    
+    def _get_status(self) -> dict:
+        """预览服务状态接口的数据 (在HTTP线程中调用)"""
+        detection_info = self.latest_detection_info
+        has_detections = detection_info is not None and not detection_info.is_empty()
+        return {
+            'timestamp': time.time(),
+            'frame_count': self.frame_count,
+            'fps': round(self.performance_monitor.get_current_fps(), 2),
+            'counts': {name: (detection_info.counts.get(name, 0) if has_detections else 0)
+                       for name in self.display_manager.all_classes},
+            'total': detection_info.total_count if has_detections else 0,
+            'analysis': {
+                'text': self.analyzer.get_current_analysis(),
+                'is_analyzing': self.analyzer.is_analyzing,
+                'last_analysis_time': self.last_analysis_time
+            },
+            'analysis_stats': self.analyzer.get_stats(),
+            'stages': self.performance_monitor.get_stage_stats()
+        }
+    
+    def _collect_metrics(self, writer: MetricsWriter):
+        """指标抓取时采集当前状态 (在指标服务线程中调用)"""
+        writer.gauge("fps", self.performance_monitor.get_current_fps(), "主循环帧率 (EWMA)")
+        writer.counter("frames_total", self.performance_monitor.frame_count, "主循环已处理帧数")
+        for stage, histogram in self.performance_monitor.tracer.get_histograms().items():
+            writer.histogram("stage_latency_seconds", histogram, "各处理阶段耗时", {'stage': stage})
+        
+        capture_stats = self.camera_manager.get_stats()
+        writer.counter("captured_frames_total", capture_stats.get('captured_frames', 0), "采集帧数")
+        dropped_help = "各环节丢弃的帧数"
+        writer.counter("dropped_frames_total", capture_stats.get('dropped_frames', 0), dropped_help, {'stage': 'capture'})
+        if self.renderer is not None:
+            writer.counter("dropped_frames_total", self.renderer.get_stats()['render_dropped'], dropped_help,
+                           {'stage': 'render'})
+        preview_stats = self.display_manager.get_stats()
+        if preview_stats:
+            writer.counter("dropped_frames_total", preview_stats['preview_dropped_frames'], dropped_help,
+                           {'stage': 'preview'})
+            writer.gauge("preview_clients", preview_stats['preview_clients'], "预览客户端数")
+        if self.recorder is not None:
+            record_stats = self.recorder.get_stats()
+            writer.counter("dropped_frames_total", record_stats['record_dropped_frames'], dropped_help,
+                           {'stage': 'record'})
+            writer.counter("record_triggers_total", record_stats['record_triggers'], "录像触发次数")
+            writer.counter("record_clips_total", record_stats['record_clips'], "已保存的录像数")
+            writer.gauge("record_buffer_bytes", record_stats['record_buffer_mb'] * 1024 * 1024, "录像缓冲占用内存")
+        if self.store is not None:
+            store_stats = self.store.get_stats()
+            writer.counter("store_rows_written_total", store_stats['store_rows_written'], "已持久化的行数")
+            writer.counter("store_dropped_rows_total", store_stats['store_dropped_rows'], "持久化队列满时丢弃的行数")
+            writer.gauge("store_queue_depth", store_stats['store_queue'], "等待写入的行数")
+        if self.detector is not None:
+            writer.counter("detector_calls_total", self.detector_calls, "YOLO推理次数")
+        
+        detection_info = self.latest_detection_info
+        current_counts = detection_info.counts if detection_info is not None else {}
+        class_totals = self.class_totals
+        for class_name in sorted(class_totals):
+            labels = {'class': class_name}
+            writer.gauge("detections", current_counts.get(class_name, 0), "当前帧各类别检测数", labels)
+            writer.counter("detections_total", class_totals[class_name], "各类别检测数逐帧累计", labels)
+        
+        stats = self.analyzer.get_stats()
+        writer.gauge("analyzer_queue_depth", self.analyzer.get_queue_depth(), "排队和执行中的分析任务数")
+        writer.counter("analyses_total", stats['total_analysis'], "已提交的分析次数")
+        writer.counter("analysis_failures_total", stats.get('failed', 0), "失败的分析次数")
+        writer.counter("api_retries_total", stats['api_retries'], "API重试次数")
+        writer.gauge("api_latency_avg_seconds", stats['avg_latency'], "分析平均总耗时")
+        if 'avg_ttft' in stats:
+            writer.gauge("api_ttft_avg_seconds", stats['avg_ttft'], "流式分析平均首token延迟")
+        if 'timeouts' in stats:
+            writer.counter("analysis_timeouts_total", stats['timeouts'], "超过截止时间的分析次数")
+            writer.counter("analysis_rejected_total", stats['rejected'], "并发已满被拒绝的分析次数")
+        writer.gauge("circuit_open", 0 if stats['circuit_state'] == 'closed' else 1, "API熔断器是否打开")
+        writer.counter("circuit_rejected_total", stats['circuit_rejected'], "熔断期间拒绝的调用数")
+        if 'cache_hits' in stats:
+            writer.counter("cache_hits_total", stats['cache_hits'], "分析缓存命中次数")
+            writer.counter("cache_misses_total", stats['cache_misses'], "分析缓存未命中次数")
+            writer.counter("cache_evictions_total", stats['cache_evictions'], "分析缓存淘汰次数")
+            writer.gauge("cache_entries", stats['cache_size'], "分析缓存条目数")
+        
+        process_stats = get_process_stats()
+        writer.counter("process_cpu_seconds_total", process_stats['cpu_seconds'], "主进程累计CPU时间")
+        writer.gauge("process_resident_memory_bytes", process_stats['rss_mb'] * 1024 * 1024, "主进程常驻内存")
     
     def _cleanup(self):
         """清理资源"""
         self.logger.info("正在清理资源...")
         self.running = False
-        
-        # 停止各个组件
-        self.analyzer.stop()
-        self.camera_manager.release()
-        self.display_manager.cleanup()
+        self._stop_components()
         
         # 输出性能和分析统计
         self._log_final_stats()
         self.logger.info("所有资源已释放，程序结束")
     
+    def _stop_components(self):
+        """停止各个组件 (未启动的组件直接跳过)"""
+        self.analyzer.stop()
+        if self.store is not None:
+            for result in self.analyzer.pop_results():
+                self.store.record_analysis(result)
+            self.store.stop()
+        if self.renderer is not None:
+            self.renderer.stop()
+        if self.recorder is not None:
+            self.recorder.stop()
+        self.camera_manager.release()
+        self.display_manager.cleanup()
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+    
     def _log_final_stats(self):
         """记录最终统计信息"""
         perf_summary = self.performance_monitor.get_summary()
         analysis_stats = self.analyzer.get_stats()
+        if self.scheduler is not None:
+            analysis_stats.update(self.scheduler.get_stats())
+        capture_stats = self.camera_manager.get_stats()
+        if self.detector is not None:
+            capture_stats['detector_calls'] = self.detector_calls
+        capture_stats.update(self.display_manager.get_stats())
+        if self.renderer is not None:
+            capture_stats.update(self.renderer.get_stats())
+        if self.recorder is not None:
+            capture_stats.update(self.recorder.get_stats())
+        if self.store is not None:
+            capture_stats.update(self.store.get_stats())
+        if self.change_detector is not None:
+            capture_stats.update(self.change_detector.get_stats())
+        if self.tracker is not None:
+            capture_stats.update(self.tracker.get_stats())
+        if self.adaptive_controller is not None:
+            perf_summary.update(self.adaptive_controller.get_stats())
+        stage_stats = self.performance_monitor.get_stage_stats()
+        # 多进程模式下检测进程的阶段统计随流水线统计返回
+        stage_stats.update(capture_stats.pop('detect_stages', {}))
         
         self.logger.info("=== 性能总结 ===")
         for key, value in perf_summary.items():
             self.logger.info(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
         
+        self.logger.info("=== 阶段耗时 ===")
+        for stage, stats in stage_stats.items():
+            if stats.get('count'):
+                self.logger.info(f"{stage}: n={stats['count']}, mean={stats['mean_ms']:.2f}ms, "
+                                 f"p50={stats['p50_ms']:.2f}ms, p95={stats['p95_ms']:.2f}ms, "
+                                 f"p99={stats['p99_ms']:.2f}ms, max={stats['max_ms']:.2f}ms")
+        
+        self.logger.info("=== 采集统计 ===")
+        for key, value in capture_stats.items():
+            self.logger.info(f"{key}: {value}")
+        
         self.logger.info("=== 分析统计 ===")
         for key, value in analysis_stats.items():
             self.logger.info(f"{key}: {value}")
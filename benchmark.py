@@ -0,0 +1,282 @@
+"""
+离线吞吐量/延迟基准测试 - 基于自带数据集
+"""
+import argparse
+import json
+import os
+import platform
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+import numpy as np
+from config.config import Config
+from utils.logger import Logger
+from utils.performance import get_peak_rss_mb, StageTracer
+from core.sources import ImageDirectorySource
+from core.detector import YOLODetector
+from core.display import DisplayManager
+from core.analyzer import QwenAnalyzer
+from mock_server import MockQwenServer
+
+DATASET_ROOT = os.path.join("data", "images")
+DEFAULT_SPLITS = ["train", "valid", "test"]
+
+class StubQwenClient:
+    """代替Qwen API的桩客户端，接口与OpenAI客户端一致"""
+    
+    def __init__(self, latency: float = 0.0, reply: str = "刀头磨损正常"):
+        self.latency = latency
+        self.reply = reply
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+    
+    def _create(self, **kwargs):
+        self.calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        message = SimpleNamespace(content=self.reply)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+class StageTimer:
+    """按阶段收集耗时样本"""
+    
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+    
+    def record(self, stage: str, seconds: float):
+        self.samples.setdefault(stage, []).append(seconds)
+    
+    def summarize(self) -> Dict[str, dict]:
+        """计算各阶段p50/p95/p99延迟和FPS"""
+        summary = {}
+        for stage, values in self.samples.items():
+            data = np.asarray(values) * 1000.0
+            mean_ms = float(data.mean())
+            p50, p95, p99 = np.percentile(data, [50, 95, 99])
+            summary[stage] = {
+                'count': int(data.size),
+                'mean_ms': round(mean_ms, 3),
+                'p50_ms': round(float(p50), 3),
+                'p95_ms': round(float(p95), 3),
+                'p99_ms': round(float(p99), 3),
+                'max_ms': round(float(data.max()), 3),
+                'fps': round(1000.0 / mean_ms, 2) if mean_ms > 0 else 0.0
+            }
+        return summary
+
+
+def load_frames(splits: List[str], logger: Logger, limit: int = 0) -> List[np.ndarray]:
+    """按顺序加载数据集图片"""
+    frames = []
+    for split in splits:
+        source = ImageDirectorySource(os.path.join(DATASET_ROOT, split), logger,
+                                      replay_mode='fast')
+        if not source.open():
+            continue
+        while True:
+            success, frame = source.read()
+            if not success:
+                break
+            frames.append(frame)
+        source.release()
+    if limit > 0:
+        frames = frames[:limit]
+    return frames
+
+
+def run_benchmark(config: Config, frames: List[np.ndarray], logger: Logger,
+                  warmup: int = 5, stub_latency: float = 0.0, use_api: bool = False,
+                  log_every: int = 0) -> dict:
+    """逐帧驱动检测、覆盖层绘制和分析编码路径
+    
+    log_every大于0时每隔若干帧记录一条日志并统计 log 阶段耗时，用于确认日志不会引起循环抖动。
+    use_api为True时分析器使用真实OpenAI客户端访问config.base_url (如本地模拟服务)，
+    包含重试和熔断逻辑；否则使用进程内桩客户端。
+    """
+    # 检测器内部按预处理/推理/后处理细分计时
+    tracer = StageTracer()
+    detector = YOLODetector(config, logger, tracer)
+    display_manager = DisplayManager(config)
+    analyzer = QwenAnalyzer(config, logger, client=None if use_api else StubQwenClient(stub_latency))
+    analyze_stage = 'analyze_api' if use_api else 'analyze_stub'
+    
+    timer = StageTimer()
+    payload_sizes: List[int] = []
+    
+    # 预热，排除模型首次推理的初始化开销
+    for frame in frames[:warmup]:
+        detector.detect(frame.copy())
+    
+    tracer.reset()
+    start_time = time.perf_counter()
+    batch_size = max(1, config.batch_size)
+    for start in range(0, len(frames), batch_size):
+        batch = [frame.copy() for frame in frames[start:start + batch_size]]
+        batch_start = time.perf_counter()
+        
+        t0 = time.perf_counter()
+        if batch_size == 1:
+            outputs = [detector.detect(batch[0])]
+        else:
+            outputs = detector.detect_batch(batch)
+        # 批量推理按帧均摊耗时
+        per_frame = (time.perf_counter() - t0) / len(batch)
+        for _ in batch:
+            timer.record('detect', per_frame)
+        
+        for processed_frame, detection_info in outputs:
+            t0 = time.perf_counter()
+            display_manager.draw_info_overlay(processed_frame, 0.0, detection_info, "", "", False)
+            timer.record('overlay', time.perf_counter() - t0)
+            
+            t0 = time.perf_counter()
+            payload = analyzer.payload_builder.build(processed_frame, detection_info)
+            timer.record('encode', time.perf_counter() - t0)
+            payload_sizes.append(payload.size)
+            
+            if log_every > 0 and len(payload_sizes) % log_every == 0:
+                t0 = time.perf_counter()
+                summary = detection_info.get_summary_text().replace("\n", ", ") if detection_info else "未检测到铁屑"
+                logger.info(f"第{len(payload_sizes)}帧: {summary}")
+                timer.record('log', time.perf_counter() - t0)
+            
+            if detection_info is not None and not detection_info.is_empty():
+                t0 = time.perf_counter()
+                analyzer._analyze_frame_with_qwen(processed_frame, detection_info)
+                timer.record(analyze_stage, time.perf_counter() - t0)
+        
+        per_frame = (time.perf_counter() - batch_start) / len(batch)
+        for _ in batch:
+            timer.record('end_to_end', per_frame)
+    total_time = time.perf_counter() - start_time
+    
+    return {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'model_path': config.model_path,
+            'image_size': config.image_size,
+            'conf_threshold': config.conf_threshold,
+            'device': config.device or 'auto',
+            'backend': config.inference_backend,
+            'threads': config.inference_threads,
+            'quantization': config.quantization,
+            'batch_size': config.batch_size,
+            'api': 'mock_server' if use_api else 'stub',
+            'payload_format': config.payload_format,
+            'payload_max_side': config.payload_max_side,
+            'payload_max_bytes': config.payload_max_bytes,
+            'log_every': log_every,
+            'log_json': config.log_json,
+            'frames': len(frames),
+            'warmup': warmup
+        },
+        'stages': timer.summarize(),
+        'detector_stages': tracer.get_stats(),
+        'payload_kb_mean': round(float(np.mean(payload_sizes)) / 1024, 1) if payload_sizes else 0.0,
+        'analysis': analyzer.get_stats(),
+        'throughput_fps': round(len(frames) / total_time, 2) if total_time > 0 else 0.0,
+        'peak_rss_mb': round(get_peak_rss_mb(), 1)
+    }
+
+
+def compare_results(current: dict, baseline: dict) -> List[str]:
+    """对比两次结果，输出各阶段p50/p95变化"""
+    lines = []
+    for stage, stats in current['stages'].items():
+        base = baseline.get('stages', {}).get(stage)
+        if not base:
+            continue
+        for key in ('p50_ms', 'p95_ms'):
+            if base[key] > 0:
+                change = (stats[key] - base[key]) / base[key] * 100
+                lines.append(f"{stage}.{key}: {base[key]:.2f} -> {stats[key]:.2f} ({change:+.1f}%)")
+    lines.append(f"throughput_fps: {baseline.get('throughput_fps', 0)} -> {current['throughput_fps']}")
+    return lines
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="实时检测流水线离线基准测试")
+    parser.add_argument("--model", default=Config.model_path, help="YOLO模型路径")
+    parser.add_argument("--splits", nargs="+", default=DEFAULT_SPLITS, help="数据集划分")
+    parser.add_argument("--image-size", type=int, default=Config.image_size)
+    parser.add_argument("--device", default="cpu", help="推理设备，默认CPU")
+    parser.add_argument("--backend", default="pytorch", choices=["pytorch", "onnx", "openvino"],
+                        help="推理后端")
+    parser.add_argument("--threads", type=int, default=0, help="推理线程数，0表示自动")
+    parser.add_argument("--quantization", default="none", choices=["none", "fp16", "int8"])
+    parser.add_argument("--batch-size", type=int, default=1, help="批量检测的帧数")
+    parser.add_argument("--payload-format", default="jpeg", choices=["jpeg", "webp", "auto"],
+                        help="VLM图像载荷编码格式")
+    parser.add_argument("--payload-max-side", type=int, default=0, help="载荷最大长边，0表示不缩放")
+    parser.add_argument("--payload-max-bytes", type=int, default=0, help="载荷字节预算，0表示不限制")
+    parser.add_argument("--limit", type=int, default=0, help="最多测试的帧数，0表示全部")
+    parser.add_argument("--warmup", type=int, default=5, help="预热帧数")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="桩API模拟延迟(秒)")
+    parser.add_argument("--mock-server", action="store_true",
+                        help="启动本地模拟Qwen服务，经由真实客户端、重试和熔断路径调用")
+    parser.add_argument("--mock-latency", type=float, default=0.2, help="模拟服务响应延迟(秒)")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0, help="模拟服务错误率")
+    parser.add_argument("--stream", action="store_true", help="流式接收分析结果 (需配合--mock-server)")
+    parser.add_argument("--log-every", type=int, default=0, help="每隔N帧记录一条日志并统计日志耗时，0表示不记录")
+    parser.add_argument("--log-json", action="store_true", help="以JSON Lines格式输出日志")
+    parser.add_argument("--output", default="bench_results.json", help="JSON结果输出路径")
+    parser.add_argument("--baseline", default="", help="用于对比的历史JSON结果")
+    args = parser.parse_args()
+    if args.stream and not args.mock_server:
+        # 进程内桩客户端只返回完整响应，不支持流式
+        parser.error("--stream 需要配合 --mock-server 使用")
+    return args
+
+
+def main():
+    """基准测试入口"""
+    args = parse_args()
+    config = Config(model_path=args.model, image_size=args.image_size, device=args.device,
+                    batch_size=args.batch_size, inference_backend=args.backend,
+                    inference_threads=args.threads, quantization=args.quantization,
+                    payload_format=args.payload_format, payload_max_side=args.payload_max_side,
+                    payload_max_bytes=args.payload_max_bytes, stream_analysis=args.stream,
+                    log_json=args.log_json)
+    logger = Logger.from_config(config, "benchmark.log")
+    
+    frames = load_frames(args.splits, logger, args.limit)
+    if not frames:
+        logger.error("未加载到任何测试图片")
+        return
+    logger.info(f"已加载 {len(frames)} 帧 ({', '.join(args.splits)})")
+    
+    mock_server = None
+    if args.mock_server:
+        mock_server = MockQwenServer(latency=args.mock_latency, error_rate=args.mock_error_rate).start()
+        config.base_url = mock_server.base_url
+        config.api_key = config.api_key or "mock"
+        logger.info(f"本地模拟Qwen服务: {config.base_url}")
+    
+    try:
+        results = run_benchmark(config, frames, logger, args.warmup, args.stub_latency,
+                                use_api=mock_server is not None, log_every=args.log_every)
+    finally:
+        if mock_server is not None:
+            mock_server.stop()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    
+    for stage, stats in results['stages'].items():
+        logger.info(f"{stage}: p50={stats['p50_ms']:.2f}ms p95={stats['p95_ms']:.2f}ms "
+                    f"p99={stats['p99_ms']:.2f}ms fps={stats['fps']:.1f}")
+    logger.info(f"吞吐量: {results['throughput_fps']:.2f} FPS, 峰值内存: {results['peak_rss_mb']:.1f} MB")
+    logger.info(f"结果已写入 {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        logger.info("=== 与基线对比 ===")
+        for line in compare_results(results, baseline):
+            logger.info(line)
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,9 @@
 配置管理模块
 """
 from dataclasses import dataclass
+from typing import Optional, Tuple
 import os
+import sys
 
 @dataclass
 class Config:
@@ -11,16 +13,123 @@ class Config:
     model_path: str = "your_model_path/yolo_model.pt"
     image_size: int = 640
     conf_threshold: float = 0.3
+    device: str = ""  # 推理设备，如 "cpu"、"0"，为空时自动选择
+    batch_size: int = 1  # 批量检测时单次前向推理的最大帧数
+    nms_iou_threshold: float = 0.7
+    inference_backend: str = "pytorch"  # pytorch / onnx / openvino
+    inference_threads: int = 0  # 推理线程数，0表示由运行时决定
+    quantization: str = "none"  # none / fp16 (openvino) / int8 (onnx为动态量化，openvino为静态量化)
+    calibration_data: str = ""  # OpenVINO INT8量化校准数据集yaml
+    
+    # ROI与分块推理配置 (高分辨率画面中的小铁屑)
+    roi: Optional[Tuple[int, int, int, int]] = None  # 感兴趣区域 (x1, y1, x2, y2)，像素坐标
+    tile_inference: bool = False
+    tile_size: int = 640
+    tile_overlap: float = 0.2
+    tile_include_full_frame: bool = True  # 分块之外再做一次整幅推理
+    tile_merge_threshold: float = 0.6  # 跨块合并的IoS阈值
+    
+    # 画面变化门控配置 (静止画面复用上一次检测结果)
+    motion_gating: bool = False
+    motion_method: str = "diff"  # diff: 缩略图灰度差分, phash: 感知哈希
+    motion_threshold: float = 4.0  # diff模式下的平均灰度差阈值
+    motion_hash_distance: int = 4  # phash模式下的汉明距离阈值
+    motion_downscale: int = 64  # 差分缩略图宽度
+    motion_refresh_interval: int = 30  # 最多连续跳过的帧数，超过后强制推理
+    
+    # 跟踪配置
+    tracking_enabled: bool = False
+    detection_stride: int = 1  # 每K帧检测一次，中间帧由跟踪器外推 (未开启跟踪时复用上次结果)
+    track_iou_threshold: float = 0.3
+    track_high_threshold: float = 0.5  # 高于此置信度的检测优先匹配并可创建新轨迹
+    track_min_hits: int = 3  # 连续匹配多少次后确认轨迹
+    track_max_age: int = 30  # 轨迹未匹配超过此帧数后删除
+    track_hold_frames: int = 2  # 已确认轨迹漏检后继续输出的帧数
     
     # 摄像头配置
     camera_index: int = 0
+    source_type: str = "camera"  # camera / video / images / stream
+    source_path: str = ""  # 视频文件路径、图片目录(如 data/images/test)或流地址
+    replay_mode: str = "realtime"  # realtime: 按录制帧率回放, fast: 全速回放
+    replay_fps: float = 0.0  # 回放帧率，0表示使用录制帧率(图片目录默认30)
+    replay_loop: bool = False
+    source_preload: bool = False  # 图片目录预解码到内存
     display_scale: float = 0.8
+    display_mode: str = "window"  # window: cv2.imshow窗口, headless: 无界面，HTTP提供MJPEG预览
+    preview_host: str = "127.0.0.1"  # 预览和录像接口无鉴权，需远程访问时再改为 "0.0.0.0"
+    preview_port: int = 8080
+    preview_jpeg_quality: int = 70
+    preview_max_fps: float = 15.0  # 预览流最大帧率，0表示不限制
+    render_thread: Optional[bool] = None  # 在独立线程中绘制和显示，None表示自动 (macOS窗口模式下关闭)
+    threaded_capture: bool = False
+    capture_buffer_size: int = 3
+    pipeline_mode: str = "thread"  # thread: 单进程, process: 采集/检测/渲染分析分进程，共享内存传帧
+    pipeline_slots: int = 4  # 共享内存帧槽位数，决定各阶段间可排队的帧数
+    
+    # 事件录像配置 (触发时保存触发前后若干秒的画面)
+    record_enabled: bool = False
+    record_dir: str = "recordings"
+    record_pre_seconds: float = 5.0  # 预录时长
+    record_post_seconds: float = 5.0  # 最后一次触发后继续录制的时长
+    record_max_clip_seconds: float = 60.0  # 连续触发时单个录像的最长时长 (不含预录)
+    record_max_side: int = 640  # 录像帧最大长边，0表示不缩放
+    record_jpeg_quality: int = 75  # 预录缓冲中的JPEG压缩质量
+    record_buffer_max_mb: float = 64.0  # 预录缓冲和待写帧的内存上限
+    record_queue_size: int = 8  # 待压缩帧队列长度，满时丢帧而不阻塞主循环
+    record_bad_threshold: int = 0  # 单帧bad数量达到此值时触发，0表示关闭
+    record_keywords: Tuple[str, ...] = ()  # 分析结果中出现任一关键词时触发
+    
+    # 持久化存储配置 (逐帧类别计数和分析结果写入SQLite)
+    store_enabled: bool = False
+    store_path: str = "data/detections.db"
+    store_camera_id: str = ""  # 多摄像头共用数据库时的来源标识，为空时按帧源生成
+    store_batch_size: int = 500  # 单个事务最多写入的行数
+    store_flush_interval: float = 1.0  # 最长攒批时间(秒)
+    store_queue_size: int = 10000  # 待写队列长度，满时丢弃并计数
     
     # 分析配置
     analysis_interval: int = 10
-    jpeg_quality: int = 80
+    analysis_trigger: str = "timer"  # timer: 按analysis_interval定时, event: bad占比显著变化时触发
+    analysis_min_interval: float = 5.0  # event模式下两次分析的最小间隔(秒)
+    analysis_urgent_min_interval: float = 2.0  # bad占比上升时的最小间隔(秒)
+    analysis_max_interval: float = 60.0  # 超过此间隔无触发时补发一次分析(秒)
+    trigger_ewma_alpha: float = 0.02  # bad占比基线的EWMA系数
+    trigger_cusum_k: float = 0.5  # CUSUM容许偏差 (以标准差为单位)
+    trigger_cusum_h: float = 5.0  # CUSUM报警阈值
+    trigger_min_std: float = 0.05  # 标准化时的最小标准差，避免静止画面下过于敏感
+    trigger_warmup_frames: int = 30  # 建立基线所需的帧数
+    jpeg_quality: int = 80  # 编码初始质量，超出字节预算时逐步降低
+    payload_raw_frame: bool = False  # 上传未绘制检测框的原始画面
+    payload_crop: bool = False  # 裁剪到所有检测框的外接矩形
+    payload_crop_margin: float = 0.15  # 裁剪留边，占外接矩形长边的比例
+    payload_max_side: int = 0  # 上传图像最大长边，0表示不缩放
+    payload_mosaic_top_k: int = 0  # >0时将置信度最高的K个检测框拼图上传
+    payload_mosaic_tile: int = 224
+    payload_format: str = "jpeg"  # jpeg / webp / auto (取较小者)
+    payload_max_bytes: int = 0  # 编码后字节预算，0表示不限制
     max_tokens: int = 100
     temperature: float = 0.5
+    stream_analysis: bool = False  # 流式接收分析结果，显示文本逐token更新
+    analyzer_mode: str = "thread"  # thread: 单请求工作线程, async: asyncio并发请求池
+    max_concurrent_requests: int = 4  # async模式下最多同时在途的请求数
+    request_timeout: float = 30.0  # 单次API调用超时(秒)
+    request_deadline: float = 60.0  # 含重试在内的单个分析请求总截止时间(秒)
+    api_max_retries: int = 2  # 超时、连接错误、429和5xx的最大重试次数
+    api_backoff_base: float = 0.5  # 指数退避基准等待(秒)，实际等待在[0, base*2^n]内随机
+    api_backoff_max: float = 8.0
+    breaker_failure_threshold: int = 5  # 连续失败多少次后熔断
+    breaker_reset_timeout: float = 30.0  # 熔断持续时间(秒)，之后放行一次试探调用
+    temporal_analysis: bool = False  # 多帧时序分析: 关键帧 + 分段计数摘要合并为一次请求
+    history_length: int = 1800  # 计数历史的最大帧数
+    temporal_sample_interval: int = 15  # 每N帧保存一张缩略帧作为关键帧候选
+    temporal_frame_slots: int = 16  # 最多保留的缩略帧数
+    temporal_keyframe_side: int = 480  # 缩略帧最大长边
+    temporal_keyframes: int = 3  # 每次请求附带的历史关键帧数
+    temporal_segments: int = 6  # 时序摘要的分段数
+    analysis_cache_enabled: bool = False  # 类别计数一致且画面相似时复用上次分析结果
+    analysis_cache_ttl: float = 60.0  # 缓存条目有效期(秒)
+    analysis_cache_size: int = 64
+    analysis_cache_hash_distance: int = 6  # 画面dHash汉明距离阈值
     
     # API配置
     api_key: str = os.getenv("QWEN_API_KEY")
@@ -30,11 +139,39 @@ class Config:
     # 日志配置
     log_level: str = "INFO"
     log_file: str = "detection_log.log"
+    log_json: bool = False  # 以JSON Lines格式输出日志
+    log_rotation: str = "none"  # none / size: 按大小轮转 / time: 按时间轮转
+    log_max_bytes: int = 10 * 1024 * 1024
+    log_backup_count: int = 5
+    log_rotate_when: str = "midnight"  # 按时间轮转的周期，同TimedRotatingFileHandler的when
+    log_rate_limit_interval: float = 10.0  # 同类重复日志 (读帧失败、性能警告等) 的最小输出间隔(秒)
     
     # 性能监控配置
     performance_window_size: int = 30
+    stage_tracing: bool = True  # 统计采集/推理/绘制/编码/API等各阶段耗时分位数
+    metrics_enabled: bool = False  # 在 http://metrics_host:metrics_port/metrics 提供Prometheus指标
+    metrics_host: str = "0.0.0.0"
+    metrics_port: int = 9108
     fps_warning_threshold: float = 10.0
     
+    # 自适应降级配置 (按p95帧耗时调整image_size、detection_stride和检测框绘制)
+    adaptive_enabled: bool = False
+    target_frame_time: float = 0.066  # 目标帧耗时(秒)，分辨率档位按p95、检测间隔和绘制档位按平均值判断
+    adaptive_min_image_size: int = 320
+    adaptive_max_stride: int = 4
+    adaptive_recover_ratio: float = 0.7  # p95低于目标的该比例时回升一档
+    adaptive_cooldown_windows: int = 2  # 每次调整后冷却的统计窗口数
+    draw_detections: bool = True
+    
+    def use_render_thread(self) -> bool:
+        """是否启用独立渲染线程，render_thread为None时macOS窗口模式关闭 (cv2窗口只能在主线程显示)，其余情况开启"""
+        if self.render_thread is None:
+            return not self._main_thread_display()
+        return self.render_thread
+    
+    def _main_thread_display(self) -> bool:
+        return sys.platform == "darwin" and self.display_mode == "window"
+    
     def validate(self) -> bool:
         """验证配置参数的有效性"""
         if not os.path.exists(self.model_path):
@@ -43,6 +180,98 @@ class Config:
         if self.analysis_interval <= 0:
             raise ValueError("分析间隔必须大于0")
         
+        if self.inference_backend not in ("pytorch", "onnx", "openvino"):
+            raise ValueError(f"不支持的推理后端: {self.inference_backend}")
+        
+        if self.quantization not in ("none", "fp16", "int8"):
+            raise ValueError(f"不支持的量化方式: {self.quantization}")
+        
+        if self.inference_backend == "onnx" and self.quantization == "fp16":
+            raise ValueError("ONNX Runtime CPU后端不支持FP16量化，请使用none/int8或openvino后端")
+        
+        if self.roi is not None and (len(self.roi) != 4 or self.roi[2] <= self.roi[0] or self.roi[3] <= self.roi[1]):
+            raise ValueError(f"感兴趣区域无效: {self.roi}")
+        
+        if not 0 <= self.tile_overlap < 1:
+            raise ValueError("分块重叠比例必须在[0, 1)之间")
+        
+        if self.motion_method not in ("diff", "phash"):
+            raise ValueError(f"不支持的变化检测方式: {self.motion_method}")
+        
+        if self.detection_stride < 1:
+            raise ValueError("检测间隔必须大于0")
+        
+        if not 0 < self.adaptive_recover_ratio < 1:
+            raise ValueError("自适应回升比例必须在(0, 1)之间")
+        
+        if self.batch_size < 1:
+            raise ValueError("批量大小必须大于0")
+        
+        if self.source_type not in ("camera", "video", "images", "stream"):
+            raise ValueError(f"不支持的帧源类型: {self.source_type}")
+        
+        if self.source_type != "camera" and not self.source_path:
+            raise ValueError("文件、目录或流帧源必须指定source_path")
+        
+        if self.replay_mode not in ("realtime", "fast"):
+            raise ValueError(f"不支持的回放模式: {self.replay_mode}")
+        
+        if self.display_mode not in ("window", "headless"):
+            raise ValueError(f"不支持的显示模式: {self.display_mode}")
+        
+        if self.render_thread and self._main_thread_display():
+            raise ValueError("macOS窗口模式只能在主线程显示，不能启用render_thread")
+        
+        if self.capture_buffer_size < 3:
+            raise ValueError("采集缓冲区大小不能小于3")
+        
+        if self.log_rotation not in ("none", "size", "time"):
+            raise ValueError(f"不支持的日志轮转方式: {self.log_rotation}")
+        
+        if self.pipeline_mode not in ("thread", "process"):
+            raise ValueError(f"不支持的流水线模式: {self.pipeline_mode}")
+        
+        if self.pipeline_slots < 3:
+            raise ValueError("共享内存槽位数不能小于3")
+        
+        if self.record_pre_seconds < 0 or self.record_post_seconds <= 0 \
+                or self.record_max_clip_seconds < self.record_post_seconds:
+            raise ValueError("录像时长需满足 预录 >= 0, 0 < 后录 <= 单个录像最长时长")
+        
+        if self.record_buffer_max_mb <= 0 or self.record_queue_size < 1:
+            raise ValueError("录像内存上限和队列长度必须大于0")
+        
+        if self.store_batch_size < 1 or self.store_queue_size < 1 or self.store_flush_interval <= 0:
+            raise ValueError("持久化批量大小、队列长度和攒批时间必须大于0")
+        
+        if self.analysis_trigger not in ("timer", "event"):
+            raise ValueError(f"不支持的分析触发方式: {self.analysis_trigger}")
+        
+        if not 0 < self.analysis_urgent_min_interval <= self.analysis_min_interval <= self.analysis_max_interval:
+            raise ValueError("分析间隔需满足 0 < 紧急最小间隔 <= 最小间隔 <= 最大间隔")
+        
+        if self.analyzer_mode not in ("thread", "async"):
+            raise ValueError(f"不支持的分析器模式: {self.analyzer_mode}")
+        
+        if self.max_concurrent_requests < 1:
+            raise ValueError("最大并发请求数必须大于0")
+        
+        if self.request_timeout <= 0 or self.request_deadline <= 0:
+            raise ValueError("请求超时和截止时间必须大于0")
+        
+        if self.api_max_retries < 0 or self.breaker_failure_threshold < 1:
+            raise ValueError("重试次数不能为负，熔断失败阈值必须大于0")
+        
+        if self.payload_format not in ("jpeg", "webp", "auto"):
+            raise ValueError(f"不支持的图像编码格式: {self.payload_format}")
+        
+        if min(self.history_length, self.temporal_sample_interval, self.temporal_frame_slots,
+               self.temporal_segments) < 1:
+            raise ValueError("时序分析历史长度、采样间隔、缩略帧数和分段数必须大于0")
+        
+        if self.analysis_cache_ttl <= 0 or self.analysis_cache_size < 1:
+            raise ValueError("分析缓存有效期和容量必须大于0")
+        
         if not self.api_key:
             raise ValueError("API密钥不能为空")
         
@@ -1,6 +1,20 @@
 from .detector import YOLODetector
 from .analyzer import QwenAnalyzer
+from .async_analyzer import AsyncQwenAnalyzer
 from .camera import CameraManager
 from .display import DisplayManager
+from .preview_server import PreviewServer
+from .renderer import RenderThread
+from .recorder import ClipRecorder
+from .store import DetectionStore
+from .capture import FrameRingBuffer, CaptureThread
+from .shared_ring import SharedFrameRing
+from .pipeline import ProcessPipeline
+from .sources import (FrameSource, CameraSource, VideoFileSource, ImageDirectorySource,
+                      StreamSource, create_frame_source)
 
-__all__ = ['YOLODetector', 'QwenAnalyzer', 'CameraManager', 'DisplayManager']
+__all__ = ['YOLODetector', 'QwenAnalyzer', 'AsyncQwenAnalyzer', 'CameraManager', 'DisplayManager',
+           'PreviewServer', 'RenderThread', 'ClipRecorder', 'DetectionStore', 'FrameRingBuffer', 'CaptureThread',
+           'SharedFrameRing', 'ProcessPipeline',
+           'FrameSource', 'CameraSource', 'VideoFileSource', 'ImageDirectorySource',
+           'StreamSource', 'create_frame_source']
@@ -0,0 +1,81 @@
+"""
+分析结果缓存模块 - 按类别计数和感知哈希复用近似场景的分析结果
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+import numpy as np
+from models.data_models import DetectionInfo
+from utils.image_hash import dhash, hamming_distance
+from config.config import Config
+
+CacheKey = Tuple[Tuple[Tuple[str, int], ...], int]
+
+class AnalysisCache:
+    """带TTL和LRU淘汰的分析结果缓存
+    
+    类别计数完全一致且画面哈希的汉明距离不超过阈值时视为同一场景。
+    """
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.entries: "OrderedDict[CacheKey, Tuple[str, float]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def make_key(self, frame: np.ndarray, detection_info: DetectionInfo) -> CacheKey:
+        """生成缓存键: (按类别名排序的计数直方图, 画面dHash)"""
+        histogram = tuple(sorted(detection_info.counts.items()))
+        return histogram, dhash(frame)
+    
+    def get(self, key: CacheKey) -> Optional[str]:
+        """查询缓存，命中时返回分析文本"""
+        histogram, frame_hash = key
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            # 从最近使用的条目开始查找
+            for entry_key in reversed(self.entries):
+                entry_histogram, entry_hash = entry_key
+                if entry_histogram == histogram and \
+                        hamming_distance(entry_hash, frame_hash) <= self.config.analysis_cache_hash_distance:
+                    self.entries.move_to_end(entry_key)
+                    self.hits += 1
+                    return self.entries[entry_key][0]
+            self.misses += 1
+            return None
+    
+    def put(self, key: CacheKey, text: str):
+        """写入分析结果，超出容量时淘汰最久未使用的条目"""
+        with self.lock:
+            self.entries[key] = (text, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.config.analysis_cache_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+    
+    def _expire(self, now: float):
+        expired = [key for key, (_, stored_at) in self.entries.items()
+                   if now - stored_at > self.config.analysis_cache_ttl]
+        for key in expired:
+            del self.entries[key]
+    
+    def clear(self):
+        """清空缓存"""
+        with self.lock:
+            self.entries.clear()
+    
+    def get_stats(self) -> dict:
+        """获取缓存统计"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'cache_hits': self.hits,
+                'cache_misses': self.misses,
+                'cache_hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'cache_size': len(self.entries),
+                'cache_evictions': self.evictions
+            }
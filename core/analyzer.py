@@ -3,36 +3,70 @@ Qwen分析器模块
 """
 import threading
 import time
-import base64
+from collections import deque
 from queue import Queue, Empty
-import cv2
 import numpy as np
 from openai import OpenAI
-from typing import Optional
-from models.data_models import DetectionInfo, AnalysisResult
+from typing import Callable, Deque, List, Optional, Tuple
+from models.data_models import DetectionInfo, AnalysisResult, ImagePayload, TemporalSnapshot
+from core.analysis_cache import AnalysisCache, CacheKey
+from core.payload import PayloadBuilder
+from core.history import DetectionHistory
 from utils.logger import Logger
+from utils.resilience import RetryPolicy, CircuitBreaker, CircuitOpenError, is_retryable_error
+from utils.performance import NULL_TRACER, StageTracer
 from config.config import Config
 
+API_ERROR_PREFIX = "API调用失败"
+
 class QwenAnalyzer:
     """Qwen分析器类"""
     
-    def __init__(self, config: Config, logger: Logger):
+    def __init__(self, config: Config, logger: Logger, client=None, tracer: Optional[StageTracer] = None):
         self.config = config
         self.logger = logger
+        self.tracer = tracer if tracer is not None else NULL_TRACER
         self.analysis_queue = Queue(maxsize=1)
         self.current_analysis = "等待分析..."
+        # 流式模式下工作线程逐token更新current_analysis，显示线程并发读取
+        self.analysis_lock = threading.Lock()
         self.is_analyzing = False
         self.worker_thread = None
         self.stop_thread = False
-        self.client = self._init_client()
+        # 允许注入兼容OpenAI接口的客户端 (如基准测试中的桩客户端)
+        self.client = client if client is not None else self._init_client()
         self.analysis_count = 0
+        # 请求编号 (含缓存命中)，结果按编号顺序发布
+        self.next_request_id = 0
+        self.failed_count = 0
+        # 已完成的分析结果，由 pop_results 取走 (如写入持久化存储)
+        self.results: Deque[AnalysisResult] = deque(maxlen=100)
+        self.latest_result: Optional[AnalysisResult] = None
+        self.history = DetectionHistory(config) if config.temporal_analysis else None
+        if config.analysis_cache_enabled and self.history is not None:
+            # 时序分析的结果依赖历史趋势，不能按单帧复用
+            self.logger.warning("时序分析模式下不启用分析缓存")
+        self.cache = AnalysisCache(config) if config.analysis_cache_enabled and self.history is None else None
+        self.payload_builder = PayloadBuilder(config, logger)
+        self.last_payloads: List[ImagePayload] = []
+        self.retry_policy = RetryPolicy(config.api_max_retries, config.api_backoff_base, config.api_backoff_max)
+        self.breaker = CircuitBreaker(config.breaker_failure_threshold, config.breaker_reset_timeout)
+        self.retry_count = 0
+        self.last_ttft: Optional[float] = None
+        self.latency_count = 0
+        self.latency_total = 0.0
+        self.ttft_count = 0
+        self.ttft_total = 0.0
         
     def _init_client(self) -> OpenAI:
         """初始化OpenAI客户端"""
         try:
+            # 重试由分析器统一处理，关闭客户端自带的重试
             client = OpenAI(
                 api_key=self.config.api_key,
                 base_url=self.config.base_url,
+                timeout=self.config.request_timeout,
+                max_retries=0
             )
             self.logger.info("Qwen客户端初始化成功")
             return client
@@ -54,9 +88,13 @@ class QwenAnalyzer:
         
         while not self.stop_thread:
             try:
-                frame, detection_info = self.analysis_queue.get(timeout=1)
-                if frame is not None and detection_info is not None:
-                    self._process_analysis(frame, detection_info)
+                frame, detection_info, submitted_at, cache_key, temporal, cached = self.analysis_queue.get(timeout=1)
+                if cached is not None:
+                    # 缓存命中同样经工作线程按提交顺序发布，不会被更早的请求结果覆盖
+                    self.next_request_id += 1
+                    self._publish_result(self._cached_result(self.next_request_id, cached, submitted_at))
+                elif frame is not None and detection_info is not None:
+                    self._process_analysis(frame, detection_info, submitted_at, cache_key, temporal)
                 self.analysis_queue.task_done()
             except Empty:
                 continue
@@ -66,62 +104,189 @@ class QwenAnalyzer:
         
         self.logger.info("Qwen工作线程已停止")
                 
-    def _process_analysis(self, frame: np.ndarray, detection_info: DetectionInfo):
+    def _process_analysis(self, frame: np.ndarray, detection_info: DetectionInfo, submitted_at: float,
+                          cache_key: Optional[CacheKey] = None,
+                          temporal: Optional[TemporalSnapshot] = None):
         """处理单个分析任务"""
+        self.is_analyzing = True
+        self.analysis_count += 1
+        self.next_request_id += 1
+        request_id = self.next_request_id
+        start_time = time.time()
         try:
-            self.is_analyzing = True
-            self.analysis_count += 1
-            self.logger.info(f"开始第{self.analysis_count}次分析...")
+            self.logger.info(f"开始第{request_id}次分析...")
             
-            start_time = time.time()
-            result = self._analyze_frame_with_qwen(frame, detection_info)
+            text = self._analyze_frame_with_qwen(frame, detection_info, temporal)
             analysis_time = time.time() - start_time
+            success = not text.startswith(API_ERROR_PREFIX)
+            result = AnalysisResult(
+                text=text,
+                timestamp=time.time(),
+                success=success,
+                error_msg="" if success else text[len(API_ERROR_PREFIX):].lstrip(": "),
+                request_id=request_id,
+                submitted_at=submitted_at,
+                latency=analysis_time,
+                ttft=self.last_ttft or 0.0,
+                payload_bytes=sum(payload.size for payload in self.last_payloads),
+                encode_time=sum(payload.encode_time for payload in self.last_payloads)
+            )
             
-            self.current_analysis = result
-            self.logger.info(f"分析完成 (耗时: {analysis_time:.2f}s): {result}")
+            self._publish_result(result)
+            self._record_latency(analysis_time, self.last_ttft)
+            payload_info = ""
+            if self.last_payloads:
+                payload_info = (f", 载荷: {len(self.last_payloads)}张 {result.payload_bytes / 1024:.1f}KB, "
+                                f"编码: {result.encode_time * 1000:.1f}ms")
+            ttft_info = f", 首token: {self.last_ttft:.2f}s" if self.last_ttft is not None else ""
+            self.logger.info(f"分析完成 (耗时: {analysis_time:.2f}s{ttft_info}{payload_info}): {text}")
+            if not success:
+                self.failed_count += 1
+            elif cache_key is not None:
+                self.cache.put(cache_key, text)
             
         except Exception as e:
+            self.failed_count += 1
             self.logger.error(f"分析过程异常: {e}")
-            self.current_analysis = "分析失败"
+            self._publish_result(AnalysisResult(
+                text="分析失败", timestamp=time.time(), success=False, error_msg=str(e),
+                request_id=request_id, submitted_at=submitted_at, latency=time.time() - start_time
+            ))
         finally:
             self.is_analyzing = False
             
-    def _analyze_frame_with_qwen(self, frame: np.ndarray, detection_info: DetectionInfo) -> str:
+    def _analyze_frame_with_qwen(self, frame: np.ndarray, detection_info: DetectionInfo,
+                                 temporal: Optional[TemporalSnapshot] = None) -> str:
         """调用Qwen API进行分析"""
+        self.last_payloads = []
+        self.last_ttft = None
         if detection_info.is_empty():
             return "未检测到铁屑"
         
         try:
-            # 图像编码优化
-            encode_param = [cv2.IMWRITE_JPEG_QUALITY, self.config.jpeg_quality]
-            success, buffer = cv2.imencode('.jpg', frame, encode_param)
-            
-            if not success:
-                raise Exception("图像编码失败")
-            
-            base64_image = base64.b64encode(buffer).decode('utf-8')
-            prompt = self._build_prompt(detection_info)
+            payloads, prompt = self._prepare_request(frame, detection_info, temporal)
+            self.last_payloads = payloads
             
             # 调用API
-            response = self.client.chat.completions.create(
-                model=self.config.model_name,
-                messages=[{
-                    "role": "user", 
-                    "content": [
-                        {"type": "image_url", 
-                         "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}},
-                        {"type": "text", "text": prompt}
-                    ]
-                }],
-                temperature=self.config.temperature,
-                max_tokens=self.config.max_tokens
-            )
+            request = self._build_request(payloads, prompt)
+            with self.tracer.span('api'):
+                if self.config.stream_analysis:
+                    return self._stream_completion(request).strip()
+                response = self._call_api(request)
             
             return response.choices[0].message.content.strip()
             
         except Exception as e:
-            self.logger.error(f"Qwen API调用失败: {e}")
-            return f"API调用失败: {str(e)}"
+            self.logger.error(f"Qwen API调用失败: {e}", key="api_error")
+            return f"{API_ERROR_PREFIX}: {str(e)}"
+    
+    def _call_api(self, request: dict, consume: Optional[Callable] = None,
+                  can_retry: Optional[Callable[[], bool]] = None):
+        """带重试、熔断和总截止时间的API调用
+        
+        consume(response, deadline) 在同一次尝试内处理响应 (如遍历流式响应)，其中的失败同样计入熔断和重试，
+        全部处理完成后才记为成功；can_retry 返回False时 (如已收到部分流式文本) 不再重试。
+        """
+        deadline = time.monotonic() + self.config.request_deadline
+        attempt = 0
+        while True:
+            if not self.breaker.allow_request():
+                raise CircuitOpenError("API熔断中，暂停调用")
+            timeout = max(0.001, min(self.config.request_timeout, deadline - time.monotonic()))
+            try:
+                response = self.client.chat.completions.create(**request, timeout=timeout)
+                if consume is not None:
+                    response = consume(response, deadline)
+            except Exception as e:
+                delay = self._on_api_error(e, attempt, deadline, can_retry is None or can_retry())
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return response
+    
+    def _stream_completion(self, request: dict) -> str:
+        """流式调用API，每收到一段文本即更新当前分析结果"""
+        start_time = time.perf_counter()
+        parts: List[str] = []
+        
+        def consume(stream, deadline: float) -> str:
+            for chunk in stream:
+                if time.monotonic() >= deadline:
+                    self._close_stream(stream)
+                    raise TimeoutError(f"流式响应超过截止时间 ({self.config.request_deadline:.1f}s)")
+                delta = self._chunk_text(chunk)
+                if not delta:
+                    continue
+                if not parts:
+                    self.last_ttft = time.perf_counter() - start_time
+                parts.append(delta)
+                self._set_current_analysis("".join(parts))
+            return "".join(parts)
+        
+        # 已收到部分文本后中断的流不再重试，避免重复输出
+        return self._call_api(dict(request, stream=True), consume, can_retry=lambda: not parts)
+    
+    @staticmethod
+    def _close_stream(stream):
+        close = getattr(stream, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                pass
+    
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        """提取流式响应片段中的增量文本"""
+        if not chunk.choices:
+            return ""
+        return chunk.choices[0].delta.content or ""
+    
+    def _on_api_error(self, error: Exception, attempt: int, deadline: float,
+                      retry: bool = True) -> Optional[float]:
+        """登记失败并计算重试等待时间，不再重试时返回None"""
+        if is_retryable_error(error):
+            self.breaker.record_failure()
+        else:
+            # 参数或鉴权错误说明服务可达，不计入熔断
+            self.breaker.record_success()
+        if not retry:
+            return None
+        delay = self.retry_policy.next_delay(attempt, error, deadline)
+        if delay is not None:
+            self.retry_count += 1
+            self.logger.warning(f"Qwen API调用失败，{delay:.2f}s后第{attempt + 1}次重试: {error}")
+        return delay
+    
+    def _prepare_request(self, frame: np.ndarray, detection_info: DetectionInfo,
+                         temporal: Optional[TemporalSnapshot] = None) -> Tuple[List[ImagePayload], str]:
+        """编码图像载荷并生成提示词，时序模式下关键帧在前、当前帧在后"""
+        if temporal is None:
+            payloads = [self.payload_builder.build(frame, detection_info)]
+            prompt = self._build_prompt(detection_info)
+        else:
+            payloads = [self.payload_builder.build(keyframe, None) for keyframe in temporal.keyframes]
+            payloads.append(self.payload_builder.build(frame, detection_info))
+            prompt = self._build_temporal_prompt(detection_info, temporal)
+        self.tracer.record('encode', sum(payload.encode_time for payload in payloads))
+        return payloads, prompt
+    
+    def _build_request(self, payloads: List[ImagePayload], prompt: str) -> dict:
+        """构建chat.completions请求参数"""
+        content = [{"type": "image_url", "image_url": {"url": payload.to_data_url()}} for payload in payloads]
+        content.append({"type": "text", "text": prompt})
+        return {
+            'model': self.config.model_name,
+            'messages': [{
+                "role": "user",
+                "content": content
+            }],
+            'temperature': self.config.temperature,
+            'max_tokens': self.config.max_tokens
+        }
     
     def _build_prompt(self, detection_info: DetectionInfo) -> str:
         """构建分析提示词"""
@@ -132,9 +297,47 @@ class QwenAnalyzer:
             "请用一句话简述刀头磨损状态。"
         )
     
+    def _build_temporal_prompt(self, detection_info: DetectionInfo, temporal: TemporalSnapshot) -> str:
+        """构建多帧时序分析提示词"""
+        now = time.time()
+        keyframe_text = "、".join(f"{t - now:.0f}s" for t in temporal.keyframe_times)
+        image_text = f"前{len(temporal.keyframes)}张为bad占比变化最大的历史关键帧 ({keyframe_text})，最后一张为当前帧。" \
+            if temporal.keyframes else "图像为当前帧。"
+        return (
+            "机床铁屑实时监控，铁屑分为bad, medium, good三类。"
+            f"{image_text}\n"
+            f"过去{temporal.duration:.0f}秒 ({temporal.frame_count}帧) 的分段统计：\n{temporal.summary}\n"
+            f"当前帧检测结果：\n{detection_info.get_summary_text()}\n"
+            "请结合变化趋势用一句话简述刀头磨损状态。"
+        )
+    
+    def record_frame(self, frame: np.ndarray, detection_info: Optional[DetectionInfo]):
+        """记录每帧检测计数，供时序分析使用"""
+        if self.history is not None:
+            self.history.append(frame, detection_info)
+    
+    def _lookup_cache(self, frame: np.ndarray, detection_info: DetectionInfo) -> Tuple[Optional[str], Optional[CacheKey]]:
+        """查询分析缓存，返回(命中的分析文本或None, 缓存键)"""
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.make_key(frame, detection_info)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            self.logger.info(f"命中分析缓存，跳过API调用: {cached}")
+        return cached, cache_key
+    
+    @staticmethod
+    def _cached_result(request_id: int, text: str, submitted_at: float) -> AnalysisResult:
+        """由缓存命中构造分析结果，与API结果走同一发布路径"""
+        return AnalysisResult(text=text, timestamp=time.time(), success=True, request_id=request_id,
+                              submitted_at=submitted_at, cached=True)
+    
     def add_analysis_task(self, frame: np.ndarray, detection_info: DetectionInfo) -> bool:
         """添加分析任务到队列"""
         try:
+            cached, cache_key = self._lookup_cache(frame, detection_info)
+            temporal = self.history.snapshot() if self.history is not None and cached is None else None
+            
             # 清空旧任务
             while not self.analysis_queue.empty():
                 try:
@@ -144,27 +347,83 @@ class QwenAnalyzer:
                     break
             
             # 添加新任务
-            self.analysis_queue.put((frame.copy(), detection_info), block=False)
+            task_frame = frame.copy() if cached is None else None
+            self.analysis_queue.put((task_frame, detection_info, time.time(), cache_key, temporal, cached), block=False)
             return True
         except Exception as e:
-            self.logger.warning(f"添加分析任务失败: {e}")
+            self.logger.warning(f"添加分析任务失败: {e}", key="analysis_submit")
             return False
     
+    def _set_current_analysis(self, text: str):
+        with self.analysis_lock:
+            self.current_analysis = text
+    
+    def _publish_result(self, result: AnalysisResult):
+        """发布一次完成的分析结果并更新当前显示文本"""
+        with self.analysis_lock:
+            self.results.append(result)
+            self.latest_result = result
+            self.current_analysis = result.text
+    
+    def _record_latency(self, latency: float, ttft: Optional[float] = None):
+        """累计总延迟和首token延迟"""
+        with self.analysis_lock:
+            self.latency_count += 1
+            self.latency_total += latency
+            if ttft is not None:
+                self.ttft_count += 1
+                self.ttft_total += ttft
+    
+    def _latency_stats(self) -> dict:
+        with self.analysis_lock:
+            stats = {
+                'avg_latency': round(self.latency_total / self.latency_count, 3) if self.latency_count else 0.0
+            }
+            if self.ttft_count:
+                stats['avg_ttft'] = round(self.ttft_total / self.ttft_count, 3)
+            return stats
+    
     def get_current_analysis(self) -> str:
-        """获取当前分析结果"""
-        return self.current_analysis
+        """获取当前分析结果 (流式模式下为已接收的部分文本)"""
+        with self.analysis_lock:
+            return self.current_analysis
+    
+    def get_latest_result(self) -> Optional[AnalysisResult]:
+        """获取最近完成的分析结果"""
+        return self.latest_result
+    
+    def pop_results(self) -> List[AnalysisResult]:
+        """取出已完成的分析结果"""
+        with self.analysis_lock:
+            results = list(self.results)
+            self.results.clear()
+        return results
     
     def is_busy(self) -> bool:
-        """检查是否正在分析"""
-        return self.is_analyzing
+        """检查是否正在分析，熔断期间同样视为忙以暂停提交"""
+        return self.is_analyzing or self.breaker.is_open()
+    
+    def get_queue_depth(self) -> int:
+        """排队和正在执行的分析任务数"""
+        return self.analysis_queue.qsize() + (1 if self.is_analyzing else 0)
     
     def get_stats(self) -> dict:
         """获取分析统计信息"""
-        return {
+        stats = {
             'total_analysis': self.analysis_count,
             'is_analyzing': self.is_analyzing,
-            'queue_size': self.analysis_queue.qsize()
+            'queue_size': self.analysis_queue.qsize(),
+            'failed': self.failed_count
         }
+        stats.update(self._latency_stats())
+        stats['api_retries'] = self.retry_count
+        stats.update(self.breaker.get_stats())
+        stats.update(self.payload_builder.get_stats())
+        if self.history is not None:
+            stats.update(self.history.get_stats())
+        if self.cache is not None:
+            stats.update(self.cache.get_stats())
+        return stats
     
     def stop(self):
         """停止工作线程"""
@@ -0,0 +1,322 @@
+"""
+异步Qwen分析器模块 - asyncio并发请求池
+"""
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import numpy as np
+from models.data_models import DetectionInfo, AnalysisResult, ImagePayload, TemporalSnapshot
+from utils.logger import Logger
+from config.config import Config
+from core.analyzer import QwenAnalyzer, API_ERROR_PREFIX
+from utils.resilience import CircuitOpenError
+from utils.performance import StageTracer
+from core.analysis_cache import CacheKey
+
+class AsyncQwenAnalyzer(QwenAnalyzer):
+    """异步Qwen分析器
+    
+    在独立线程中运行事件循环，最多 max_concurrent_requests 个请求同时在途，
+    每次调用受 request_timeout 限制，含重试在内的整个请求受 request_deadline 限制。结果按提交顺序发布，先完成的请求等待前序请求。
+    """
+    
+    def __init__(self, config: Config, logger: Logger, client=None, tracer: Optional[StageTracer] = None):
+        super().__init__(config, logger, client, tracer)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.lock = threading.Lock()
+        self.futures: Set = set()
+        self.in_flight = 0
+        self.next_release_id = 1
+        # 已完成但前序请求尚未完成的结果
+        self.pending_results: Dict[int, AnalysisResult] = {}
+        self.completed_count = 0
+        self.failed_count = 0
+        self.timeout_count = 0
+        self.rejected_count = 0
+        self.peak_in_flight = 0
+    
+    def _init_client(self):
+        """初始化异步OpenAI客户端，连接池大小与并发上限一致"""
+        try:
+            import httpx
+            from openai import AsyncOpenAI
+            
+            limit = self.config.max_concurrent_requests
+            client = AsyncOpenAI(
+                api_key=self.config.api_key,
+                base_url=self.config.base_url,
+                timeout=self.config.request_timeout,
+                max_retries=0,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=limit, max_keepalive_connections=limit),
+                    timeout=self.config.request_timeout
+                )
+            )
+            self.logger.info("Qwen异步客户端初始化成功")
+            return client
+        except Exception as e:
+            self.logger.error(f"初始化Qwen异步客户端失败: {e}")
+            raise
+    
+    def start_worker(self):
+        """启动事件循环线程"""
+        if self.worker_thread is None or not self.worker_thread.is_alive():
+            self.stop_thread = False
+            self.loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            self.worker_thread = threading.Thread(target=self._run_loop, args=(ready,),
+                                                  daemon=True, name="QwenAsyncLoop")
+            self.worker_thread.start()
+            ready.wait(timeout=3)
+            self.logger.info(f"Qwen异步分析器已启动 (最大并发: {self.config.max_concurrent_requests})")
+    
+    def _run_loop(self, ready: threading.Event):
+        asyncio.set_event_loop(self.loop)
+        # 信号量需在事件循环所在线程中创建
+        self.semaphore = asyncio.Semaphore(self.config.max_concurrent_requests)
+        ready.set()
+        self.loop.run_forever()
+        self.loop.close()
+    
+    def add_analysis_task(self, frame: np.ndarray, detection_info: DetectionInfo) -> bool:
+        """提交分析任务，在途请求已满时拒绝"""
+        if self.loop is None or not self.loop.is_running():
+            self.logger.warning("添加分析任务失败: 事件循环未启动")
+            return False
+        
+        cached, cache_key = self._lookup_cache(frame, detection_info)
+        if cached is not None:
+            # 缓存命中占用一个请求编号，排在在途请求之后按序发布
+            with self.lock:
+                self.next_request_id += 1
+                released = self._release(self._cached_result(self.next_request_id, cached, time.time()))
+            self._log_released(released)
+            return True
+        temporal = self.history.snapshot() if self.history is not None else None
+        
+        with self.lock:
+            if self.in_flight >= self.config.max_concurrent_requests:
+                self.rejected_count += 1
+                return False
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.next_request_id += 1
+            request_id = self.next_request_id
+            self.analysis_count += 1
+            self.is_analyzing = True
+        
+        future = asyncio.run_coroutine_threadsafe(
+            self._analyze(request_id, frame.copy(), detection_info, time.time(), cache_key, temporal), self.loop
+        )
+        self.futures.add(future)
+        future.add_done_callback(self.futures.discard)
+        self.logger.info(f"开始第{request_id}次分析...")
+        return True
+    
+    async def _analyze(self, request_id: int, frame: np.ndarray, detection_info: DetectionInfo,
+                       submitted_at: float, cache_key: Optional[CacheKey] = None,
+                       temporal: Optional[TemporalSnapshot] = None):
+        """执行单个分析请求并按序发布结果"""
+        start_time = time.perf_counter()
+        payloads: List[ImagePayload] = []
+        ttft = None
+        try:
+            async with self.semaphore:
+                text, payloads, ttft = await asyncio.wait_for(
+                    self._request(request_id, frame, detection_info, temporal),
+                    timeout=self.config.request_deadline
+                )
+            result = AnalysisResult(text=text, timestamp=time.time(), success=True, ttft=ttft or 0.0)
+            if cache_key is not None:
+                self.cache.put(cache_key, text)
+        except asyncio.TimeoutError:
+            with self.lock:
+                self.timeout_count += 1
+            self.logger.error(f"第{request_id}次分析超时 ({self.config.request_deadline:.1f}s)")
+            result = AnalysisResult(text="分析超时", timestamp=time.time(), success=False,
+                                    error_msg="timeout")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.error(f"Qwen API调用失败: {e}", key="api_error")
+            result = AnalysisResult(text=f"{API_ERROR_PREFIX}: {str(e)}", timestamp=time.time(),
+                                    success=False, error_msg=str(e))
+        
+        result.request_id = request_id
+        result.submitted_at = submitted_at
+        result.latency = time.perf_counter() - start_time
+        result.payload_bytes = sum(payload.size for payload in payloads)
+        result.encode_time = sum(payload.encode_time for payload in payloads)
+        self._record_latency(result.latency, ttft)
+        self._complete(result)
+    
+    async def _request(self, request_id: int, frame: np.ndarray, detection_info: DetectionInfo,
+                       temporal: Optional[TemporalSnapshot] = None) -> Tuple[str, List[ImagePayload], Optional[float]]:
+        if detection_info.is_empty():
+            return "未检测到铁屑", [], None
+        
+        loop = asyncio.get_event_loop()
+        # 裁剪和编码在线程池中执行，避免阻塞事件循环
+        payloads, prompt = await loop.run_in_executor(None, self._prepare_request, frame, detection_info, temporal)
+        request = self._build_request(payloads, prompt)
+        with self.tracer.span('api'):
+            if self.config.stream_analysis:
+                text, ttft = await self._stream_completion_async(request_id, request)
+                return text.strip(), payloads, ttft
+            response = await self._call_api_async(request)
+        return response.choices[0].message.content.strip(), payloads, None
+    
+    async def _stream_completion_async(self, request_id: int, request: dict) -> Tuple[str, Optional[float]]:
+        """流式调用API，仅最早未发布的请求实时更新显示文本，保证显示顺序"""
+        start_time = time.perf_counter()
+        parts: List[str] = []
+        ttft = None
+        
+        async def consume(stream, deadline: float) -> str:
+            nonlocal ttft
+            async for chunk in self._iterate_stream(stream):
+                if time.monotonic() >= deadline:
+                    self._close_stream(stream)
+                    raise TimeoutError(f"流式响应超过截止时间 ({self.config.request_deadline:.1f}s)")
+                delta = self._chunk_text(chunk)
+                if not delta:
+                    continue
+                if ttft is None:
+                    ttft = time.perf_counter() - start_time
+                parts.append(delta)
+                with self.lock:
+                    if request_id == self.next_release_id:
+                        self._set_current_analysis("".join(parts))
+            return "".join(parts)
+        
+        # 已收到部分文本后中断的流不再重试，避免重复输出
+        text = await self._call_api_async(dict(request, stream=True), consume, can_retry=lambda: not parts)
+        return text, ttft
+    
+    @staticmethod
+    async def _iterate_stream(stream):
+        """统一遍历异步流和注入的同步流"""
+        if hasattr(stream, "__aiter__"):
+            async for chunk in stream:
+                yield chunk
+            return
+        loop = asyncio.get_event_loop()
+        iterator = iter(stream)
+        sentinel = object()
+        while True:
+            chunk = await loop.run_in_executor(None, next, iterator, sentinel)
+            if chunk is sentinel:
+                return
+            yield chunk
+    
+    async def _call_api_async(self, request: dict, consume: Optional[Callable] = None,
+                              can_retry: Optional[Callable[[], bool]] = None):
+        """带重试、熔断和总截止时间的异步API调用，consume 和 can_retry 的含义同 _call_api (consume 为协程函数)"""
+        loop = asyncio.get_event_loop()
+        create = self.client.chat.completions.create
+        deadline = time.monotonic() + self.config.request_deadline
+        attempt = 0
+        while True:
+            if not self.breaker.allow_request():
+                raise CircuitOpenError("API熔断中，暂停调用")
+            timeout = max(0.001, min(self.config.request_timeout, deadline - time.monotonic()))
+            try:
+                if asyncio.iscoroutinefunction(create):
+                    response = await asyncio.wait_for(create(**request, timeout=timeout), timeout)
+                else:
+                    # 注入的同步客户端 (如桩客户端) 在线程池中调用
+                    response = await loop.run_in_executor(None, lambda: create(**request, timeout=timeout))
+                if consume is not None:
+                    response = await consume(response, deadline)
+            except asyncio.CancelledError:
+                # 被总截止时间取消的调用同样计为失败，避免半开状态的试探许可无法释放
+                self.breaker.record_failure()
+                raise
+            except Exception as e:
+                delay = self._on_api_error(e, attempt, deadline, can_retry is None or can_retry())
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return response
+    
+    def _complete(self, result: AnalysisResult):
+        """登记完成的请求，并发布所有已连续完成的结果"""
+        with self.lock:
+            self.in_flight -= 1
+            self.is_analyzing = self.in_flight > 0
+            self.completed_count += 1
+            if not result.success:
+                self.failed_count += 1
+            released = self._release(result)
+        self._log_released(released)
+            
+    def _release(self, result: AnalysisResult) -> List[AnalysisResult]:
+        """暂存结果并发布所有已连续完成的结果，调用方需持有self.lock"""
+        self.pending_results[result.request_id] = result
+        released = []
+        while self.next_release_id in self.pending_results:
+            released.append(self.pending_results.pop(self.next_release_id))
+            self.next_release_id += 1
+        for item in released:
+            self._publish_result(item)
+        return released
+            
+    def _log_released(self, released: List[AnalysisResult]):
+        for item in released:
+            if item.cached:
+                continue
+            self.logger.info(f"第{item.request_id}次分析完成 (耗时: {item.latency:.2f}s, "
+                             f"载荷: {item.payload_bytes / 1024:.1f}KB, 编码: {item.encode_time * 1000:.1f}ms): {item.text}")
+    
+    def is_busy(self) -> bool:
+        """在途请求达到并发上限或熔断期间视为忙"""
+        return self.in_flight >= self.config.max_concurrent_requests or self.breaker.is_open()
+    
+    def get_queue_depth(self) -> int:
+        """在途请求数"""
+        return self.in_flight
+    
+    def get_stats(self) -> dict:
+        """获取分析统计信息"""
+        with self.lock:
+            stats = {
+                'total_analysis': self.analysis_count,
+                'is_analyzing': self.is_analyzing,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'completed': self.completed_count,
+                'failed': self.failed_count,
+                'timeouts': self.timeout_count,
+                'rejected': self.rejected_count
+            }
+        stats.update(self._latency_stats())
+        stats['api_retries'] = self.retry_count
+        stats.update(self.breaker.get_stats())
+        stats.update(self.payload_builder.get_stats())
+        if self.history is not None:
+            stats.update(self.history.get_stats())
+        if self.cache is not None:
+            stats.update(self.cache.get_stats())
+        return stats
+    
+    def stop(self):
+        """取消在途请求并停止事件循环"""
+        self.stop_thread = True
+        if self.loop is not None and self.loop.is_running():
+            for future in list(self.futures):
+                future.cancel()
+            close = getattr(self.client, "close", None)
+            if close is not None and asyncio.iscoroutinefunction(close):
+                try:
+                    asyncio.run_coroutine_threadsafe(close(), self.loop).result(timeout=3)
+                except Exception as e:
+                    self.logger.warning(f"关闭异步客户端失败: {e}")
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.worker_thread and self.worker_thread.is_alive():
+            self.worker_thread.join(timeout=3)
+        self.logger.info("Qwen异步分析器已停止")
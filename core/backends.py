@@ -0,0 +1,332 @@
+"""
+推理后端模块 - PyTorch、ONNX Runtime 和 OpenVINO
+"""
+import ast
+import hashlib
+import json
+import os
+import shutil
+import cv2
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple
+from utils.box_ops import xywh2xyxy, batched_nms
+from utils.logger import Logger
+from utils.performance import NULL_TRACER
+from config.config import Config
+
+MAX_DETECTIONS = 300
+
+class InferenceBackend(ABC):
+    """推理后端基类
+    
+    predict 对每帧返回 (N, 6) 数组 [x1, y1, x2, y2, conf, cls]，坐标为原图坐标。
+    """
+    
+    name = "base"
+    
+    def __init__(self, config: Config, logger: Logger):
+        self.config = config
+        self.logger = logger
+        self.names: Dict[int, str] = {}
+        # 预处理/推理/后处理分阶段计时，由检测器设置
+        self.tracer = NULL_TRACER
+    
+    @abstractmethod
+    def predict(self, frames: List[np.ndarray]) -> List[np.ndarray]:
+        """对一批帧执行推理"""
+    
+    def get_info(self) -> dict:
+        """获取后端信息"""
+        return {'backend': self.name}
+
+
+class TorchBackend(InferenceBackend):
+    """ultralytics PyTorch 后端"""
+    
+    name = "pytorch"
+    
+    def __init__(self, config: Config, logger: Logger):
+        super().__init__(config, logger)
+        from ultralytics import YOLO
+        
+        if config.inference_threads > 0:
+            import torch
+            torch.set_num_threads(config.inference_threads)
+        
+        if config.quantization == "int8":
+            self.logger.warning("PyTorch后端不支持INT8量化，使用原始精度")
+        
+        self.model = YOLO(config.model_path)
+        self.names = dict(self.model.names)
+    
+    def predict(self, frames: List[np.ndarray]) -> List[np.ndarray]:
+        results = self.model.predict(
+            source=frames,
+            imgsz=self.config.image_size,
+            conf=self.config.conf_threshold,
+            iou=self.config.nms_iou_threshold,
+            device=self.config.device or None,
+            half=self.config.quantization == "fp16",
+            verbose=False
+        )
+        # ultralytics 已按图统计各阶段耗时 (毫秒)
+        for result in results:
+            speed = getattr(result, 'speed', None) or {}
+            for stage in ('preprocess', 'inference', 'postprocess'):
+                if speed.get(stage) is not None:
+                    self.tracer.record(stage, speed[stage] / 1000.0)
+        # boxes.data 为 (N, 6) [x1, y1, x2, y2, conf, cls]，一次性拷回主机内存
+        return [result.boxes.data.cpu().numpy() for result in results]
+
+
+class ExportedModelBackend(InferenceBackend):
+    """导出模型后端基类，负责导出缓存、前处理和后处理"""
+    
+    export_format = ""
+    artifact_suffix = ""
+    
+    def __init__(self, config: Config, logger: Logger):
+        super().__init__(config, logger)
+        self.input_size = config.image_size
+        # 静态批大小导出的模型只能逐帧推理
+        self.static_batch = True
+        self.artifact_path = self._ensure_exported()
+    
+    def _artifact_name(self) -> str:
+        """根据导出参数生成缓存文件名，参数变化时重新导出
+        
+        文件名附带全部导出参数 (含后端专用参数和校准数据集) 的短哈希。
+        """
+        stem = os.path.splitext(os.path.basename(self.config.model_path))[0]
+        parts = [stem, str(self.config.image_size)]
+        if self.config.batch_size > 1:
+            parts.append("dynamic")
+        if self.config.quantization != "none":
+            parts.append(self.config.quantization)
+        args = json.dumps(self._export_args(), sort_keys=True, default=str)
+        parts.append(hashlib.sha1(args.encode('utf-8')).hexdigest()[:8])
+        return "_".join(parts)
+    
+    def _cached_path(self) -> str:
+        directory = os.path.dirname(os.path.abspath(self.config.model_path))
+        return os.path.join(directory, self._artifact_name() + self.artifact_suffix)
+    
+    def _ensure_exported(self) -> str:
+        """导出模型并缓存到 model_path 同目录，已有缓存且不旧于原模型时直接复用"""
+        model_path = self.config.model_path
+        if model_path.rstrip("/\\").endswith(self.artifact_suffix):
+            # model_path 本身就是已导出的模型
+            return model_path
+        
+        cached = self._cached_path()
+        if os.path.exists(cached) and (
+            not os.path.exists(model_path) or os.path.getmtime(cached) >= os.path.getmtime(model_path)
+        ):
+            self.logger.info(f"使用已缓存的{self.name}模型: {cached}")
+            return cached
+        
+        self.logger.info(f"正在导出{self.name}模型: {model_path} -> {cached}")
+        from ultralytics import YOLO
+        
+        exported = YOLO(model_path).export(**self._export_args())
+        self._store_export(str(exported), cached)
+        self.logger.info(f"{self.name}模型导出完成: {cached}")
+        return cached
+    
+    def _export_args(self) -> dict:
+        return {
+            'format': self.export_format,
+            'imgsz': self.config.image_size,
+            'dynamic': self.config.batch_size > 1,
+            'device': 'cpu',
+        }
+    
+    def _store_export(self, exported: str, cached: str):
+        if os.path.abspath(exported) == os.path.abspath(cached):
+            return
+        if os.path.isdir(cached):
+            shutil.rmtree(cached)
+        elif os.path.exists(cached):
+            os.remove(cached)
+        shutil.move(exported, cached)
+    
+    @abstractmethod
+    def _run(self, blob: np.ndarray) -> np.ndarray:
+        """执行一次前向推理"""
+    
+    def predict(self, frames: List[np.ndarray]) -> List[np.ndarray]:
+        step = 1 if self.static_batch else max(1, len(frames))
+        results = []
+        for start in range(0, len(frames), step):
+            chunk = frames[start:start + step]
+            with self.tracer.span('preprocess'):
+                blob, transforms = self._preprocess(chunk)
+            with self.tracer.span('inference'):
+                output = self._run(blob)
+            with self.tracer.span('postprocess'):
+                results.extend(self._postprocess(output, transforms, chunk))
+        return results
+    
+    def _preprocess(self, frames: List[np.ndarray]) -> Tuple[np.ndarray, List[Tuple[float, float, float]]]:
+        """等比缩放并填充到正方形输入，返回NCHW张量和每帧的(缩放比, x填充, y填充)"""
+        size = self.input_size
+        padded = []
+        transforms = []
+        for frame in frames:
+            height, width = frame.shape[:2]
+            gain = min(size / height, size / width)
+            new_w, new_h = int(round(width * gain)), int(round(height * gain))
+            pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+            resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR) \
+                if (new_w, new_h) != (width, height) else frame
+            top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+            bottom, right = size - new_h - top, size - new_w - left
+            padded.append(cv2.copyMakeBorder(resized, top, bottom, left, right,
+                                             cv2.BORDER_CONSTANT, value=(114, 114, 114)))
+            transforms.append((gain, left, top))
+        # blobFromImages 一次完成 BGR->RGB、归一化和 HWC->NCHW
+        blob = cv2.dnn.blobFromImages(padded, scalefactor=1 / 255.0, swapRB=True)
+        return blob, transforms
+    
+    def _postprocess(self, output: np.ndarray, transforms: List[Tuple[float, float, float]],
+                     frames: List[np.ndarray]) -> List[np.ndarray]:
+        """解码 (B, 4+nc, A) 输出，做按类别NMS并还原到原图坐标"""
+        results = []
+        for prediction, (gain, pad_x, pad_y), frame in zip(output, transforms, frames):
+            prediction = prediction.T.astype(np.float32, copy=False)
+            scores = prediction[:, 4:]
+            class_ids = scores.argmax(axis=1)
+            confidences = scores[np.arange(len(scores)), class_ids]
+            mask = confidences >= self.config.conf_threshold
+            if not mask.any():
+                results.append(np.empty((0, 6), dtype=np.float32))
+                continue
+            
+            boxes = xywh2xyxy(prediction[mask, :4])
+            confidences, class_ids = confidences[mask], class_ids[mask]
+            keep = batched_nms(boxes, confidences, class_ids, self.config.nms_iou_threshold)[:MAX_DETECTIONS]
+            boxes = boxes[keep]
+            
+            height, width = frame.shape[:2]
+            boxes[:, [0, 2]] = np.clip((boxes[:, [0, 2]] - pad_x) / gain, 0, width)
+            boxes[:, [1, 3]] = np.clip((boxes[:, [1, 3]] - pad_y) / gain, 0, height)
+            results.append(np.column_stack([boxes, confidences[keep], class_ids[keep]]).astype(np.float32))
+        return results
+    
+    def get_info(self) -> dict:
+        return {
+            'backend': self.name,
+            'artifact': self.artifact_path,
+            'threads': self.config.inference_threads or 'auto',
+            'quantization': self.config.quantization
+        }
+    
+    @staticmethod
+    def _parse_names(names) -> Dict[int, str]:
+        if isinstance(names, str):
+            names = ast.literal_eval(names)
+        return {int(k): str(v) for k, v in dict(names).items()}
+
+
+class OnnxRuntimeBackend(ExportedModelBackend):
+    """ONNX Runtime CPU 后端"""
+    
+    name = "onnx"
+    export_format = "onnx"
+    artifact_suffix = ".onnx"
+    
+    def __init__(self, config: Config, logger: Logger):
+        if config.quantization == "fp16":
+            # FP16导出仅支持GPU，拒绝以免把FP32模型缓存在fp16文件名下
+            raise ValueError("ONNX Runtime CPU后端不支持FP16量化，请使用none/int8或openvino后端")
+        super().__init__(config, logger)
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if config.inference_threads > 0:
+            options.intra_op_num_threads = config.inference_threads
+            options.inter_op_num_threads = 1
+        
+        self.session = ort.InferenceSession(self.artifact_path, sess_options=options,
+                                            providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_dtype = np.float16 if "float16" in model_input.type else np.float32
+        self.static_batch = isinstance(model_input.shape[0], int)
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = self._parse_names(metadata.get("names", "{}"))
+    
+    def _export_args(self) -> dict:
+        args = super()._export_args()
+        args['simplify'] = True
+        return args
+    
+    def _store_export(self, exported: str, cached: str):
+        if self.config.quantization == "int8":
+            # 动态量化: 只有权重离线量化，激活在运行时量化。主要加速MatMul/Gemm，
+            # 以卷积为主的YOLO在CPU上通常没有提速，甚至更慢；需要INT8加速请使用OpenVINO后端的静态量化
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(exported, cached, weight_type=QuantType.QUInt8)
+            os.remove(exported)
+            return
+        super()._store_export(exported, cached)
+    
+    def _run(self, blob: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: blob.astype(self.input_dtype, copy=False)})[0]
+
+
+class OpenVINOBackend(ExportedModelBackend):
+    """OpenVINO IR CPU 后端"""
+    
+    name = "openvino"
+    export_format = "openvino"
+    artifact_suffix = "_openvino_model"
+    
+    def __init__(self, config: Config, logger: Logger):
+        super().__init__(config, logger)
+        import openvino as ov
+        import yaml
+        
+        core = ov.Core()
+        stem = os.path.splitext(os.path.basename(self.config.model_path))[0]
+        xml_files = [f for f in os.listdir(self.artifact_path) if f.endswith(".xml")]
+        xml_path = os.path.join(self.artifact_path, f"{stem}.xml" if f"{stem}.xml" in xml_files else xml_files[0])
+        
+        compile_config = {"PERFORMANCE_HINT": "LATENCY"}
+        if config.inference_threads > 0:
+            compile_config["INFERENCE_NUM_THREADS"] = config.inference_threads
+        self.compiled_model = core.compile_model(core.read_model(xml_path), "CPU", compile_config)
+        self.output = self.compiled_model.output(0)
+        self.static_batch = self.compiled_model.input(0).get_partial_shape()[0].is_static
+        
+        metadata_path = os.path.join(self.artifact_path, "metadata.yaml")
+        if os.path.exists(metadata_path):
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                self.names = self._parse_names(yaml.safe_load(f).get("names", {}))
+    
+    def _export_args(self) -> dict:
+        args = super()._export_args()
+        if self.config.quantization == "fp16":
+            args['half'] = True
+        elif self.config.quantization == "int8":
+            if not self.config.calibration_data:
+                raise ValueError("OpenVINO INT8量化需要在calibration_data中指定校准数据集yaml")
+            args['int8'] = True
+            args['data'] = self.config.calibration_data
+        return args
+    
+    def _run(self, blob: np.ndarray) -> np.ndarray:
+        return self.compiled_model(blob)[self.output]
+
+
+def create_backend(config: Config, logger: Logger) -> InferenceBackend:
+    """根据配置创建推理后端"""
+    if config.inference_backend == "pytorch":
+        return TorchBackend(config, logger)
+    if config.inference_backend == "onnx":
+        return OnnxRuntimeBackend(config, logger)
+    if config.inference_backend == "openvino":
+        return OpenVINOBackend(config, logger)
+    raise ValueError(f"不支持的推理后端: {config.inference_backend}")
@@ -1,11 +1,14 @@
 """
 摄像头管理模块
 """
-import cv2
+import time
 import numpy as np
 from typing import Tuple, Optional
 from utils.logger import Logger
 from config.config import Config
+from core.capture import FrameRingBuffer, CaptureThread
+from core.sources import FrameSource, create_frame_source
+from models.data_models import FramePacket
 
 class CameraManager:
     """摄像头管理器类"""
@@ -13,59 +16,98 @@ class CameraManager:
     def __init__(self, config: Config, logger: Logger):
         self.config = config
         self.logger = logger
-        self.cap = None
+        self.source: Optional[FrameSource] = None
+        self.pending_frame: Optional[np.ndarray] = None
         self.frame_width = 0
         self.frame_height = 0
         self.is_initialized = False
+        self.ring_buffer: Optional[FrameRingBuffer] = None
+        self.capture_thread: Optional[CaptureThread] = None
+        self.frame_sequence = 0
         
     def initialize(self) -> bool:
-        """初始化摄像头"""
+        """初始化帧源"""
         try:
-            self.cap = cv2.VideoCapture(self.config.camera_index, cv2.CAP_DSHOW)
-            if not self.cap.isOpened():
-                self.logger.error(f"无法打开摄像头索引 {self.config.camera_index}")
+            self.source = create_frame_source(self.config, self.logger)
+            if not self.source.open():
                 return False
             
-            # 设置摄像头参数
-            self._configure_camera()
+            # 设置帧源参数
+            self.source.configure()
             
             # 获取第一帧以确定尺寸
-            success, frame = self.cap.read()
+            success, frame = self.source.read()
             if not success:
-                self.logger.error("无法从摄像头读取第一帧")
-                self.cap.release()
+                self.logger.error("无法从帧源读取第一帧")
+                self.source.release()
                 return False
             
             self.frame_height, self.frame_width = frame.shape[:2]
             self.is_initialized = True
-            self.logger.info(f"摄像头初始化成功 - 分辨率: {self.frame_width}x{self.frame_height}")
+            self.logger.info(f"帧源初始化成功 ({self.config.source_type}) - 分辨率: {self.frame_width}x{self.frame_height}")
+            
+            # 第一帧不丢弃，保证回放序列完整
+            if self.config.threaded_capture:
+                self._start_capture_thread(frame)
+            else:
+                self.pending_frame = frame
             return True
             
         except Exception as e:
-            self.logger.error(f"摄像头初始化异常: {e}")
+            self.logger.error(f"帧源初始化异常: {e}")
             return False
     
-    def _configure_camera(self):
-        """配置摄像头参数"""
-        try:
-            # 设置缓冲区大小
-            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            # 设置FPS
-            self.cap.set(cv2.CAP_PROP_FPS, 30)
-            self.logger.debug("摄像头参数配置完成")
-        except Exception as e:
-            self.logger.warning(f"摄像头参数配置失败: {e}")
+    def _start_capture_thread(self, first_frame: np.ndarray):
+        """按第一帧尺寸预分配环形缓冲区并启动采集线程"""
+        self.ring_buffer = FrameRingBuffer(
+            first_frame.shape, first_frame.dtype, self.config.capture_buffer_size
+        )
+        index, _ = self.ring_buffer.acquire_write_slot()
+        self.ring_buffer.commit(index, first_frame, time.time())
+        self.capture_thread = CaptureThread(self.source, self.ring_buffer, self.logger)
+        self.capture_thread.start()
     
     def read_frame(self) -> Tuple[bool, Optional[np.ndarray]]:
         """读取一帧"""
-        if not self.is_initialized or self.cap is None:
+        packet = self.read_packet()
+        if packet is None:
             return False, None
+        return True, packet.frame
+    
+    def read_packet(self, timeout: float = 1.0) -> Optional[FramePacket]:
+        """读取最新帧及其序号、采集时间戳和丢帧计数
+        
+        多线程采集模式下返回的帧在下一次读取前保持有效，需要跨帧保留时请自行拷贝。
+        等待超时也返回None，此时 is_alive() 为True (如网络流重连、低帧率回放)。
+        """
+        if not self.is_initialized or self.source is None:
+            return None
+        
+        if self.ring_buffer is not None:
+            return self.ring_buffer.read_latest(timeout=timeout)
         
         try:
-            return self.cap.read()
+            if self.pending_frame is not None:
+                success, frame = True, self.pending_frame
+                self.pending_frame = None
+            else:
+                success, frame = self.source.read()
+            if not success:
+                return None
+            self.frame_sequence += 1
+            return FramePacket(frame=frame, sequence=self.frame_sequence, timestamp=time.time())
         except Exception as e:
             self.logger.error(f"读取帧异常: {e}")
-            return False, None
+            return None
+    
+    def is_alive(self) -> bool:
+        """采集线程仍在运行，read_packet 返回None只表示暂时没有新帧 (同步读取失败即视为出错)"""
+        return (self.capture_thread is not None and self.capture_thread.is_alive()
+                and not self.ring_buffer.closed)
+    
+    def is_finished(self) -> bool:
+        """有限帧源是否已播放完毕"""
+        return self.source is not None and self.source.finished
     
     def get_frame_size(self) -> Tuple[int, int]:
         """获取帧尺寸"""
@@ -79,13 +121,28 @@ class CameraManager:
         return {
             'width': self.frame_width,
             'height': self.frame_height,
-            'fps': self.cap.get(cv2.CAP_PROP_FPS) if self.cap else 0,
-            'backend': self.cap.getBackendName() if self.cap else "Unknown"
+            'source_type': self.config.source_type,
+            'fps': self.source.get_fps() if self.source else 0,
+            'backend': self.source.get_backend_name() if self.source else "Unknown",
+            'threaded_capture': self.ring_buffer is not None
+        }
+    
+    def get_stats(self) -> dict:
+        """获取采集统计信息"""
+        if self.ring_buffer is not None:
+            return self.ring_buffer.get_stats()
+        return {
+            'captured_frames': self.frame_sequence,
+            'consumed_sequence': self.frame_sequence,
+            'dropped_frames': 0
         }
     
     def release(self):
         """释放摄像头资源"""
-        if self.cap:
-            self.cap.release()
+        if self.capture_thread:
+            self.capture_thread.stop()
+            self.capture_thread = None
+        if self.source:
+            self.source.release()
             self.is_initialized = False
-            self.logger.info("摄像头资源已释放")
+            self.logger.info("帧源资源已释放")
@@ -0,0 +1,155 @@
+"""
+帧采集模块 - 独立采集线程与最新帧环形缓冲区
+"""
+import threading
+import time
+import numpy as np
+from typing import List, Optional, Tuple
+from models.data_models import FramePacket
+from utils.logger import Logger
+from core.sources import FrameSource
+
+class FrameRingBuffer:
+    """预分配的最新帧环形缓冲区
+    
+    采集线程写入空闲槽位，消费者总是取得最新一帧。
+    被消费者持有的槽位在其下一次读取之前不会被覆盖，因此返回的帧无需拷贝。
+    """
+    
+    def __init__(self, shape: Tuple[int, ...], dtype=np.uint8, size: int = 3):
+        # 至少需要3个槽位: 最新帧、消费者持有帧、采集线程正在写入的帧
+        size = max(size, 3)
+        self.size = size
+        self._slots: List[np.ndarray] = [np.empty(shape, dtype=dtype) for _ in range(size)]
+        self._sequences = [0] * size
+        self._timestamps = [0.0] * size
+        self._latest = -1
+        self._reading = -1
+        self._write_seq = 0
+        self._read_seq = 0
+        self._dropped = 0
+        self._closed = False
+        self._cond = threading.Condition()
+    
+    def acquire_write_slot(self) -> Tuple[int, np.ndarray]:
+        """获取一个可写槽位 (不会是最新帧或消费者持有的帧)"""
+        with self._cond:
+            index = (self._latest + 1) % self.size
+            while index in (self._latest, self._reading):
+                index = (index + 1) % self.size
+            return index, self._slots[index]
+    
+    def commit(self, index: int, frame: np.ndarray, timestamp: float):
+        """提交写入完成的槽位"""
+        with self._cond:
+            # 分辨率变化时读取接口会重新分配数组，直接替换槽位
+            if frame is not self._slots[index]:
+                self._slots[index] = frame
+            self._write_seq += 1
+            self._sequences[index] = self._write_seq
+            self._timestamps[index] = timestamp
+            self._latest = index
+            self._cond.notify_all()
+    
+    def read_latest(self, timeout: Optional[float] = None) -> Optional[FramePacket]:
+        """阻塞直到有新帧，返回最新帧 (超时或已关闭返回None)"""
+        with self._cond:
+            has_new = self._cond.wait_for(
+                lambda: self._closed or (self._latest >= 0 and self._write_seq > self._read_seq),
+                timeout=timeout
+            )
+            if not has_new or self._latest < 0 or self._write_seq <= self._read_seq:
+                return None
+            
+            index = self._latest
+            sequence = self._sequences[index]
+            self._dropped += sequence - self._read_seq - 1
+            self._read_seq = sequence
+            self._reading = index
+            return FramePacket(
+                frame=self._slots[index],
+                sequence=sequence,
+                timestamp=self._timestamps[index],
+                dropped_frames=self._dropped
+            )
+    
+    def close(self):
+        """关闭缓冲区并唤醒等待的消费者"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+    
+    @property
+    def closed(self) -> bool:
+        return self._closed
+    
+    def get_stats(self) -> dict:
+        """获取缓冲区统计信息"""
+        with self._cond:
+            return {
+                'captured_frames': self._write_seq,
+                'consumed_sequence': self._read_seq,
+                'dropped_frames': self._dropped
+            }
+
+
+class CaptureThread:
+    """独立采集线程，持续将最新帧写入环形缓冲区"""
+    
+    def __init__(self, source: FrameSource, ring_buffer: FrameRingBuffer, logger: Logger,
+                 max_consecutive_failures: int = 30):
+        self.source = source
+        self.ring_buffer = ring_buffer
+        self.logger = logger
+        self.max_consecutive_failures = max_consecutive_failures
+        self.thread = None
+        self.stop_thread = False
+    
+    def start(self):
+        """启动采集线程"""
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_thread = False
+            self.thread = threading.Thread(target=self._worker, daemon=True, name="CaptureWorker")
+            self.thread.start()
+            self.logger.info("帧采集线程已启动")
+    
+    def _worker(self):
+        """采集循环"""
+        failures = 0
+        
+        while not self.stop_thread:
+            try:
+                index, slot = self.ring_buffer.acquire_write_slot()
+                success, frame = self.source.read(slot)
+                timestamp = time.time()
+                
+                if not success or frame is None:
+                    if self.source.finished:
+                        self.logger.info("帧源已播放完毕，采集线程退出")
+                        break
+                    failures += 1
+                    if failures >= self.max_consecutive_failures:
+                        self.logger.error(f"连续{failures}次读取帧失败，采集线程退出")
+                        break
+                    time.sleep(0.005)
+                    continue
+                
+                failures = 0
+                self.ring_buffer.commit(index, frame, timestamp)
+            
+            except Exception as e:
+                self.logger.error(f"采集线程异常: {e}")
+                break
+        
+        self.ring_buffer.close()
+        self.logger.info("帧采集线程已停止")
+    
+    def is_alive(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+    
+    def stop(self):
+        """停止采集线程"""
+        self.stop_thread = True
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=3)
+        self.ring_buffer.close()
@@ -1,43 +1,56 @@
 """
 YOLO检测器模块
 """
-from ultralytics import YOLO
+import cv2
 import numpy as np
-from typing import Tuple, Optional
-from models.data_models import DetectionInfo, DetectionResult
+from typing import List, Tuple, Optional
+from models.data_models import DetectionInfo
 from utils.logger import Logger
+from utils.visualization import draw_detections
+from utils.performance import NULL_TRACER, StageTracer
 from config.config import Config
+from core.backends import InferenceBackend, create_backend
+from core.tiling import clip_roi, generate_tiles, merge_detections
+
+def annotate_frame(config: Config, frame: np.ndarray, detection_info: Optional[DetectionInfo],
+                   copy: bool = True) -> np.ndarray:
+    """绘制检测框和ROI边界，不依赖模型 (多进程模式下主进程无需加载检测器)"""
+    annotated = draw_detections(frame.copy() if copy else frame, detection_info)
+    if config.roi:
+        height, width = frame.shape[:2]
+        x1, y1, x2, y2 = clip_roi(config.roi, width, height)
+        cv2.rectangle(annotated, (x1, y1), (x2 - 1, y2 - 1), (255, 255, 0), 1)
+    return annotated
+
 
 class YOLODetector:
     """YOLO检测器类"""
     
-    def __init__(self, config: Config, logger: Logger):
+    def __init__(self, config: Config, logger: Logger, tracer: Optional[StageTracer] = None):
         self.config = config
         self.logger = logger
-        self.model = self._load_model()
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+        self.backend = self._load_model()
+        self.backend.tracer = self.tracer
         
-    def _load_model(self) -> YOLO:
+    def _load_model(self) -> InferenceBackend:
         """加载YOLO模型"""
         try:
-            model = YOLO(self.config.model_path)
-            self.logger.info(f"成功加载YOLO模型: {self.config.model_path}")
-            return model
+            backend = create_backend(self.config, self.logger)
+            self.logger.info(f"成功加载YOLO模型: {self.config.model_path} (后端: {backend.name})")
+            return backend
         except Exception as e:
             self.logger.error(f"加载YOLO模型失败: {e}")
             raise
             
-    def detect(self, frame: np.ndarray) -> Tuple[np.ndarray, Optional[DetectionInfo]]:
-        """执行检测并返回结果"""
+    def detect(self, frame: np.ndarray, annotate: bool = True) -> Tuple[np.ndarray, Optional[DetectionInfo]]:
+        """执行检测并返回结果，annotate为False时返回原始帧"""
         try:
-            results = self.model.predict(
-                source=frame, 
-                imgsz=self.config.image_size, 
-                conf=self.config.conf_threshold, 
-                verbose=False
-            )
+            data = self._infer([frame])[0]
             
-            detection_info = self._extract_detection_info(results)
-            annotated_frame = results[0].plot()
+            with self.tracer.span('extraction'):
+                detection_info = self._extract_detection_info(data)
+            annotated_frame = self.annotate(frame, detection_info) if annotate else frame
             
             return annotated_frame, detection_info
             
@@ -45,35 +58,67 @@ class YOLODetector:
             self.logger.error(f"YOLO检测过程异常: {e}")
             return frame, None
             
-    def _extract_detection_info(self, results) -> Optional[DetectionInfo]:
-        """从YOLO结果中提取检测信息"""
-        if not results or not results[0].boxes:
-            return None
-            
-        boxes = results[0].boxes
-        names = results[0].names
+    def detect_batch(self, frames: List[np.ndarray]) -> List[Tuple[np.ndarray, Optional[DetectionInfo]]]:
+        """批量检测多帧 (多路摄像头或缓冲帧)，按batch_size分批做一次前向推理"""
+        outputs: List[Tuple[np.ndarray, Optional[DetectionInfo]]] = []
+        batch_size = max(1, self.config.batch_size)
         
-        if boxes is None or len(boxes) == 0:
-            return None
-            
-        detection_info = DetectionInfo()
+        for start in range(0, len(frames), batch_size):
+            chunk = frames[start:start + batch_size]
+            try:
+                for frame, data in zip(chunk, self._infer(chunk)):
+                    detection_info = self._extract_detection_info(data)
+                    outputs.append((self.annotate(frame, detection_info), detection_info))
+            except Exception as e:
+                self.logger.error(f"YOLO批量检测过程异常: {e}")
+                outputs.extend((frame, None) for frame in chunk)
         
-        for i, box in enumerate(boxes.xyxy):
-            x1, y1, x2, y2 = box.cpu().numpy()
-            confidence = float(boxes.conf[i].cpu().numpy())
-            class_id = int(boxes.cls[i].cpu().numpy())
-            class_name = names[class_id]
+        return outputs
+    
+    def _infer(self, frames: List[np.ndarray]) -> List[np.ndarray]:
+        """按配置做ROI裁剪和分块推理，返回原图坐标下的 (N, 6) 检测数组"""
+        if not self.config.roi and not self.config.tile_inference:
+            return self.backend.predict(frames)
+        
+        inputs, owners, offsets = [], [], []
+        for index, frame in enumerate(frames):
+            height, width = frame.shape[:2]
+            rx1, ry1, rx2, ry2 = clip_roi(self.config.roi, width, height)
+            region = frame[ry1:ry2, rx1:rx2]
             
-            detection = DetectionResult(
-                class_name=class_name,
-                confidence=confidence,
-                center_x=float((x1 + x2) / 2),
-                center_y=float((y1 + y2) / 2),
-                bbox=(float(x1), float(y1), float(x2), float(y2))
-            )
-            detection_info.add_detection(detection)
+            tiles = [(0, 0, rx2 - rx1, ry2 - ry1)]
+            if self.config.tile_inference:
+                tiles = generate_tiles(rx2 - rx1, ry2 - ry1, self.config.tile_size, self.config.tile_overlap)
+                # 追加一次整幅推理，避免大目标被分块截断
+                if self.config.tile_include_full_frame and len(tiles) > 1:
+                    tiles.append((0, 0, rx2 - rx1, ry2 - ry1))
             
-        return detection_info
+            for tx1, ty1, tx2, ty2 in tiles:
+                inputs.append(region[ty1:ty2, tx1:tx2])
+                owners.append(index)
+                offsets.append((rx1 + tx1, ry1 + ty1))
+        
+        # 所有分块一次送入后端批量推理
+        per_frame: List[List[np.ndarray]] = [[] for _ in frames]
+        for data, owner, (offset_x, offset_y) in zip(self.backend.predict(inputs), owners, offsets):
+            if len(data):
+                data = data.copy()
+                data[:, [0, 2]] += offset_x
+                data[:, [1, 3]] += offset_y
+                per_frame[owner].append(data)
+        
+        return [merge_detections(parts, self.config.tile_merge_threshold) for parts in per_frame]
+    
+    def _extract_detection_info(self, data: np.ndarray) -> Optional[DetectionInfo]:
+        """从 (N, 6) 检测数组中提取检测信息"""
+        if data is None or len(data) == 0:
+            return None
+        return DetectionInfo.from_array(data, self.backend.names)
+    
+    def annotate(self, frame: np.ndarray, detection_info: Optional[DetectionInfo],
+                 copy: bool = True) -> np.ndarray:
+        """在帧副本上绘制检测框，所有后端的标注结果一致 (copy为False时原地绘制)"""
+        return annotate_frame(self.config, frame, detection_info, copy)
     
     def get_model_info(self) -> dict:
         """获取模型信息"""
@@ -81,5 +126,10 @@ class YOLODetector:
             'model_path': self.config.model_path,
             'image_size': self.config.image_size,
             'conf_threshold': self.config.conf_threshold,
-            'model_names': getattr(self.model, 'names', {})
+            'device': self.config.device or 'auto',
+            'batch_size': self.config.batch_size,
+            'roi': self.config.roi,
+            'tile_inference': self.config.tile_inference,
+            'model_names': self.backend.names,
+            **self.backend.get_info()
         }
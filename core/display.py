@@ -1,20 +1,45 @@
 """
 显示管理模块
 """
+import time
 import cv2
 import numpy as np
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from models.data_models import DetectionInfo
+from utils.logger import Logger
 from config.config import Config
+from core.preview_server import PreviewServer
 
 class DisplayManager:
-    """显示管理器类"""
+    """显示管理器类
     
-    def __init__(self, config: Config):
+    FPS和类别计数的背景框与文字预先渲染为小图块并按文本缓存，
+    每帧只需把图块拷贝到对应位置，数值变化时才重新绘制。
+    """
+    
+    # FPS文字的刷新间隔(秒)，避免每帧重绘
+    FPS_REFRESH_INTERVAL = 0.25
+    
+    def __init__(self, config: Config, logger: Optional[Logger] = None):
         self.config = config
         self.window_name = "YOLOv8 - local camera recognition (press 'q' to exit)"
         # 预定义所有可能的类别名称
         self.all_classes = ["good", "medium", "bad"]
+        # 无界面模式下通过HTTP提供MJPEG预览，不调用cv2.imshow/waitKey
+        self.headless = config.display_mode == "headless"
+        self.preview_server = PreviewServer(config, logger) if self.headless else None
+        self.sprite_cache: Dict[Tuple, np.ndarray] = {}
+        self.displayed_fps = 0.0
+        self.fps_updated_at = 0.0
+    
+    def start(self):
+        """启动显示后端"""
+        if self.preview_server is not None:
+            self.preview_server.start()
+    
+    def has_viewer(self) -> bool:
+        """是否有人在观看，无界面模式下无客户端连接时可跳过绘制"""
+        return self.preview_server is None or self.preview_server.has_clients()
         
     def draw_info_overlay(self, frame: np.ndarray, fps: float, 
                          detection_info: Optional[DetectionInfo], 
@@ -31,11 +56,14 @@ class DisplayManager:
     
     def _draw_fps(self, frame: np.ndarray, fps: float):
         """绘制FPS信息 - 与Yolov8Detector.py完全一致"""
-        framefps_text = f"FPS: {fps:.2f}"
-        # 在左上角绘制黑色背景矩形
-        cv2.rectangle(frame, (10, 5), (130, 25), (0, 0, 0), -1)
-        # 在矩形上绘制FPS文本
-        cv2.putText(frame, framefps_text, (15, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+        now = time.monotonic()
+        if now - self.fps_updated_at >= self.FPS_REFRESH_INTERVAL:
+            self.displayed_fps = fps
+            self.fps_updated_at = now
+        framefps_text = f"FPS: {self.displayed_fps:.2f}"
+        # 左上角黑色背景矩形 (10, 5)-(130, 25) 上的FPS文本
+        sprite = self._get_sprite(framefps_text, 121, 21, 15, 0.6, (0, 255, 255), 2)
+        self._blit(frame, sprite, 10, 5)
     
     def _draw_detection_counts(self, frame: np.ndarray, detection_info: Optional[DetectionInfo]):
         """绘制各类别数量统计 - 无目标时显示0"""
@@ -49,12 +77,32 @@ class DisplayManager:
                 count = 0
             
             class_text = f"{class_name}: {count}"
-            # 绘制黑色背景矩形
-            cv2.rectangle(frame, (10, y_offset), (150, y_offset + 20), (0, 0, 0), -1)
-            # 绘制类别统计文本
-            cv2.putText(frame, class_text, (15, y_offset + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+            # 黑色背景矩形 (10, y)-(150, y + 20) 上的类别统计文本
+            sprite = self._get_sprite(class_text, 141, 21, 15, 0.5, (255, 255, 255), 1)
+            self._blit(frame, sprite, 10, y_offset)
             y_offset += 25
     
+    def _get_sprite(self, text: str, width: int, height: int, baseline: int,
+                    scale: float, color: Tuple[int, int, int], thickness: int) -> np.ndarray:
+        """获取黑底文字图块，按 (文本, 尺寸, 样式) 缓存"""
+        key = (text, width, height, scale, color, thickness)
+        sprite = self.sprite_cache.get(key)
+        if sprite is None:
+            if len(self.sprite_cache) >= 256:
+                self.sprite_cache.clear()
+            sprite = np.zeros((height, width, 3), dtype=np.uint8)
+            cv2.putText(sprite, text, (5, baseline), cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness)
+            self.sprite_cache[key] = sprite
+        return sprite
+    
+    @staticmethod
+    def _blit(frame: np.ndarray, sprite: np.ndarray, x: int, y: int):
+        """将图块拷贝到帧的 (x, y) 处，超出画面部分裁掉"""
+        height = min(sprite.shape[0], frame.shape[0] - y)
+        width = min(sprite.shape[1], frame.shape[1] - x)
+        if height > 0 and width > 0:
+            frame[y:y + height, x:x + width] = sprite[:height, :width]
+    
     def resize_for_display(self, frame: np.ndarray) -> np.ndarray:
         """调整帧大小用于显示"""
         if self.config.display_scale != 1.0:
@@ -66,8 +114,24 @@ class DisplayManager:
     
     def show_frame(self, frame: np.ndarray):
         """显示帧"""
-        cv2.imshow(self.window_name, frame)
+        if self.preview_server is not None:
+            self.preview_server.publish(frame)
+        else:
+            cv2.imshow(self.window_name, frame)
+    
+    def poll_key(self) -> int:
+        """读取按键，无界面模式下返回-1"""
+        if self.headless:
+            return -1
+        return cv2.waitKey(1) & 0xFF
+    
+    def get_stats(self) -> dict:
+        """获取显示统计"""
+        return self.preview_server.get_stats() if self.preview_server is not None else {}
     
     def cleanup(self):
         """清理显示资源"""
-        cv2.destroyAllWindows()
+        if self.preview_server is not None:
+            self.preview_server.stop()
+        else:
+            cv2.destroyAllWindows()
@@ -0,0 +1,146 @@
+"""
+检测历史模块 - 固定内存的计数环形缓冲与关键帧选取
+"""
+import time
+import cv2
+import numpy as np
+from typing import Dict, List, Optional
+from models.data_models import DetectionInfo, TemporalSnapshot
+from config.config import Config
+
+class DetectionHistory:
+    """按帧记录各类别计数，并定期保存缩略帧作为关键帧候选
+    
+    计数存放在 (history_length, 类别数) 的int32环形数组中，缩略帧只保留
+    temporal_frame_slots 张，内存占用与运行时长无关。
+    """
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.capacity = config.history_length
+        self.timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self.counts = np.zeros((self.capacity, 0), dtype=np.int32)
+        self.class_names: Dict[int, str] = {}
+        self.total_frames = 0
+        # 缩略帧环形槽位及其对应的帧序号
+        self.frame_slots: List[Optional[np.ndarray]] = [None] * config.temporal_frame_slots
+        self.slot_frame_index = np.full(config.temporal_frame_slots, -1, dtype=np.int64)
+        self.slot_cursor = 0
+    
+    def append(self, frame: np.ndarray, detection_info: Optional[DetectionInfo]):
+        """记录一帧的类别计数，每temporal_sample_interval帧保存一张缩略帧"""
+        row = self.total_frames % self.capacity
+        self.timestamps[row] = time.time()
+        if detection_info is not None:
+            self.class_names.update(detection_info.class_names)
+            class_counts = np.bincount(detection_info.class_ids, minlength=len(self.class_names))
+            self._ensure_columns(len(class_counts))
+            self.counts[row] = 0
+            self.counts[row, :len(class_counts)] = class_counts
+        else:
+            self.counts[row] = 0
+        
+        if self.total_frames % self.config.temporal_sample_interval == 0:
+            self.frame_slots[self.slot_cursor] = self._thumbnail(frame)
+            self.slot_frame_index[self.slot_cursor] = self.total_frames
+            self.slot_cursor = (self.slot_cursor + 1) % len(self.frame_slots)
+        self.total_frames += 1
+    
+    def _ensure_columns(self, width: int):
+        if width > self.counts.shape[1]:
+            self.counts = np.pad(self.counts, ((0, 0), (0, width - self.counts.shape[1])))
+    
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        max_side = self.config.temporal_keyframe_side
+        long_side = max(frame.shape[:2])
+        if long_side <= max_side:
+            return frame.copy()
+        gain = max_side / long_side
+        size = (int(round(frame.shape[1] * gain)), int(round(frame.shape[0] * gain)))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    
+    def _column(self, class_name: str) -> Optional[int]:
+        for class_id, name in self.class_names.items():
+            if name == class_name and class_id < self.counts.shape[1]:
+                return class_id
+        return None
+    
+    def _ordered(self):
+        """按时间顺序返回有效的 (帧序号, 时间戳, 计数)"""
+        length = min(self.total_frames, self.capacity)
+        first = self.total_frames - length
+        rows = np.arange(first, self.total_frames) % self.capacity
+        return np.arange(first, self.total_frames), self.timestamps[rows], self.counts[rows]
+    
+    def _bad_ratio(self, counts: np.ndarray) -> np.ndarray:
+        """bad在bad+medium中的占比，两者都为0时为0"""
+        bad_column, medium_column = self._column("bad"), self._column("medium")
+        bad = counts[..., bad_column].astype(np.float64) if bad_column is not None else np.zeros(counts.shape[:-1])
+        medium = counts[..., medium_column].astype(np.float64) if medium_column is not None else np.zeros(counts.shape[:-1])
+        total = bad + medium
+        return np.divide(bad, total, out=np.zeros_like(total), where=total > 0)
+    
+    def snapshot(self) -> Optional[TemporalSnapshot]:
+        """选出bad占比变化最大的关键帧，并生成分段时序摘要"""
+        if self.total_frames == 0:
+            return None
+        frame_index, timestamps, counts = self._ordered()
+        first_index = frame_index[0]
+        
+        # 仍在计数窗口内的缩略帧，按时间排序
+        valid = np.nonzero(self.slot_frame_index >= first_index)[0]
+        valid = valid[np.argsort(self.slot_frame_index[valid])]
+        keyframes, keyframe_times = [], []
+        if len(valid) and self.config.temporal_keyframes > 0:
+            positions = self.slot_frame_index[valid] - first_index
+            # 每张缩略帧代表其与上一张之间的区间，用区间内累计计数求占比
+            cumulative = np.vstack([np.zeros((1, counts.shape[1]), dtype=np.int64), np.cumsum(counts, axis=0)])
+            bounds = np.concatenate([[0], positions + 1])
+            interval_counts = cumulative[bounds[1:]] - cumulative[bounds[:-1]]
+            ratios = self._bad_ratio(interval_counts)
+            changes = np.abs(np.diff(ratios, prepend=ratios[0]))
+            chosen = np.sort(np.argsort(-changes, kind='stable')[:self.config.temporal_keyframes])
+            for slot in valid[chosen]:
+                keyframes.append(self.frame_slots[slot])
+                keyframe_times.append(float(timestamps[self.slot_frame_index[slot] - first_index]))
+        
+        return TemporalSnapshot(
+            keyframes=keyframes,
+            keyframe_times=keyframe_times,
+            summary=self._summarize(timestamps, counts),
+            frame_count=len(frame_index),
+            duration=float(timestamps[-1] - timestamps[0])
+        )
+    
+    def _summarize(self, timestamps: np.ndarray, counts: np.ndarray) -> str:
+        """按时间分段汇总各类别平均数量和bad占比趋势"""
+        now = timestamps[-1]
+        segments = np.array_split(np.arange(len(timestamps)), min(self.config.temporal_segments, len(timestamps)))
+        lines, segment_ratios, segment_times = [], [], []
+        for segment in segments:
+            mean_counts = counts[segment].mean(axis=0)
+            ratio = float(self._bad_ratio(counts[segment].sum(axis=0)))
+            segment_ratios.append(ratio)
+            segment_times.append(float(timestamps[segment].mean()))
+            class_text = ", ".join(f"{self.class_names.get(class_id, str(class_id))} {value:.1f}"
+                                   for class_id, value in enumerate(mean_counts.tolist()))
+            lines.append(f"[{timestamps[segment[0]] - now:.0f}s ~ {timestamps[segment[-1]] - now:.0f}s] "
+                         f"平均数量: {class_text or '无'}; bad占比 {ratio:.0%}")
+        
+        if len(segment_ratios) >= 2 and segment_times[-1] > segment_times[0]:
+            slope = np.polyfit(np.asarray(segment_times) - segment_times[0], segment_ratios, 1)[0] * 60
+            trend = "上升" if slope > 0.02 else "下降" if slope < -0.02 else "平稳"
+            lines.append(f"bad占比趋势: {trend} (每分钟 {slope:+.1%})")
+        return "\n".join(lines)
+    
+    def clear(self):
+        """清空历史"""
+        self.__init__(self.config)
+    
+    def get_stats(self) -> dict:
+        """获取历史统计"""
+        frame_bytes = sum(frame.nbytes for frame in self.frame_slots if frame is not None)
+        return {
+            'history_frames': min(self.total_frames, self.capacity),
+            'history_memory_kb': round((self.timestamps.nbytes + self.counts.nbytes + frame_bytes) / 1024, 1)
+        }
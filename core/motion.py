@@ -0,0 +1,92 @@
+"""
+画面变化检测模块 - 静止画面跳过YOLO推理
+"""
+import cv2
+import numpy as np
+from typing import Optional
+from utils.image_hash import dhash, hamming_distance
+from config.config import Config
+
+class ChangeDetector:
+    """低成本画面变化检测器，与上一次推理帧比较
+    
+    should_infer 只做判断，调用方实际推理后调用 commit 才更新参考帧，
+    因此按检测间隔跳过的帧不会成为参考帧。
+    """
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.method = config.motion_method
+        self.reference_thumbnail: Optional[np.ndarray] = None
+        self.reference_hash: Optional[int] = None
+        # 最近一次 should_infer 计算的签名，commit 时成为参考
+        self.pending_signature = None
+        self.frames_since_inference = 0
+        self.last_score = 0.0
+        self.inferred_frames = 0
+        self.skipped_frames = 0
+    
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        """缩小并转为灰度图，INTER_AREA同时起到降噪作用"""
+        height, width = frame.shape[:2]
+        thumb_width = self.config.motion_downscale
+        thumb_height = max(1, int(height * thumb_width / width))
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, (thumb_width, thumb_height), interpolation=cv2.INTER_AREA)
+    
+    def should_infer(self, frame: np.ndarray) -> bool:
+        """判断当前帧相对上一次推理帧是否变化 (或到达强制刷新间隔)，不更新参考帧"""
+        forced = self.frames_since_inference >= self.config.motion_refresh_interval
+        
+        if self.method == "phash":
+            signature = dhash(frame)
+            if self.reference_hash is None:
+                changed = True
+                self.last_score = 0.0
+            else:
+                self.last_score = float(hamming_distance(signature, self.reference_hash))
+                changed = self.last_score > self.config.motion_hash_distance
+        else:
+            signature = self._thumbnail(frame)
+            if self.reference_thumbnail is None or self.reference_thumbnail.shape != signature.shape:
+                changed = True
+                self.last_score = 0.0
+            else:
+                self.last_score = float(cv2.absdiff(signature, self.reference_thumbnail).mean())
+                changed = self.last_score > self.config.motion_threshold
+        
+        self.pending_signature = signature
+        self.frames_since_inference += 1
+        if changed or forced:
+            return True
+        
+        self.skipped_frames += 1
+        return False
+    
+    def commit(self):
+        """上一次 should_infer 判断的帧已实际推理，将其作为新的参考帧"""
+        signature, self.pending_signature = self.pending_signature, None
+        if signature is None:
+            return
+        if self.method == "phash":
+            self.reference_hash = signature
+        else:
+            self.reference_thumbnail = signature
+        self.frames_since_inference = 0
+        self.inferred_frames += 1
+    
+    def reset(self):
+        """清除参考帧，下一帧必定推理"""
+        self.reference_thumbnail = None
+        self.reference_hash = None
+        self.pending_signature = None
+        self.frames_since_inference = 0
+    
+    def get_stats(self) -> dict:
+        """获取跳帧统计"""
+        total = self.inferred_frames + self.skipped_frames
+        return {
+            'inferred_frames': self.inferred_frames,
+            'skipped_frames': self.skipped_frames,
+            'skip_ratio': self.skipped_frames / total if total else 0.0
+        }
@@ -0,0 +1,159 @@
+"""
+VLM图像载荷构建模块 - 裁剪、缩放、拼图和字节预算内的编码
+"""
+import math
+import threading
+import time
+import cv2
+import numpy as np
+from typing import Optional, Tuple
+from models.data_models import DetectionInfo, ImagePayload
+from utils.logger import Logger
+from config.config import Config
+
+MIN_QUALITY = 40
+QUALITY_STEP = 10
+MIN_LONG_SIDE = 160
+DOWNSCALE_STEP = 0.75
+
+class PayloadBuilder:
+    """根据检测结果裁剪/缩放画面并在字节预算内编码"""
+    
+    def __init__(self, config: Config, logger: Logger):
+        self.config = config
+        self.logger = logger
+        self.turbo = self._init_turbojpeg() if config.payload_format in ("jpeg", "auto") else None
+        self.lock = threading.Lock()
+        self.payload_count = 0
+        self.total_bytes = 0
+        self.total_encode_time = 0.0
+        self.over_budget_count = 0
+    
+    def _init_turbojpeg(self):
+        """优先使用PyTurboJPEG，不可用时回退到OpenCV编码"""
+        try:
+            from turbojpeg import TurboJPEG
+            return TurboJPEG()
+        except Exception:
+            return None
+    
+    def build(self, frame: np.ndarray, detection_info: Optional[DetectionInfo]) -> ImagePayload:
+        """构建载荷: 拼图或裁剪 -> 限制长边 -> 字节预算内编码"""
+        start_time = time.perf_counter()
+        image = frame
+        has_boxes = detection_info is not None and not detection_info.is_empty()
+        if has_boxes and self.config.payload_mosaic_top_k > 0:
+            image = self._mosaic(frame, detection_info)
+        elif has_boxes and self.config.payload_crop:
+            image = self._crop_to_detections(frame, detection_info)
+        image = self._limit_long_side(image, self.config.payload_max_side)
+        
+        data, mime_type, quality, image = self._encode_within_budget(image)
+        payload = ImagePayload(
+            data=data,
+            mime_type=mime_type,
+            width=image.shape[1],
+            height=image.shape[0],
+            quality=quality,
+            encode_time=time.perf_counter() - start_time
+        )
+        
+        with self.lock:
+            self.payload_count += 1
+            self.total_bytes += payload.size
+            self.total_encode_time += payload.encode_time
+            if 0 < self.config.payload_max_bytes < payload.size:
+                self.over_budget_count += 1
+        return payload
+    
+    def _crop_to_detections(self, frame: np.ndarray, detection_info: DetectionInfo) -> np.ndarray:
+        """裁剪到所有检测框的外接矩形，四周按比例留边"""
+        height, width = frame.shape[:2]
+        boxes = detection_info.boxes
+        x1, y1 = boxes[:, 0].min(), boxes[:, 1].min()
+        x2, y2 = boxes[:, 2].max(), boxes[:, 3].max()
+        margin = self.config.payload_crop_margin * max(x2 - x1, y2 - y1, 1.0)
+        x1, y1 = max(0, int(x1 - margin)), max(0, int(y1 - margin))
+        x2, y2 = min(width, int(math.ceil(x2 + margin))), min(height, int(math.ceil(y2 + margin)))
+        if x2 <= x1 or y2 <= y1:
+            return frame
+        return frame[y1:y2, x1:x2]
+    
+    def _mosaic(self, frame: np.ndarray, detection_info: DetectionInfo) -> np.ndarray:
+        """将置信度最高的K个检测框裁剪后拼成网格图"""
+        tile = self.config.payload_mosaic_tile
+        order = np.argsort(-detection_info.confidences)[:self.config.payload_mosaic_top_k]
+        columns = int(math.ceil(math.sqrt(len(order))))
+        rows = int(math.ceil(len(order) / columns))
+        mosaic = np.full((rows * tile, columns * tile, 3), 114, dtype=np.uint8)
+        
+        height, width = frame.shape[:2]
+        boxes = detection_info.boxes[order]
+        for index, (x1, y1, x2, y2) in enumerate(boxes.tolist()):
+            # 每个裁剪块四周留边，保留铁屑周围的上下文
+            margin = self.config.payload_crop_margin * max(x2 - x1, y2 - y1, 1.0)
+            x1, y1 = max(0, int(x1 - margin)), max(0, int(y1 - margin))
+            x2, y2 = min(width, int(math.ceil(x2 + margin))), min(height, int(math.ceil(y2 + margin)))
+            if x2 <= x1 or y2 <= y1:
+                continue
+            crop = frame[y1:y2, x1:x2]
+            gain = tile / max(crop.shape[:2])
+            new_w, new_h = max(1, int(crop.shape[1] * gain)), max(1, int(crop.shape[0] * gain))
+            resized = cv2.resize(crop, (new_w, new_h), interpolation=cv2.INTER_AREA if gain < 1 else cv2.INTER_LINEAR)
+            row, column = divmod(index, columns)
+            top, left = row * tile + (tile - new_h) // 2, column * tile + (tile - new_w) // 2
+            mosaic[top:top + new_h, left:left + new_w] = resized
+        return mosaic
+    
+    @staticmethod
+    def _limit_long_side(image: np.ndarray, max_side: int) -> np.ndarray:
+        """等比缩小到长边不超过max_side，0表示不限制"""
+        long_side = max(image.shape[:2])
+        if max_side <= 0 or long_side <= max_side:
+            return image
+        gain = max_side / long_side
+        size = (max(1, int(round(image.shape[1] * gain))), max(1, int(round(image.shape[0] * gain))))
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    
+    def _encode(self, image: np.ndarray, image_format: str, quality: int) -> Tuple[bytes, str]:
+        if image_format == "webp":
+            success, buffer = cv2.imencode('.webp', image, [cv2.IMWRITE_WEBP_QUALITY, quality])
+            mime_type = "image/webp"
+        elif self.turbo is not None:
+            return self.turbo.encode(np.ascontiguousarray(image), quality=quality), "image/jpeg"
+        else:
+            success, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            mime_type = "image/jpeg"
+        
+        if not success:
+            raise Exception("图像编码失败")
+        return buffer.tobytes(), mime_type
+    
+    def _encode_within_budget(self, image: np.ndarray) -> Tuple[bytes, str, int, np.ndarray]:
+        """先降低质量、再缩小尺寸，直到满足payload_max_bytes (0表示不限制)"""
+        budget = self.config.payload_max_bytes
+        formats = ("jpeg", "webp") if self.config.payload_format == "auto" else (self.config.payload_format,)
+        quality = self.config.jpeg_quality
+        while True:
+            # auto模式下两种编码都尝试，取较小者
+            data, mime_type = min((self._encode(image, f, quality) for f in formats), key=lambda item: len(item[0]))
+            if budget <= 0 or len(data) <= budget:
+                return data, mime_type, quality, image
+            if quality > MIN_QUALITY:
+                quality = max(MIN_QUALITY, quality - QUALITY_STEP)
+                continue
+            if max(image.shape[:2]) <= MIN_LONG_SIDE:
+                self.logger.warning(f"图像载荷无法压缩到{budget}字节以内 (当前{len(data)}字节)")
+                return data, mime_type, quality, image
+            image = self._limit_long_side(image, int(max(image.shape[:2]) * DOWNSCALE_STEP))
+    
+    def get_stats(self) -> dict:
+        """获取载荷统计"""
+        with self.lock:
+            count = self.payload_count
+            return {
+                'payload_count': count,
+                'avg_payload_kb': round(self.total_bytes / count / 1024, 1) if count else 0.0,
+                'avg_encode_ms': round(self.total_encode_time / count * 1000, 2) if count else 0.0,
+                'payload_over_budget': self.over_budget_count
+            }
@@ -0,0 +1,436 @@
+"""
+多进程流水线模块 - 采集、检测与渲染/分析分属不同进程，帧经共享内存传递
+"""
+import multiprocessing as mp
+import queue
+import signal
+import time
+import cv2
+import numpy as np
+from typing import Optional
+from models.data_models import DetectionInfo, FramePacket
+from utils.logger import Logger
+from utils.performance import StageTracer
+from config.config import Config
+from core.detector import YOLODetector
+from core.motion import ChangeDetector
+from core.tracker import MultiObjectTracker
+from core.shared_ring import SharedFrameRing
+from core.sources import create_frame_source
+
+END_OF_STREAM = "end_of_stream"
+START_TIMEOUT = 60.0
+
+def _put(target: mp.Queue, item, stop_event) -> bool:
+    """阻塞写入队列 (背压)，收到停止信号时放弃"""
+    while not stop_event.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(source: mp.Queue, stop_event):
+    """阻塞读取队列，收到停止信号时返回None"""
+    while not stop_event.is_set():
+        try:
+            return source.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+
+def _copy_into(slot: np.ndarray, frame: np.ndarray):
+    """将帧写入槽位，分辨率变化时缩放到槽位尺寸"""
+    if frame.shape != slot.shape:
+        frame = cv2.resize(frame, (slot.shape[1], slot.shape[0]))
+    np.copyto(slot, frame)
+
+
+class DetectionStage:
+    """检测阶段: 画面变化门控、按检测间隔推理、中间帧跟踪外推 (与单进程模式逻辑一致)"""
+    
+    def __init__(self, config: Config, logger: Logger):
+        self.config = config
+        self.tracer = StageTracer(config.stage_tracing)
+        self.detector = YOLODetector(config, logger, self.tracer)
+        self.change_detector = ChangeDetector(config) if config.motion_gating else None
+        self.tracker = MultiObjectTracker(config) if config.tracking_enabled else None
+        self.last_info: Optional[DetectionInfo] = None
+        self.frames_since_detection = 0
+        self.detector_calls = 0
+        self.detect_time_total = 0.0
+    
+    def process(self, frame: np.ndarray) -> Optional[DetectionInfo]:
+        """返回该帧的检测结果"""
+        if self.change_detector is not None:
+            changed = self.change_detector.should_infer(frame)
+            if not changed and self.last_info is not None:
+                return self.last_info
+        
+        self.frames_since_detection += 1
+        run_detector = (self.last_info is None
+                        or self.frames_since_detection >= self.config.detection_stride)
+        if run_detector:
+            self.frames_since_detection = 0
+            self.detector_calls += 1
+            if self.change_detector is not None:
+                self.change_detector.commit()
+            start_time = time.perf_counter()
+            _, detection_info = self.detector.detect(frame, annotate=False)
+            self.detect_time_total += time.perf_counter() - start_time
+            if self.tracker is not None:
+                detection_info = self.tracker.update(detection_info)
+        elif self.tracker is not None:
+            detection_info = self.tracker.predict()
+        else:
+            return self.last_info
+        
+        self.last_info = detection_info
+        return detection_info
+    
+    def apply_settings(self, settings: dict):
+        """应用主进程自适应控制器下发的档位 (image_size、detection_stride)"""
+        for key, value in settings.items():
+            setattr(self.config, key, value)
+    
+    def get_stats(self) -> dict:
+        """获取检测阶段统计"""
+        stats = {
+            'detector_calls': self.detector_calls,
+            'avg_detect_ms': round(self.detect_time_total / self.detector_calls * 1000, 2)
+            if self.detector_calls else 0.0
+        }
+        if self.change_detector is not None:
+            stats.update(self.change_detector.get_stats())
+        if self.tracker is not None:
+            stats.update(self.tracker.get_stats())
+        stats['detect_stages'] = self.tracer.get_stats()
+        return stats
+
+
+def _capture_worker(config: Config, spec_queue, free_slots, frame_queue, stats_queue, log_queue, stop_event):
+    """采集进程: 帧直接读入空闲共享内存槽位，槽位号发往检测进程"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logger = Logger.from_config(config, log_queue=log_queue)
+    source = create_frame_source(config, logger)
+    ring = None
+    sequence = 0
+    dropped = 0
+    try:
+        if not source.open():
+            spec_queue.put(None)
+            return
+        source.configure()
+        success, first_frame = source.read()
+        if not success:
+            logger.error("无法从帧源读取第一帧")
+            spec_queue.put(None)
+            return
+        
+        ring = SharedFrameRing(first_frame.shape, first_frame.dtype, config.pipeline_slots)
+        for slot in range(ring.slots):
+            free_slots.put(slot)
+        spec_queue.put((ring.spec, source.get_fps(), source.get_backend_name()))
+        
+        # 实时帧源在下游跟不上时丢弃新帧，避免驱动缓冲堆积带来延迟；文件帧源阻塞等待，保证不丢帧
+        drop_when_full = config.source_type in ("camera", "stream")
+        pending = first_frame
+        failures = 0
+        while not stop_event.is_set():
+            if drop_when_full and pending is None:
+                try:
+                    slot = free_slots.get_nowait()
+                except queue.Empty:
+                    success, _ = source.read()
+                    if success:
+                        dropped += 1
+                    elif source.finished:
+                        break
+                    else:
+                        time.sleep(0.005)
+                    continue
+            else:
+                slot = _get(free_slots, stop_event)
+                if slot is None:
+                    break
+            
+            view = ring.view(slot)
+            if pending is not None:
+                success, frame = True, pending
+                pending = None
+            else:
+                success, frame = source.read(view)
+            if success and frame is not None and frame is not view:
+                _copy_into(view, frame)
+            
+            if not success or frame is None:
+                free_slots.put(slot)
+                if source.finished:
+                    logger.info("帧源已播放完毕，采集进程退出")
+                    break
+                failures += 1
+                if failures >= 30:
+                    logger.error(f"连续{failures}次读取帧失败，采集进程退出")
+                    break
+                time.sleep(0.005)
+                continue
+            
+            failures = 0
+            sequence += 1
+            if not _put(frame_queue, (slot, sequence, time.time(), dropped), stop_event):
+                break
+    except Exception as e:
+        logger.error(f"采集进程异常: {e}")
+        spec_queue.put(None)
+    finally:
+        _put(frame_queue, END_OF_STREAM, stop_event)
+        if stop_event.is_set():
+            # 停止时下游不再读取，放弃未写出的数据以免退出时阻塞；正常结束时需等待 END_OF_STREAM 写出
+            frame_queue.cancel_join_thread()
+        source.release()
+        if ring is not None:
+            ring.close()
+        stats_queue.put({'captured_frames': sequence, 'dropped_frames': dropped})
+
+
+def _detect_worker(config: Config, spec: tuple, free_slots, frame_queue, result_queue, control_queue,
+                   stats_queue, log_queue, stop_event):
+    """检测进程: 直接在共享内存视图上推理，只把检测结果发往主进程"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logger = Logger.from_config(config, log_queue=log_queue)
+    ring = SharedFrameRing.attach(spec)
+    stage = None
+    try:
+        stage = DetectionStage(config, logger)
+        while not stop_event.is_set():
+            item = _get(frame_queue, stop_event)
+            if item is None:
+                break
+            if item == END_OF_STREAM:
+                _put(result_queue, END_OF_STREAM, stop_event)
+                break
+            slot, sequence, timestamp, dropped = item
+            while True:
+                try:
+                    stage.apply_settings(control_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                detection_info = stage.process(ring.view(slot))
+            except Exception as e:
+                logger.error(f"检测进程推理失败: {e}")
+                detection_info = None
+            if not _put(result_queue, (slot, sequence, timestamp, dropped, detection_info), stop_event):
+                break
+    except Exception as e:
+        logger.error(f"检测进程异常: {e}")
+    finally:
+        if stop_event.is_set():
+            result_queue.cancel_join_thread()
+        ring.close()
+        stats_queue.put(stage.get_stats() if stage is not None else {})
+
+
+class ProcessPipeline:
+    """多进程流水线，接口与 CameraManager 一致
+    
+    采集进程 → 检测进程 → 主进程(渲染/分析)。帧存放在共享内存槽位中，
+    各阶段之间只传递槽位号和检测结果；空闲槽位队列提供背压，
+    主进程读取下一帧时归还上一帧的槽位，因此返回的帧同样只在下一次读取前有效。
+    """
+    
+    def __init__(self, config: Config, logger: Logger):
+        self.config = config
+        self.logger = logger
+        self.context = mp.get_context("spawn")
+        self.stop_event = self.context.Event()
+        self.spec_queue = self.context.Queue()
+        self.stats_queue = self.context.Queue()
+        self.free_slots = self.context.Queue()
+        self.frame_queue = self.context.Queue(maxsize=config.pipeline_slots)
+        self.result_queue = self.context.Queue(maxsize=config.pipeline_slots)
+        self.control_queue = self.context.Queue()
+        # 子进程日志经此队列由主进程写出
+        self.log_queue = self.context.Queue()
+        self.log_listener = None
+        self.processes = []
+        self.detect_process = None
+        self.ring: Optional[SharedFrameRing] = None
+        self.held_slot: Optional[int] = None
+        self.source_fps = 0.0
+        self.source_backend = "Unknown"
+        self.frame_width = 0
+        self.frame_height = 0
+        self.is_initialized = False
+        self.finished = False
+        self.first_packet = True
+        self.consumed_sequence = 0
+        self.dropped_frames = 0
+        self.worker_stats = {}
+    
+    def initialize(self) -> bool:
+        """启动采集进程，挂载其共享内存后启动检测进程"""
+        try:
+            self.log_listener = Logger.listen(self.log_queue)
+            self._start_process(_capture_worker, "CaptureProcess",
+                                (self.config, self.spec_queue, self.free_slots, self.frame_queue,
+                                 self.stats_queue, self.log_queue, self.stop_event))
+            try:
+                result = self.spec_queue.get(timeout=START_TIMEOUT)
+            except queue.Empty:
+                result = None
+            if result is None:
+                self.logger.error("采集进程初始化失败")
+                self.release()
+                return False
+            
+            spec, self.source_fps, self.source_backend = result
+            self.ring = SharedFrameRing.attach(spec)
+            self.frame_height, self.frame_width = self.ring.shape[:2]
+            self.detect_process = self._start_process(
+                _detect_worker, "DetectProcess",
+                (self.config, spec, self.free_slots, self.frame_queue, self.result_queue,
+                 self.control_queue, self.stats_queue, self.log_queue, self.stop_event)
+            )
+            self.is_initialized = True
+            self.logger.info(f"多进程流水线已启动 ({self.config.source_type}) - 分辨率: "
+                             f"{self.frame_width}x{self.frame_height}, 共享内存槽位: {self.ring.slots}")
+            return True
+        except Exception as e:
+            self.logger.error(f"多进程流水线初始化异常: {e}")
+            self.release()
+            return False
+    
+    def _start_process(self, target, name: str, args: tuple):
+        process = self.context.Process(target=target, name=name, args=args, daemon=True)
+        process.start()
+        self.processes.append(process)
+        return process
+    
+    def _has_failed(self) -> bool:
+        """检测进程退出或任一子进程异常退出 (采集进程在发出 END_OF_STREAM 后正常退出不算失败)"""
+        if self.detect_process is not None and not self.detect_process.is_alive():
+            return True
+        return any(process.exitcode not in (None, 0) for process in self.processes)
+    
+    def _release_held(self):
+        """归还主进程持有的槽位"""
+        if self.held_slot is not None:
+            self.free_slots.put(self.held_slot)
+            self.held_slot = None
+    
+    def read_packet(self, timeout: float = 1.0) -> Optional[FramePacket]:
+        """读取下一帧及其检测结果 (packet.detection_info)，首帧等待检测进程加载模型
+        
+        检测较慢时等待超时也返回None，此时 is_alive() 为True，调用方应继续读取。
+        """
+        if not self.is_initialized or self.finished:
+            return None
+        self._release_held()
+        
+        deadline = time.monotonic() + (START_TIMEOUT if self.first_packet else timeout)
+        while True:
+            try:
+                item = self.result_queue.get(timeout=min(0.1, max(0.0, deadline - time.monotonic())))
+                break
+            except queue.Empty:
+                if self._has_failed():
+                    # 子进程退出前写出的结果 (包括 END_OF_STREAM) 仍可能在管道中
+                    try:
+                        item = self.result_queue.get(timeout=0.5)
+                        break
+                    except queue.Empty:
+                        self.logger.error("流水线子进程已退出")
+                        return None
+                if time.monotonic() >= deadline:
+                    return None
+        
+        if item == END_OF_STREAM:
+            self.finished = True
+            return None
+        slot, sequence, timestamp, dropped, detection_info = item
+        self.first_packet = False
+        self.held_slot = slot
+        self.consumed_sequence = sequence
+        self.dropped_frames = dropped
+        return FramePacket(frame=self.ring.view(slot), sequence=sequence, timestamp=timestamp,
+                           dropped_frames=dropped, detection_info=detection_info)
+    
+    def apply_settings(self, settings: dict):
+        """将自适应档位转发给检测进程 (子进程持有各自的配置副本)"""
+        if self.is_initialized:
+            self.control_queue.put(settings)
+    
+    def is_alive(self) -> bool:
+        """子进程仍在运行，read_packet 返回None只表示检测结果暂未就绪"""
+        return self.is_initialized and not self.finished and not self._has_failed()
+    
+    def is_finished(self) -> bool:
+        """有限帧源是否已播放完毕"""
+        return self.finished
+    
+    def get_frame_size(self):
+        """获取帧尺寸"""
+        return self.frame_width, self.frame_height
+    
+    def get_camera_info(self) -> dict:
+        """获取帧源信息"""
+        if not self.is_initialized:
+            return {}
+        return {
+            'width': self.frame_width,
+            'height': self.frame_height,
+            'source_type': self.config.source_type,
+            'fps': self.source_fps,
+            'backend': self.source_backend,
+            'pipeline': 'process',
+            'pipeline_slots': self.ring.slots
+        }
+    
+    def get_stats(self) -> dict:
+        """获取流水线统计 (子进程统计在释放后汇总)"""
+        stats = {
+            'captured_frames': self.consumed_sequence,
+            'consumed_sequence': self.consumed_sequence,
+            'dropped_frames': self.dropped_frames
+        }
+        stats.update(self.worker_stats)
+        return stats
+    
+    def release(self):
+        """通知各进程停止并等待退出，最后释放共享内存"""
+        self.stop_event.set()
+        self._release_held()
+        # 排空结果队列，避免子进程阻塞在写入上
+        while True:
+            try:
+                self.result_queue.get_nowait()
+            except queue.Empty:
+                break
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                self.logger.warning(f"{process.name} 未能按时退出，强制结束")
+                process.terminate()
+                process.join(timeout=1)
+        for _ in self.processes:
+            try:
+                self.worker_stats.update(self.stats_queue.get(timeout=1.0))
+            except queue.Empty:
+                break
+        self.processes = []
+        self.detect_process = None
+        if self.log_listener is not None:
+            # 子进程已退出，写出队列中剩余的日志
+            self.log_listener.stop()
+            self.log_listener = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring.unlink()
+            self.ring = None
+        if self.is_initialized:
+            self.is_initialized = False
+            self.logger.info("多进程流水线已停止，共享内存已释放")
@@ -0,0 +1,198 @@
+"""
+无界面预览服务模块 - MJPEG视频流和JSON状态接口
+"""
+import json
+import threading
+import time
+import cv2
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+from utils.logger import Logger
+from config.config import Config
+
+BOUNDARY = "frame"
+INDEX_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Realtime VLM Preview</title></head>
+<body style="margin:0;background:#111;color:#eee;font-family:sans-serif">
+<img src="/stream" style="max-width:100%">
+<pre id="status"></pre>
+<script>
+setInterval(function () {
+  fetch('/status').then(function (r) { return r.json(); }).then(function (s) {
+    document.getElementById('status').textContent = JSON.stringify(s, null, 2);
+  });
+}, 1000);
+</script>
+</body></html>
+"""
+
+class PreviewServer:
+    """内置HTTP预览服务
+    
+    /stream 为 multipart/x-mixed-replace MJPEG 流，/status 返回JSON状态，POST /record 手动触发录像。
+    仅在有客户端连接时编码JPEG；每个客户端只发送最新一帧，跟不上的帧直接丢弃。
+    """
+    
+    def __init__(self, config: Config, logger: Logger):
+        self.config = config
+        self.logger = logger
+        self.status_provider: Optional[Callable[[], dict]] = None
+        self.record_handler: Optional[Callable[[str], bool]] = None
+        self.condition = threading.Condition()
+        self.latest_jpeg: Optional[bytes] = None
+        self.latest_sequence = 0
+        self.last_encode_time = 0.0
+        self.client_count = 0
+        self.encoded_frames = 0
+        self.sent_frames = 0
+        self.dropped_frames = 0
+        self.closed = False
+        self.thread: Optional[threading.Thread] = None
+        self.httpd: Optional[ThreadingHTTPServer] = None
+    
+    def start(self):
+        """绑定端口并在后台线程中启动HTTP服务 (端口被占用时抛出OSError)"""
+        self.httpd = ThreadingHTTPServer((self.config.preview_host, self.config.preview_port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True, name="PreviewServer")
+        self.thread.start()
+        host, port = self.httpd.server_address[:2]
+        self.logger.info(f"预览服务已启动: http://{host}:{port}/ (视频流 /stream, 状态 /status)")
+    
+    def set_status_provider(self, provider: Callable[[], dict]):
+        """设置状态接口的数据来源"""
+        self.status_provider = provider
+    
+    def set_record_handler(self, handler: Callable[[str], bool]):
+        """设置手动录像触发的回调"""
+        self.record_handler = handler
+    
+    def has_clients(self) -> bool:
+        return self.client_count > 0
+    
+    def publish(self, frame: np.ndarray):
+        """发布一帧，无客户端或超过预览帧率时直接返回"""
+        if self.client_count == 0:
+            return
+        now = time.perf_counter()
+        if self.config.preview_max_fps > 0 and now - self.last_encode_time < 1.0 / self.config.preview_max_fps:
+            return
+        self.last_encode_time = now
+        
+        success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.config.preview_jpeg_quality])
+        if not success:
+            return
+        with self.condition:
+            self.latest_jpeg = buffer.tobytes()
+            self.latest_sequence += 1
+            self.encoded_frames += 1
+            self.condition.notify_all()
+    
+    def _wait_for_frame(self, last_sequence: int, timeout: float = 1.0):
+        """等待比last_sequence更新的一帧，返回 (序号, JPEG数据)"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.closed or self.latest_sequence > last_sequence, timeout=timeout)
+            return self.latest_sequence, self.latest_jpeg
+    
+    def _status(self) -> dict:
+        status = self.status_provider() if self.status_provider is not None else {}
+        status['preview'] = self.get_stats()
+        return status
+    
+    def _handler_class(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0].rstrip("/")
+                if path == "":
+                    self._send(200, "text/html; charset=utf-8", INDEX_HTML.encode("utf-8"))
+                elif path == "/status":
+                    try:
+                        body = json.dumps(server._status(), ensure_ascii=False, default=str)
+                    except Exception as e:
+                        self._send(500, "application/json", json.dumps({"error": str(e)}).encode("utf-8"))
+                        return
+                    self._send(200, "application/json; charset=utf-8", body.encode("utf-8"))
+                elif path == "/stream":
+                    self._stream()
+                else:
+                    self._send(404, "text/plain", b"not found")
+            
+            def do_POST(self):
+                path = self.path.split("?", 1)[0].rstrip("/")
+                if path == "/record" and server.record_handler is not None:
+                    triggered = server.record_handler(f"手动 (HTTP {self.client_address[0]})")
+                    body = json.dumps({"triggered": triggered}).encode("utf-8")
+                    self._send(200, "application/json", body)
+                else:
+                    self._send(404, "text/plain", b"not found")
+            
+            def _send(self, status: int, content_type: str, body: bytes):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def _stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                with server.condition:
+                    server.client_count += 1
+                server.logger.info(f"预览客户端已连接: {self.client_address[0]} (当前 {server.client_count} 个)")
+                
+                last_sequence = server.latest_sequence
+                try:
+                    while not server.closed:
+                        sequence, jpeg = server._wait_for_frame(last_sequence)
+                        if jpeg is None or sequence == last_sequence:
+                            continue
+                        # 两次发送之间产生的帧对该客户端直接丢弃
+                        with server.condition:
+                            server.dropped_frames += max(0, sequence - last_sequence - 1)
+                            server.sent_frames += 1
+                        last_sequence = sequence
+                        self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                         f"Content-Length: {len(jpeg)}\r\n\r\n".encode("ascii"))
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b"\r\n")
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+                    pass
+                finally:
+                    with server.condition:
+                        server.client_count -= 1
+                    server.logger.info(f"预览客户端已断开: {self.client_address[0]}")
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+    
+    def get_stats(self) -> dict:
+        """获取预览统计"""
+        with self.condition:
+            return {
+                'preview_clients': self.client_count,
+                'preview_encoded_frames': self.encoded_frames,
+                'preview_sent_frames': self.sent_frames,
+                'preview_dropped_frames': self.dropped_frames
+            }
+    
+    def stop(self):
+        """停止服务并断开所有客户端"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.httpd is None:
+            return
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join(timeout=3)
+        self.logger.info("预览服务已停止")
@@ -0,0 +1,264 @@
+"""
+事件录像模块 - 预录环形缓冲与后台写盘
+"""
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import cv2
+import numpy as np
+from typing import Deque, List, Optional, Tuple
+from models.data_models import DetectionInfo
+from utils.logger import Logger
+from config.config import Config
+
+# 未能从预录帧估计帧率时使用的默认值
+DEFAULT_FPS = 15.0
+
+class ClipRecorder:
+    """触发式录像器
+    
+    主循环只把缩小后的帧放入定长队列 (队列满时丢帧，从不等待)。
+    压缩线程将其编码为JPEG存入预录环形缓冲，按 record_pre_seconds 和内存上限淘汰最旧的帧；
+    触发后把预录帧和之后 record_post_seconds 内的帧交给写盘线程解码并写入视频文件。
+    预录缓冲与待写帧的字节数合计不超过 record_buffer_max_mb，写盘跟不上时丢弃录像帧。
+    """
+    
+    STOP_TIMEOUT = 30.0
+    
+    def __init__(self, config: Config, logger: Logger):
+        self.config = config
+        self.logger = logger
+        self.max_bytes = int(config.record_buffer_max_mb * 1024 * 1024)
+        self.frame_queue: queue.Queue = queue.Queue(maxsize=config.record_queue_size)
+        self.write_queue: queue.Queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending_reasons: List[str] = []
+        # 以下由压缩线程独占
+        self.preroll: Deque[Tuple[float, bytes]] = deque()
+        self.preroll_bytes = 0
+        self.clip_active = False
+        self.clip_started = 0.0
+        self.clip_until = 0.0
+        self.clip_reasons: List[str] = []
+        # 待写帧字节数，压缩线程增加、写盘线程减少
+        self.pending_write_bytes = 0
+        self.last_bad_count = 0
+        self.last_analysis_text = ""
+        self.running = False
+        self.encode_thread: Optional[threading.Thread] = None
+        self.write_thread: Optional[threading.Thread] = None
+        self.pushed_frames = 0
+        self.encoded_frames = 0
+        self.dropped_frames = 0
+        self.clip_dropped_frames = 0
+        self.trigger_count = 0
+        self.clips_written = 0
+        self.write_failures = 0
+    
+    def start(self):
+        """启动压缩和写盘线程"""
+        os.makedirs(self.config.record_dir, exist_ok=True)
+        self.running = True
+        self.encode_thread = threading.Thread(target=self._encode_loop, daemon=True, name="ClipEncoder")
+        self.write_thread = threading.Thread(target=self._write_loop, daemon=True, name="ClipWriter")
+        self.encode_thread.start()
+        self.write_thread.start()
+        self.logger.info(f"事件录像已启动: 预录 {self.config.record_pre_seconds}s, "
+                         f"后录 {self.config.record_post_seconds}s, 内存上限 {self.config.record_buffer_max_mb}MB, "
+                         f"输出目录 {self.config.record_dir}")
+    
+    def push(self, frame: np.ndarray, detection_info: Optional[DetectionInfo]):
+        """提交一帧 (在主循环中调用)，检查bad数量触发条件后缩小入队，队列满时直接丢弃"""
+        threshold = self.config.record_bad_threshold
+        if threshold > 0:
+            bad_count = detection_info.counts.get("bad", 0) if detection_info is not None else 0
+            # 仅在数量越过阈值时触发一次，持续超过阈值不重复触发
+            if bad_count >= threshold > self.last_bad_count:
+                self.trigger(f"bad数量 {bad_count} >= {threshold}")
+            self.last_bad_count = bad_count
+        
+        self.pushed_frames += 1
+        if self.frame_queue.full():
+            self.dropped_frames += 1
+            return
+        try:
+            self.frame_queue.put_nowait((time.monotonic(), self._downscale(frame)))
+        except queue.Full:
+            self.dropped_frames += 1
+    
+    def observe_analysis(self, text: str):
+        """分析结果中新出现关键词时触发 (流式模式下对逐步增长的文本同样适用)"""
+        if text == self.last_analysis_text:
+            return
+        keyword = next((word for word in self.config.record_keywords if word in text), None)
+        if keyword is not None and keyword not in self.last_analysis_text:
+            self.trigger(f"分析关键词 '{keyword}'")
+        self.last_analysis_text = text
+    
+    def trigger(self, reason: str) -> bool:
+        """请求录像 (线程安全)，录像进行中时延长后录时间"""
+        if not self.running:
+            return False
+        with self.lock:
+            self.pending_reasons.append(reason)
+            self.trigger_count += 1
+        self.logger.info(f"录像触发: {reason}")
+        return True
+    
+    def _downscale(self, frame: np.ndarray) -> np.ndarray:
+        """缩小到 record_max_side，同时得到与采集缓冲区无关的副本"""
+        max_side = self.config.record_max_side
+        long_side = max(frame.shape[:2])
+        if max_side <= 0 or long_side <= max_side:
+            return frame.copy()
+        gain = max_side / long_side
+        size = (int(round(frame.shape[1] * gain)), int(round(frame.shape[0] * gain)))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    
+    def _encode_loop(self):
+        """压缩线程: JPEG编码、维护预录缓冲、处理触发"""
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.config.record_jpeg_quality]
+        while self.running or not self.frame_queue.empty():
+            try:
+                timestamp, frame = self.frame_queue.get(timeout=0.1)
+            except queue.Empty:
+                frame = None
+            
+            try:
+                if frame is not None:
+                    success, buffer = cv2.imencode('.jpg', frame, params)
+                    if success:
+                        self.encoded_frames += 1
+                        self._append(timestamp, buffer.tobytes())
+                self._process_triggers()
+                if self.clip_active and time.monotonic() >= self.clip_until:
+                    self._close_clip()
+            except Exception as e:
+                self.logger.error(f"录像压缩失败: {e}")
+        
+        # 退出时结束进行中的录像，后录时间不足也保留已有帧
+        if self.clip_active:
+            self._close_clip()
+        self.write_queue.put(('stop', None))
+    
+    def _append(self, timestamp: float, jpeg: bytes):
+        self.preroll.append((timestamp, jpeg))
+        self.preroll_bytes += len(jpeg)
+        if self.clip_active:
+            self._enqueue_frame(jpeg)
+        # 按预录时长和内存上限淘汰最旧的帧
+        while self.preroll and (timestamp - self.preroll[0][0] > self.config.record_pre_seconds
+                                or self.preroll_bytes + self.pending_write_bytes > self.max_bytes):
+            self.preroll_bytes -= len(self.preroll.popleft()[1])
+    
+    def _enqueue_frame(self, jpeg: bytes):
+        """交给写盘线程，待写字节超过内存上限时丢弃该帧"""
+        with self.lock:
+            if self.pending_write_bytes + len(jpeg) > self.max_bytes:
+                self.clip_dropped_frames += 1
+                return
+            self.pending_write_bytes += len(jpeg)
+        self.write_queue.put(('frame', jpeg))
+    
+    def _process_triggers(self):
+        with self.lock:
+            reasons, self.pending_reasons = self.pending_reasons, []
+        if not reasons:
+            return
+        now = time.monotonic()
+        if not self.clip_active:
+            self._open_clip(now)
+        self.clip_reasons.extend(reasons)
+        self.clip_until = min(now + self.config.record_post_seconds,
+                              self.clip_started + self.config.record_max_clip_seconds)
+    
+    def _open_clip(self, now: float):
+        frames = list(self.preroll)
+        fps = DEFAULT_FPS
+        if len(frames) >= 2 and frames[-1][0] > frames[0][0]:
+            fps = (len(frames) - 1) / (frames[-1][0] - frames[0][0])
+        name = datetime.now().strftime("clip_%Y%m%d_%H%M%S_%f")[:-3] + ".mp4"
+        self.write_queue.put(('open', (os.path.join(self.config.record_dir, name), fps)))
+        self.clip_active = True
+        self.clip_started = now
+        self.clip_reasons = []
+        for _, jpeg in frames:
+            self._enqueue_frame(jpeg)
+    
+    def _close_clip(self):
+        self.write_queue.put(('close', list(self.clip_reasons)))
+        self.clip_active = False
+    
+    def _write_loop(self):
+        """写盘线程: 解码JPEG并写入视频文件"""
+        path, fps = "", DEFAULT_FPS
+        writer: Optional[cv2.VideoWriter] = None
+        size: Optional[Tuple[int, int]] = None
+        failed = False
+        frames = 0
+        while True:
+            op, data = self.write_queue.get()
+            if op == 'stop':
+                break
+            try:
+                if op == 'open':
+                    (path, fps), writer, size, failed, frames = data, None, None, False, 0
+                elif op == 'frame':
+                    with self.lock:
+                        self.pending_write_bytes -= len(data)
+                    if failed:
+                        continue
+                    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                    if writer is None:
+                        size = (image.shape[1], image.shape[0])
+                        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+                        if not writer.isOpened():
+                            raise IOError(f"无法创建视频文件 {path}")
+                    if (image.shape[1], image.shape[0]) != size:
+                        image = cv2.resize(image, size)
+                    writer.write(image)
+                    frames += 1
+                elif op == 'close':
+                    if writer is not None:
+                        writer.release()
+                        writer = None
+                    if not failed and frames:
+                        self.clips_written += 1
+                        self.logger.info(f"录像已保存: {path} ({frames}帧, {frames / fps:.1f}s, "
+                                         f"触发: {'; '.join(data)})")
+            except Exception as e:
+                failed = True
+                self.write_failures += 1
+                self.logger.error(f"录像写入失败: {e}")
+                if writer is not None:
+                    writer.release()
+                    writer = None
+        if writer is not None:
+            writer.release()
+    
+    def get_stats(self) -> dict:
+        """获取录像统计"""
+        with self.lock:
+            pending_write_bytes = self.pending_write_bytes
+        return {
+            'record_pushed_frames': self.pushed_frames,
+            'record_encoded_frames': self.encoded_frames,
+            'record_dropped_frames': self.dropped_frames,
+            'record_clip_dropped_frames': self.clip_dropped_frames,
+            'record_triggers': self.trigger_count,
+            'record_clips': self.clips_written,
+            'record_write_failures': self.write_failures,
+            'record_buffer_mb': round((self.preroll_bytes + pending_write_bytes) / 1024 / 1024, 2)
+        }
+    
+    def stop(self):
+        """停止录像，等待进行中的录像写完"""
+        self.running = False
+        if self.encode_thread is not None:
+            self.encode_thread.join(timeout=3)
+        if self.write_thread is not None:
+            self.write_thread.join(timeout=self.STOP_TIMEOUT)
+        self.logger.info("事件录像已停止")
@@ -0,0 +1,114 @@
+"""
+渲染线程模块 - 将检测框绘制、覆盖层合成和显示移出推理线程
+"""
+import threading
+import time
+import numpy as np
+from typing import Callable, Optional
+from models.data_models import DetectionInfo
+from utils.logger import Logger
+from utils.performance import NULL_TRACER, StageTracer
+from core.display import DisplayManager
+
+class RenderThread:
+    """独立渲染线程
+    
+    推理线程只提交最新的 (帧, 检测结果)，渲染线程取最新一份完成绘制和显示，
+    来不及渲染的中间帧直接丢弃，推理帧率不再受显示开销影响。
+    窗口模式下 cv2.imshow 与 cv2.waitKey 都在本线程调用，按键通过 poll_key 转交主线程。
+    """
+    
+    def __init__(self, display_manager: DisplayManager,
+                 annotate: Callable[[np.ndarray, Optional[DetectionInfo]], np.ndarray],
+                 status_provider: Callable[[], tuple], logger: Logger,
+                 tracer: Optional[StageTracer] = None):
+        self.display_manager = display_manager
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+        self.annotate = annotate
+        # 返回 (分析状态文本, 当前分析结果, 是否正在分析)
+        self.status_provider = status_provider
+        self.logger = logger
+        self.condition = threading.Condition()
+        self.pending: Optional[tuple] = None
+        self.last_key = -1
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        self.submitted_frames = 0
+        self.rendered_frames = 0
+        self.dropped_frames = 0
+        self.render_time_total = 0.0
+    
+    def start(self):
+        """启动渲染线程"""
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True, name="RenderThread")
+        self.thread.start()
+    
+    def submit(self, frame: np.ndarray, detection_info: Optional[DetectionInfo], fps: float):
+        """提交最新一帧，覆盖尚未渲染的上一帧 (frame需为调用方不再修改的副本)"""
+        with self.condition:
+            if self.pending is not None:
+                self.dropped_frames += 1
+            self.pending = (frame, detection_info, fps)
+            self.submitted_frames += 1
+            self.condition.notify()
+    
+    def poll_key(self) -> int:
+        """取出渲染线程读到的按键，无按键返回-1"""
+        with self.condition:
+            key, self.last_key = self.last_key, -1
+            return key
+    
+    def _run(self):
+        """渲染循环"""
+        while self.running:
+            with self.condition:
+                self.condition.wait_for(lambda: not self.running or self.pending is not None, timeout=0.03)
+                item, self.pending = self.pending, None
+            
+            if item is not None:
+                start_time = time.perf_counter()
+                try:
+                    self._render(*item)
+                except Exception as e:
+                    self.logger.error(f"渲染失败: {e}")
+                self.render_time_total += time.perf_counter() - start_time
+                self.rendered_frames += 1
+            
+            # 窗口模式下无新帧时也需要处理窗口事件
+            key = self.display_manager.poll_key()
+            if key != 255 and key >= 0:
+                with self.condition:
+                    self.last_key = key
+    
+    def _render(self, frame: np.ndarray, detection_info: Optional[DetectionInfo], fps: float):
+        """绘制检测框和覆盖层，缩放后显示"""
+        with self.tracer.span('overlay'):
+            if self.display_manager.config.draw_detections:
+                frame = self.annotate(frame, detection_info)
+            status_text, current_analysis, is_analyzing = self.status_provider()
+            display_frame = self.display_manager.draw_info_overlay(
+                frame, fps, detection_info, status_text, current_analysis, is_analyzing
+            )
+        with self.tracer.span('display'):
+            display_frame = self.display_manager.resize_for_display(display_frame)
+            self.display_manager.show_frame(display_frame)
+    
+    def get_stats(self) -> dict:
+        """获取渲染统计"""
+        with self.condition:
+            return {
+                'render_submitted': self.submitted_frames,
+                'render_frames': self.rendered_frames,
+                'render_dropped': self.dropped_frames,
+                'avg_render_ms': round(self.render_time_total / self.rendered_frames * 1000, 2)
+                if self.rendered_frames else 0.0
+            }
+    
+    def stop(self):
+        """停止渲染线程"""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(timeout=3)
@@ -0,0 +1,123 @@
+"""
+事件驱动分析调度模块 - 基于bad占比的EWMA/CUSUM变点检测
+"""
+import math
+from typing import Optional
+from models.data_models import DetectionInfo, AnalysisTrigger
+from config.config import Config
+
+PRIORITY_HEARTBEAT = 0
+PRIORITY_DECREASE = 1
+PRIORITY_INCREASE = 2
+
+class AnalysisScheduler:
+    """根据bad占比的显著变化触发分析
+    
+    以EWMA估计bad占比的基线均值和方差，对标准化偏差做双侧CUSUM累积，
+    超过阈值即产生触发。两次分析之间至少间隔 analysis_min_interval
+    (bad占比上升时为 analysis_urgent_min_interval)，间隔内的触发合并为一个待发触发，
+    保留优先级最高者；超过 analysis_max_interval 无触发时补发一次心跳分析。
+    """
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.samples = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.fast_mean = 0.0
+        self.cusum_pos = 0.0
+        self.cusum_neg = 0.0
+        self.pending: Optional[AnalysisTrigger] = None
+        self.last_fired_time: Optional[float] = None
+        self.raised_count = 0
+        self.suppressed_count = 0
+        self.fired_count = 0
+        self.heartbeat_count = 0
+    
+    def update(self, detection_info: Optional[DetectionInfo], now: float) -> Optional[AnalysisTrigger]:
+        """输入一帧检测结果，返回当前应提交的触发 (无则返回None)"""
+        if detection_info is not None and not detection_info.is_empty():
+            bad_fraction = detection_info.counts.get("bad", 0) / detection_info.total_count
+            trigger = self._observe(bad_fraction, now)
+            if trigger is not None:
+                self._raise(trigger)
+        elif self.pending is None:
+            # 画面中没有铁屑时无需分析
+            return None
+        
+        if self.last_fired_time is None:
+            self.last_fired_time = now
+        elapsed = now - self.last_fired_time
+        
+        if self.pending is None and elapsed >= self.config.analysis_max_interval \
+                and detection_info is not None and not detection_info.is_empty():
+            self._raise(AnalysisTrigger("定时心跳", PRIORITY_HEARTBEAT, now, self.fast_mean))
+        
+        if self.pending is None:
+            return None
+        min_interval = self.config.analysis_urgent_min_interval \
+            if self.pending.priority >= PRIORITY_INCREASE else self.config.analysis_min_interval
+        return self.pending if elapsed >= min_interval else None
+    
+    def _observe(self, value: float, now: float) -> Optional[AnalysisTrigger]:
+        """更新EWMA基线和CUSUM统计量，检测到均值偏移时返回触发"""
+        self.samples += 1
+        warmup = self.samples <= self.config.trigger_warmup_frames
+        alpha = 1.0 / self.samples if warmup else self.config.trigger_ewma_alpha
+        self.fast_mean += min(1.0, 10 * alpha) * (value - self.fast_mean)
+        
+        trigger = None
+        if not warmup:
+            sigma = max(math.sqrt(self.var), self.config.trigger_min_std)
+            z = (value - self.mean) / sigma
+            self.cusum_pos = max(0.0, self.cusum_pos + z - self.config.trigger_cusum_k)
+            self.cusum_neg = max(0.0, self.cusum_neg - z - self.config.trigger_cusum_k)
+            if self.cusum_pos > self.config.trigger_cusum_h:
+                trigger = AnalysisTrigger("bad占比上升", PRIORITY_INCREASE, now, self.fast_mean)
+            elif self.cusum_neg > self.config.trigger_cusum_h:
+                trigger = AnalysisTrigger("bad占比下降", PRIORITY_DECREASE, now, self.fast_mean)
+            if trigger is not None:
+                # 变点后以近期均值作为新基线重新累积
+                self.cusum_pos = self.cusum_neg = 0.0
+                self.mean = self.fast_mean
+                return trigger
+        
+        diff = value - self.mean
+        self.mean += alpha * diff
+        self.var = (1 - alpha) * (self.var + alpha * diff * diff)
+        return trigger
+    
+    def _raise(self, trigger: AnalysisTrigger):
+        """登记新触发，已有待发触发时合并"""
+        self.raised_count += 1
+        if self.pending is None:
+            self.pending = trigger
+            return
+        self.suppressed_count += 1
+        self.pending.coalesced += 1
+        if trigger.priority > self.pending.priority:
+            trigger.coalesced = self.pending.coalesced
+            trigger.raised_at = self.pending.raised_at
+            self.pending = trigger
+    
+    def mark_fired(self, now: float):
+        """分析任务提交成功后调用"""
+        if self.pending is not None and self.pending.priority == PRIORITY_HEARTBEAT:
+            self.heartbeat_count += 1
+        self.pending = None
+        self.last_fired_time = now
+        self.fired_count += 1
+    
+    def reset(self):
+        """重置统计量"""
+        self.__init__(self.config)
+    
+    def get_stats(self) -> dict:
+        """获取调度统计"""
+        return {
+            'triggers_raised': self.raised_count,
+            'triggers_suppressed': self.suppressed_count,
+            'triggers_fired': self.fired_count,
+            'heartbeat_triggers': self.heartbeat_count,
+            'bad_fraction_baseline': round(self.mean, 3)
+        }
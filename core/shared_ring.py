@@ -0,0 +1,53 @@
+"""
+共享内存帧环形缓冲模块 - 进程间零拷贝传递帧
+"""
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+class SharedFrameRing:
+    """基于 multiprocessing.shared_memory 的定长帧槽位
+    
+    所有槽位位于同一块共享内存，各进程以NumPy视图直接读写，队列中只传递槽位号。
+    创建者进程分配内存，其它进程通过 spec 按名称挂载；由主进程在所有子进程退出后 unlink。
+    """
+    
+    def __init__(self, shape: Tuple[int, ...], dtype, slots: int, name: Optional[str] = None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=frame_bytes * slots)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.frames: Optional[np.ndarray] = np.ndarray((slots,) + self.shape, dtype=self.dtype, buffer=self.shm.buf)
+    
+    @classmethod
+    def attach(cls, spec: tuple) -> 'SharedFrameRing':
+        """按 spec (名称, 形状, dtype, 槽位数) 挂载已有的共享内存"""
+        name, shape, dtype, slots = spec
+        return cls(shape, dtype, slots, name=name)
+    
+    @property
+    def spec(self) -> tuple:
+        return self.shm.name, self.shape, self.dtype.str, self.slots
+    
+    def view(self, slot: int) -> np.ndarray:
+        """槽位的零拷贝视图"""
+        return self.frames[slot]
+    
+    def close(self):
+        """解除本进程的映射 (仍有外部视图引用时保留映射直到进程退出)"""
+        self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+    
+    def unlink(self):
+        """释放共享内存"""
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
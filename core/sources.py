@@ -0,0 +1,305 @@
+"""
+帧源模块 - 摄像头、视频文件、图片目录和网络流
+"""
+import os
+import re
+import sys
+import time
+from abc import ABC, abstractmethod
+import cv2
+import numpy as np
+from typing import List, Optional, Tuple
+from utils.logger import Logger
+from config.config import Config
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+
+class FrameSource(ABC):
+    """帧源基类"""
+    
+    # 有限帧源(文件/目录)读完后置为True
+    finished = False
+    
+    @abstractmethod
+    def open(self) -> bool:
+        """打开帧源"""
+    
+    @abstractmethod
+    def read(self, out: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        """读取一帧，尺寸一致时写入out以复用缓冲区"""
+    
+    @abstractmethod
+    def release(self):
+        """释放帧源"""
+    
+    def configure(self):
+        """配置帧源参数"""
+    
+    def get_fps(self) -> float:
+        """获取帧源帧率"""
+        return 0.0
+    
+    def get_backend_name(self) -> str:
+        """获取后端名称"""
+        return self.__class__.__name__
+
+
+class _ReplayClock:
+    """按录制帧率回放的节拍器，以帧序号计算发帧时间保证回放确定性"""
+    
+    def __init__(self, mode: str, fps: float):
+        self.mode = mode
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.start_time = None
+        self.frame_index = 0
+    
+    def wait(self):
+        """等待当前帧的发帧时间"""
+        if self.mode == 'realtime' and self.interval > 0:
+            if self.start_time is None:
+                self.start_time = time.perf_counter()
+            due = self.start_time + self.frame_index * self.interval
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        self.frame_index += 1
+    
+    def reset(self):
+        self.start_time = None
+        self.frame_index = 0
+
+
+class CameraSource(FrameSource):
+    """本地摄像头帧源"""
+    
+    def __init__(self, camera_index: int, logger: Logger):
+        self.camera_index = camera_index
+        self.logger = logger
+        self.cap = None
+    
+    def open(self) -> bool:
+        # DirectShow仅在Windows可用，其他平台交由OpenCV自动选择后端
+        api = cv2.CAP_DSHOW if sys.platform.startswith('win') else cv2.CAP_ANY
+        self.cap = cv2.VideoCapture(self.camera_index, api)
+        if not self.cap.isOpened():
+            self.logger.error(f"无法打开摄像头索引 {self.camera_index}")
+            return False
+        return True
+    
+    def configure(self):
+        try:
+            # 设置缓冲区大小
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            # 设置FPS
+            self.cap.set(cv2.CAP_PROP_FPS, 30)
+            self.logger.debug("摄像头参数配置完成")
+        except Exception as e:
+            self.logger.warning(f"摄像头参数配置失败: {e}")
+    
+    def read(self, out: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        return self.cap.read(out) if out is not None else self.cap.read()
+    
+    def get_fps(self) -> float:
+        return self.cap.get(cv2.CAP_PROP_FPS) if self.cap else 0.0
+    
+    def get_backend_name(self) -> str:
+        return self.cap.getBackendName() if self.cap else "Unknown"
+    
+    def release(self):
+        if self.cap:
+            self.cap.release()
+
+
+class VideoFileSource(FrameSource):
+    """视频文件帧源，支持按录制帧率回放和全速回放"""
+    
+    def __init__(self, path: str, logger: Logger, replay_mode: str = 'realtime',
+                 replay_fps: float = 0.0, loop: bool = False):
+        self.path = path
+        self.logger = logger
+        self.replay_mode = replay_mode
+        self.replay_fps = replay_fps
+        self.loop = loop
+        self.cap = None
+        self.clock = None
+        self.finished = False
+    
+    def open(self) -> bool:
+        if not os.path.isfile(self.path):
+            self.logger.error(f"视频文件不存在: {self.path}")
+            return False
+        self.cap = cv2.VideoCapture(self.path)
+        if not self.cap.isOpened():
+            self.logger.error(f"无法打开视频文件: {self.path}")
+            return False
+        self.clock = _ReplayClock(self.replay_mode, self.get_fps())
+        return True
+    
+    def read(self, out: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        success, frame = self.cap.read(out) if out is not None else self.cap.read()
+        if not success and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            success, frame = self.cap.read(out) if out is not None else self.cap.read()
+        if not success:
+            self.finished = True
+            return False, None
+        self.clock.wait()
+        return True, frame
+    
+    def get_fps(self) -> float:
+        if self.replay_fps > 0:
+            return self.replay_fps
+        fps = self.cap.get(cv2.CAP_PROP_FPS) if self.cap else 0.0
+        return fps if fps > 0 else 30.0
+    
+    def get_backend_name(self) -> str:
+        return f"file:{self.replay_mode}"
+    
+    def release(self):
+        if self.cap:
+            self.cap.release()
+
+
+class ImageDirectorySource(FrameSource):
+    """图片目录帧源，按文件名自然顺序回放"""
+    
+    def __init__(self, directory: str, logger: Logger, replay_mode: str = 'realtime',
+                 replay_fps: float = 0.0, loop: bool = False, preload: bool = False):
+        self.directory = directory
+        self.logger = logger
+        self.replay_mode = replay_mode
+        self.replay_fps = replay_fps if replay_fps > 0 else 30.0
+        self.loop = loop
+        self.preload = preload
+        self.files: List[str] = []
+        self.cache: List[np.ndarray] = []
+        self.index = 0
+        self.clock = None
+        self.finished = False
+    
+    @staticmethod
+    def _natural_key(name: str):
+        return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+    
+    def open(self) -> bool:
+        if not os.path.isdir(self.directory):
+            self.logger.error(f"图片目录不存在: {self.directory}")
+            return False
+        
+        names = [n for n in os.listdir(self.directory) if n.lower().endswith(IMAGE_EXTENSIONS)]
+        self.files = [os.path.join(self.directory, n) for n in sorted(names, key=self._natural_key)]
+        if not self.files:
+            self.logger.error(f"图片目录为空: {self.directory}")
+            return False
+        
+        if self.preload:
+            # 预先解码，全速回放时吞吐量不受磁盘和解码影响
+            self.cache = [self._decode(path) for path in self.files]
+            self.logger.info(f"已预加载 {len(self.cache)} 张图片")
+        
+        self.clock = _ReplayClock(self.replay_mode, self.replay_fps)
+        return True
+    
+    @staticmethod
+    def _decode(path: str) -> Optional[np.ndarray]:
+        # cv2.imread不支持非ASCII路径，统一用imdecode读取
+        data = np.fromfile(path, dtype=np.uint8)
+        return cv2.imdecode(data, cv2.IMREAD_COLOR)
+    
+    def read(self, out: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        frame = None
+        # 跳过无法解码的图片，最多尝试一轮
+        for _ in range(len(self.files)):
+            if self.index >= len(self.files):
+                if not self.loop:
+                    self.finished = True
+                    return False, None
+                self.index = 0
+            path = self.files[self.index]
+            frame = self.cache[self.index] if self.cache else self._decode(path)
+            self.index += 1
+            if frame is not None:
+                break
+            self.logger.warning(f"图片解码失败，已跳过: {path}", key="image_decode")
+        
+        if frame is None:
+            self.logger.error(f"连续{len(self.files)}张图片均无法解码，停止回放")
+            self.finished = True
+            return False, None
+        
+        self.clock.wait()
+        if out is not None and out.shape == frame.shape and out.dtype == frame.dtype:
+            np.copyto(out, frame)
+            return True, out
+        # 预加载的图片会被下游复用，不能直接交出
+        return True, frame.copy() if self.cache else frame
+    
+    def get_fps(self) -> float:
+        return self.replay_fps
+    
+    def get_backend_name(self) -> str:
+        return f"images:{self.replay_mode}"
+    
+    def release(self):
+        self.cache = []
+
+
+class StreamSource(FrameSource):
+    """网络流帧源 (RTSP/HTTP等)，断流时自动重连"""
+    
+    def __init__(self, url: str, logger: Logger, reconnect_attempts: int = 3):
+        self.url = url
+        self.logger = logger
+        self.reconnect_attempts = reconnect_attempts
+        self.cap = None
+    
+    def open(self) -> bool:
+        self.cap = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+        if not self.cap.isOpened():
+            self.logger.error(f"无法打开网络流: {self.url}")
+            return False
+        return True
+    
+    def configure(self):
+        try:
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        except Exception as e:
+            self.logger.warning(f"网络流参数配置失败: {e}")
+    
+    def read(self, out: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        success, frame = self.cap.read(out) if out is not None else self.cap.read()
+        attempt = 0
+        while not success and attempt < self.reconnect_attempts:
+            attempt += 1
+            self.logger.warning(f"网络流读取失败，第{attempt}次重连...")
+            self.cap.release()
+            time.sleep(min(2 ** attempt * 0.5, 5.0))
+            if self.open():
+                success, frame = self.cap.read()
+        return success, frame
+    
+    def get_fps(self) -> float:
+        return self.cap.get(cv2.CAP_PROP_FPS) if self.cap else 0.0
+    
+    def get_backend_name(self) -> str:
+        return self.cap.getBackendName() if self.cap else "Unknown"
+    
+    def release(self):
+        if self.cap:
+            self.cap.release()
+
+
+def create_frame_source(config: Config, logger: Logger) -> FrameSource:
+    """根据配置创建帧源"""
+    source_type = config.source_type
+    if source_type == 'camera':
+        return CameraSource(config.camera_index, logger)
+    if source_type == 'video':
+        return VideoFileSource(config.source_path, logger, config.replay_mode,
+                               config.replay_fps, config.replay_loop)
+    if source_type == 'images':
+        return ImageDirectorySource(config.source_path, logger, config.replay_mode,
+                                    config.replay_fps, config.replay_loop, config.source_preload)
+    if source_type == 'stream':
+        return StreamSource(config.source_path, logger)
+    raise ValueError(f"不支持的帧源类型: {source_type}")
@@ -0,0 +1,244 @@
+"""
+持久化存储模块 - 逐帧类别计数和分析结果的批量写入与时间范围查询
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+from models.data_models import AnalysisResult, DetectionInfo
+from utils.logger import Logger
+from config.config import Config
+
+# 单独成列的类别，其余类别只计入 total
+CLASS_COLUMNS = ("good", "medium", "bad")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frame_counts (
+    id INTEGER PRIMARY KEY,
+    camera TEXT NOT NULL,
+    ts REAL NOT NULL,
+    frame_index INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    good INTEGER NOT NULL,
+    medium INTEGER NOT NULL,
+    bad INTEGER NOT NULL,
+    frame_time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_frame_counts_camera_ts ON frame_counts (camera, ts);
+CREATE INDEX IF NOT EXISTS idx_frame_counts_ts ON frame_counts (ts);
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    camera TEXT NOT NULL,
+    ts REAL NOT NULL,
+    request_id INTEGER NOT NULL,
+    submitted_at REAL NOT NULL,
+    success INTEGER NOT NULL,
+    cached INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    error_msg TEXT NOT NULL,
+    latency REAL NOT NULL,
+    ttft REAL NOT NULL,
+    payload_bytes INTEGER NOT NULL,
+    encode_time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_camera_ts ON analyses (camera, ts);
+CREATE INDEX IF NOT EXISTS idx_analyses_ts ON analyses (ts);
+"""
+
+INSERT_FRAME = ("INSERT INTO frame_counts (camera, ts, frame_index, total, good, medium, bad, frame_time) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+INSERT_ANALYSIS = ("INSERT INTO analyses (camera, ts, request_id, submitted_at, success, cached, text, error_msg, "
+                   "latency, ttft, payload_bytes, encode_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+class DetectionStore:
+    """SQLite (WAL) 持久化存储
+    
+    主循环只把行元组放入定长队列 (队列满时丢弃并计数)，后台写线程攒够 store_batch_size 行
+    或等待 store_flush_interval 秒后在单个事务中 executemany 写入。
+    每次查询使用独立连接，WAL模式下与写线程互不阻塞。多摄像头可共用一个数据库，以 camera 区分。
+    """
+    
+    def __init__(self, config: Config, logger: Logger):
+        self.config = config
+        self.logger = logger
+        self.path = config.store_path
+        self.camera = config.store_camera_id or self._default_camera_id(config)
+        self.queue: queue.Queue = queue.Queue(maxsize=config.store_queue_size)
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        self.rows_written = 0
+        self.batches_written = 0
+        self.dropped_rows = 0
+        self.failed_rows = 0
+        self.write_time_total = 0.0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            # WAL模式写入数据库文件，对之后的所有连接生效
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def _default_camera_id(config: Config) -> str:
+        if config.source_type == "camera":
+            return f"camera{config.camera_index}"
+        return os.path.basename(config.source_path.rstrip("/\\")) or config.source_type
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+    
+    def start(self):
+        """启动后台写线程"""
+        self.running = True
+        self.thread = threading.Thread(target=self._write_loop, daemon=True, name="StoreWriter")
+        self.thread.start()
+        self.logger.info(f"持久化存储已启动: {self.path} (camera={self.camera})")
+    
+    def _put(self, item: tuple):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped_rows += 1
+            self.logger.warning("持久化队列已满，丢弃记录", key="store_dropped")
+    
+    def record_frame(self, frame_index: int, detection_info: Optional[DetectionInfo], frame_time: float):
+        """记录一帧的类别计数 (在主循环中调用，只入队)"""
+        if detection_info is None or detection_info.is_empty():
+            total, counts = 0, {}
+        else:
+            total, counts = detection_info.total_count, detection_info.counts
+        self._put((INSERT_FRAME, (self.camera, time.time(), frame_index, total,
+                                  *(counts.get(name, 0) for name in CLASS_COLUMNS), frame_time)))
+    
+    def record_analysis(self, result: AnalysisResult):
+        """记录一次分析结果"""
+        self._put((INSERT_ANALYSIS, (self.camera, result.timestamp, result.request_id, result.submitted_at,
+                                     int(result.success), int(result.cached), result.text, result.error_msg, result.latency,
+                                     result.ttft, result.payload_bytes, result.encode_time)))
+    
+    def _next_batch(self) -> List[tuple]:
+        """取一批待写行: 攒够 store_batch_size 行或距第一行超过 store_flush_interval 秒"""
+        try:
+            batch = [self.queue.get(timeout=self.config.store_flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.config.store_flush_interval
+        while len(batch) < self.config.store_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 and self.running
+                             else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+    
+    def _write_loop(self):
+        """后台写线程"""
+        conn = self._connect()
+        try:
+            while self.running or not self.queue.empty():
+                batch = self._next_batch()
+                if batch:
+                    self._write_batch(conn, batch)
+        finally:
+            conn.close()
+    
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[tuple]):
+        grouped: Dict[str, List[tuple]] = {}
+        for statement, row in batch:
+            grouped.setdefault(statement, []).append(row)
+        start_time = time.perf_counter()
+        try:
+            with conn:
+                for statement, rows in grouped.items():
+                    conn.executemany(statement, rows)
+        except sqlite3.Error as e:
+            self.failed_rows += len(batch)
+            self.logger.error(f"持久化写入失败 ({len(batch)}行): {e}", key="store_write")
+            return
+        self.write_time_total += time.perf_counter() - start_time
+        self.rows_written += len(batch)
+        self.batches_written += 1
+    
+    def _query(self, sql: str, params: tuple) -> List[dict]:
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+    
+    def _where(self, start: float, end: float, camera: Optional[str]) -> tuple:
+        """时间范围 [start, end) 条件，camera为None时查询本摄像头，为"*"时查询全部"""
+        camera = self.camera if camera is None else camera
+        if camera == "*":
+            return "ts >= ? AND ts < ?", (start, end)
+        return "camera = ? AND ts >= ? AND ts < ?", (camera, start, end)
+    
+    def query_counts(self, start: float, end: float, camera: Optional[str] = None,
+                     bucket_seconds: float = 0) -> List[dict]:
+        """查询时间范围内的逐帧计数，bucket_seconds > 0 时按时间桶聚合为平均值和最大值"""
+        where, params = self._where(start, end, camera)
+        if bucket_seconds <= 0:
+            return self._query(f"SELECT camera, ts, frame_index, total, good, medium, bad, frame_time "
+                               f"FROM frame_counts WHERE {where} ORDER BY ts", params)
+        averages = ", ".join(f"AVG({name}) AS avg_{name}" for name in CLASS_COLUMNS)
+        return self._query(
+            f"SELECT camera, CAST(ts / ? AS INTEGER) * ? AS bucket_start, COUNT(*) AS frames, "
+            f"AVG(total) AS avg_total, {averages}, MAX(bad) AS max_bad, AVG(frame_time) AS avg_frame_time "
+            f"FROM frame_counts WHERE {where} GROUP BY camera, bucket_start ORDER BY bucket_start, camera",
+            (bucket_seconds, bucket_seconds) + params
+        )
+    
+    def query_analyses(self, start: float, end: float, camera: Optional[str] = None) -> List[dict]:
+        """查询时间范围内的分析结果"""
+        where, params = self._where(start, end, camera)
+        rows = self._query(f"SELECT camera, ts, request_id, submitted_at, success, cached, text, error_msg, "
+                           f"latency, ttft, payload_bytes, encode_time FROM analyses WHERE {where} ORDER BY ts", params)
+        for row in rows:
+            row['success'] = bool(row['success'])
+            row['cached'] = bool(row['cached'])
+        return rows
+    
+    def summarize(self, start: float, end: float, camera: Optional[str] = None) -> dict:
+        """班次报表: 时间范围内的帧数、各类别平均/累计数量、bad占比以及分析次数和延迟"""
+        where, params = self._where(start, end, camera)
+        sums = ", ".join(f"SUM({name}) AS sum_{name}, AVG({name}) AS avg_{name}" for name in CLASS_COLUMNS)
+        counts = self._query(f"SELECT COUNT(*) AS frames, SUM(total) AS sum_total, {sums}, MAX(bad) AS max_bad, "
+                             f"AVG(frame_time) AS avg_frame_time FROM frame_counts WHERE {where}", params)[0]
+        # 缓存命中不调用API，不计入延迟统计
+        analyses = self._query(f"SELECT COUNT(*) AS analyses, SUM(1 - success) AS analysis_failures, "
+                               f"SUM(cached) AS cached_analyses, "
+                               f"AVG(CASE WHEN cached = 0 THEN latency END) AS avg_analysis_latency, "
+                               f"MAX(CASE WHEN cached = 0 THEN latency END) AS max_analysis_latency "
+                               f"FROM analyses WHERE {where}", params)[0]
+        summary = {'start': start, 'end': end, **counts, **analyses}
+        summary['bad_fraction'] = summary['sum_bad'] / summary['sum_total'] if summary['sum_total'] else 0.0
+        return summary
+    
+    def get_stats(self) -> dict:
+        """获取写入统计"""
+        return {
+            'store_rows_written': self.rows_written,
+            'store_batches': self.batches_written,
+            'store_dropped_rows': self.dropped_rows,
+            'store_failed_rows': self.failed_rows,
+            'store_queue': self.queue.qsize(),
+            'store_avg_batch_ms': round(self.write_time_total / self.batches_written * 1000, 2)
+            if self.batches_written else 0.0
+        }
+    
+    def stop(self):
+        """停止写线程，写完队列中剩余的行"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=10)
+        self.logger.info(f"持久化存储已停止 (共写入 {self.rows_written} 行)")
@@ -0,0 +1,52 @@
+"""
+分块推理模块 - 高分辨率画面的小目标检测
+"""
+import numpy as np
+from typing import List, Optional, Tuple
+from utils.box_ops import batched_nms
+
+def clip_roi(roi: Optional[Tuple[int, int, int, int]], width: int, height: int) -> Tuple[int, int, int, int]:
+    """将感兴趣区域裁剪到画面范围内，未设置时返回整幅画面"""
+    if not roi:
+        return 0, 0, width, height
+    x1, y1, x2, y2 = roi
+    x1, x2 = max(0, min(x1, width)), max(0, min(x2, width))
+    y1, y2 = max(0, min(y1, height)), max(0, min(y2, height))
+    if x2 <= x1 or y2 <= y1:
+        return 0, 0, width, height
+    return x1, y1, x2, y2
+
+
+def _tile_starts(length: int, tile: int, stride: int) -> List[int]:
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, stride))
+    # 最后一块贴齐边缘，保证完全覆盖
+    starts.append(length - tile)
+    return starts
+
+
+def generate_tiles(width: int, height: int, tile_size: int, overlap: float) -> List[Tuple[int, int, int, int]]:
+    """生成覆盖整幅画面的重叠分块 (x1, y1, x2, y2)"""
+    stride = max(1, int(tile_size * (1 - overlap)))
+    tiles = []
+    for y in _tile_starts(height, tile_size, stride):
+        for x in _tile_starts(width, tile_size, stride):
+            tiles.append((x, y, min(x + tile_size, width), min(y + tile_size, height)))
+    return tiles
+
+
+def merge_detections(parts: List[np.ndarray], overlap_threshold: float) -> np.ndarray:
+    """合并各分块的 (N, 6) 检测结果，按类别做跨块NMS
+    
+    被分块边界截断的框与完整框IoU较低，因此使用交集占较小框比例(IoS)判断重复。
+    """
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return np.empty((0, 6), dtype=np.float32)
+    if len(parts) == 1:
+        return parts[0]
+    data = np.concatenate(parts, axis=0)
+    keep = batched_nms(data[:, :4], data[:, 4], data[:, 5].astype(np.int64),
+                       overlap_threshold, metric="ios")
+    return data[keep]
@@ -0,0 +1,196 @@
+"""
+多目标跟踪模块 - IoU匹配 + 卡尔曼滤波 (SORT/ByteTrack风格，纯NumPy)
+"""
+import numpy as np
+from typing import Dict, Optional, Tuple
+from models.data_models import DetectionInfo
+from utils.box_ops import box_iou
+from config.config import Config
+
+# 状态 [cx, cy, s, r, vcx, vcy, vs]，s为面积、r为宽高比，观测 [cx, cy, s, r]
+_F = np.eye(7, dtype=np.float64)
+_F[0, 4] = _F[1, 5] = _F[2, 6] = 1.0
+_Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 0.0001])
+_R = np.diag([1.0, 1.0, 10.0, 10.0])
+_P0 = np.diag([10.0, 10.0, 10.0, 10.0, 10000.0, 10000.0, 10000.0])
+
+def _boxes_to_z(boxes: np.ndarray) -> np.ndarray:
+    w = boxes[:, 2] - boxes[:, 0]
+    h = boxes[:, 3] - boxes[:, 1]
+    return np.column_stack([boxes[:, 0] + w / 2, boxes[:, 1] + h / 2, w * h, w / np.maximum(h, 1e-6)])
+
+
+def _x_to_boxes(x: np.ndarray) -> np.ndarray:
+    area = np.maximum(x[:, 2], 1e-6)
+    w = np.sqrt(area * np.maximum(x[:, 3], 1e-6))
+    h = area / np.maximum(w, 1e-6)
+    return np.column_stack([x[:, 0] - w / 2, x[:, 1] - h / 2, x[:, 0] + w / 2, x[:, 1] + h / 2])
+
+
+def _greedy_match(iou: np.ndarray, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """按IoU从高到低贪心匹配，返回(轨迹索引, 检测索引)"""
+    if iou.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    rows, cols = np.nonzero(iou >= threshold)
+    order = np.argsort(-iou[rows, cols])
+    used_rows, used_cols = set(), set()
+    matched_rows, matched_cols = [], []
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        matched_rows.append(row)
+        matched_cols.append(col)
+    return np.asarray(matched_rows, dtype=np.int64), np.asarray(matched_cols, dtype=np.int64)
+
+
+class MultiObjectTracker:
+    """多目标跟踪器，为检测结果分配持久ID并按轨迹投票确定类别"""
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.class_names: Dict[int, str] = {}
+        self.next_id = 1
+        self.frame_count = 0
+        self.frames_since_detection = 0
+        # 所有轨迹以并列数组存储，便于批量预测和更新
+        self.x = np.empty((0, 7))
+        self.p = np.empty((0, 7, 7))
+        self.ids = np.empty(0, dtype=np.int64)
+        self.hits = np.empty(0, dtype=np.int64)
+        self.time_since_update = np.empty(0, dtype=np.int64)
+        self.confidences = np.empty(0, dtype=np.float32)
+        self.votes = np.empty((0, 0), dtype=np.float32)
+    
+    def _predict(self):
+        """卡尔曼预测所有轨迹"""
+        if len(self.ids) == 0:
+            return
+        # 面积不能外推为负
+        shrinking = self.x[:, 2] + self.x[:, 6] <= 0
+        self.x[shrinking, 6] = 0.0
+        self.x = self.x @ _F.T
+        self.p = _F @ self.p @ _F.T + _Q
+        self.time_since_update += 1
+    
+    def _correct(self, track_idx: np.ndarray, boxes: np.ndarray):
+        """用观测框批量更新匹配上的轨迹"""
+        p = self.p[track_idx]
+        s = p[:, :4, :4] + _R
+        k = p[:, :, :4] @ np.linalg.inv(s)
+        y = _boxes_to_z(boxes) - self.x[track_idx, :4]
+        self.x[track_idx] += (k @ y[..., None])[..., 0]
+        self.p[track_idx] = p - k @ p[:, :4, :]
+    
+    def _ensure_vote_columns(self, max_class_id: int):
+        if max_class_id >= self.votes.shape[1]:
+            pad = max_class_id + 1 - self.votes.shape[1]
+            self.votes = np.pad(self.votes, ((0, 0), (0, pad)))
+    
+    def update(self, detection_info: Optional[DetectionInfo]) -> DetectionInfo:
+        """用新一帧的检测结果更新轨迹，返回带轨迹ID的检测信息"""
+        self.frame_count += 1
+        self.frames_since_detection = 0
+        self._predict()
+        
+        if detection_info is None or detection_info.is_empty():
+            self._remove_stale()
+            return self._output()
+        
+        self.class_names.update(detection_info.class_names)
+        boxes = detection_info.boxes.astype(np.float64)
+        confidences = detection_info.confidences
+        class_ids = detection_info.class_ids
+        self._ensure_vote_columns(int(class_ids.max()))
+        
+        # ByteTrack两阶段匹配: 先匹配高置信度检测，再用低置信度检测补全剩余轨迹
+        high = confidences >= self.config.track_high_threshold
+        unmatched_tracks = np.arange(len(self.ids))
+        matched_dets = np.zeros(len(boxes), dtype=bool)
+        for det_mask in (high, ~high):
+            det_idx = np.nonzero(det_mask)[0]
+            if len(det_idx) == 0 or len(unmatched_tracks) == 0:
+                continue
+            iou = box_iou(_x_to_boxes(self.x[unmatched_tracks]), boxes[det_idx])
+            rows, cols = _greedy_match(iou, self.config.track_iou_threshold)
+            if len(rows) == 0:
+                continue
+            tracks, dets = unmatched_tracks[rows], det_idx[cols]
+            self._correct(tracks, boxes[dets])
+            self.hits[tracks] += 1
+            self.time_since_update[tracks] = 0
+            self.confidences[tracks] = confidences[dets]
+            self.votes[tracks, class_ids[dets]] += confidences[dets]
+            matched_dets[dets] = True
+            unmatched_tracks = np.setdiff1d(unmatched_tracks, tracks)
+        
+        # 未匹配的高置信度检测创建新轨迹
+        new_dets = np.nonzero(high & ~matched_dets)[0]
+        if len(new_dets):
+            self._spawn(boxes[new_dets], confidences[new_dets], class_ids[new_dets])
+        
+        self._remove_stale()
+        return self._output()
+    
+    def predict(self) -> DetectionInfo:
+        """无检测帧时仅做卡尔曼外推，返回预测位置"""
+        self.frame_count += 1
+        self.frames_since_detection += 1
+        self._predict()
+        self._remove_stale()
+        return self._output()
+    
+    def _spawn(self, boxes: np.ndarray, confidences: np.ndarray, class_ids: np.ndarray):
+        count = len(boxes)
+        x = np.zeros((count, 7))
+        x[:, :4] = _boxes_to_z(boxes)
+        votes = np.zeros((count, self.votes.shape[1]), dtype=np.float32)
+        votes[np.arange(count), class_ids] = confidences
+        
+        self.x = np.concatenate([self.x, x])
+        self.p = np.concatenate([self.p, np.repeat(_P0[None], count, axis=0)])
+        self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + count)])
+        self.hits = np.concatenate([self.hits, np.ones(count, dtype=np.int64)])
+        self.time_since_update = np.concatenate([self.time_since_update, np.zeros(count, dtype=np.int64)])
+        self.confidences = np.concatenate([self.confidences, confidences.astype(np.float32)])
+        self.votes = np.concatenate([self.votes, votes])
+        self.next_id += count
+    
+    def _remove_stale(self):
+        """删除长时间未匹配的轨迹"""
+        alive = self.time_since_update <= self.config.track_max_age
+        if alive.all():
+            return
+        self.x, self.p, self.ids = self.x[alive], self.p[alive], self.ids[alive]
+        self.hits, self.time_since_update = self.hits[alive], self.time_since_update[alive]
+        self.confidences, self.votes = self.confidences[alive], self.votes[alive]
+    
+    def _output(self) -> DetectionInfo:
+        """输出已确认的轨迹，类别取累计投票最高者"""
+        confirmed = (self.hits >= self.config.track_min_hits) | (self.frame_count <= self.config.track_min_hits)
+        # 输出最近一次检测中匹配上的轨迹 (检测间隔帧输出外推位置)，
+        # 短暂漏检的轨迹保留track_hold_frames帧，避免计数闪烁
+        max_staleness = self.frames_since_detection + self.config.track_hold_frames
+        visible = confirmed & (self.time_since_update <= max_staleness)
+        if not visible.any():
+            return DetectionInfo(class_names=self.class_names)
+        
+        return DetectionInfo(
+            boxes=_x_to_boxes(self.x[visible]),
+            confidences=self.confidences[visible],
+            class_ids=self.votes[visible].argmax(axis=1),
+            class_names=self.class_names,
+            track_ids=self.ids[visible]
+        )
+    
+    def reset(self):
+        """清空所有轨迹"""
+        self.__init__(self.config)
+    
+    def get_stats(self) -> dict:
+        """获取跟踪统计"""
+        return {
+            'active_tracks': int(len(self.ids)),
+            'total_tracks': self.next_id - 1
+        }
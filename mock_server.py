@@ -0,0 +1,201 @@
+"""
+本地模拟Qwen服务 - OpenAI兼容的 /v1/chat/completions 接口，可配置延迟和错误率
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+DEFAULT_REPLY = "刀头磨损正常，铁屑形态稳定"
+
+class MockQwenServer:
+    """模拟服务，可在后台线程中运行，供离线压测使用
+    
+    每个请求先等待 latency ± jitter 秒，再按 error_rate 返回 error_status 错误，
+    按 hang_rate 挂起 hang_seconds 秒以模拟超时。stream=true 的请求以SSE逐字返回，
+    字间隔 token_delay 秒。
+    """
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.5,
+                 jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 500,
+                 hang_rate: float = 0.0, hang_seconds: float = 60.0, reply: str = DEFAULT_REPLY,
+                 token_delay: float = 0.02):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.reply = reply
+        self.token_delay = token_delay
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.error_count = 0
+        self.thread: Optional[threading.Thread] = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+    
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+    
+    def _handler_class(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"object": "list", "data": [{"id": "mock-qwen", "object": "model"}]})
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+            
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self._send_json(400, {"error": {"message": "invalid json"}})
+                    return
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+                status, payload = server.handle_completion(body)
+                if status == 200 and body.get("stream"):
+                    self._send_stream(payload)
+                else:
+                    self._send_json(status, payload)
+            
+            def _send_stream(self, payload: dict):
+                """以 text/event-stream 逐字发送 chat.completion.chunk"""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                text = payload["choices"][0]["message"]["content"]
+                deltas = [{"role": "assistant", "content": ""}] + [{"content": ch} for ch in text]
+                try:
+                    for index, delta in enumerate(deltas):
+                        if index > 1:
+                            time.sleep(server.token_delay)
+                        self._send_event(server.make_chunk(payload, delta, None))
+                    self._send_event(server.make_chunk(payload, {}, "stop"))
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+            
+            def _send_event(self, data: dict):
+                self.wfile.write(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            
+            def _send_json(self, status: int, payload: dict):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+    
+    def handle_completion(self, body: dict):
+        """按配置模拟一次补全，返回 (HTTP状态码, 响应体)"""
+        with self.lock:
+            self.request_count += 1
+        delay = max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        roll = random.random()
+        if roll < self.hang_rate:
+            time.sleep(self.hang_seconds)
+        else:
+            time.sleep(delay)
+        if self.hang_rate <= roll < self.hang_rate + self.error_rate:
+            with self.lock:
+                self.error_count += 1
+            return self.error_status, {"error": {"message": "mock server injected error",
+                                                 "type": "server_error", "code": self.error_status}}
+        return 200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock-qwen"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.reply},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(self.reply), "total_tokens": len(self.reply)}
+        }
+    
+    @staticmethod
+    def make_chunk(payload: dict, delta: dict, finish_reason: Optional[str]) -> dict:
+        """构造流式响应片段"""
+        return {
+            "id": payload["id"],
+            "object": "chat.completion.chunk",
+            "created": payload["created"],
+            "model": payload["model"],
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+    
+    def start(self):
+        """在后台线程中启动服务"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True, name="MockQwenServer")
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        """停止服务"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join(timeout=3)
+    
+    def get_stats(self) -> dict:
+        """获取请求统计"""
+        with self.lock:
+            return {'mock_requests': self.request_count, 'mock_errors': self.error_count}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="本地模拟Qwen (OpenAI兼容) 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.5, help="响应延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟抖动(秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回错误的概率")
+    parser.add_argument("--error-status", type=int, default=500, help="错误响应的HTTP状态码")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="挂起(模拟超时)的概率")
+    parser.add_argument("--hang-seconds", type=float, default=60.0)
+    parser.add_argument("--reply", default=DEFAULT_REPLY)
+    parser.add_argument("--token-delay", type=float, default=0.02, help="流式响应的字间隔(秒)")
+    return parser.parse_args()
+
+
+def main():
+    """模拟服务入口"""
+    args = parse_args()
+    server = MockQwenServer(args.host, args.port, args.latency, args.jitter, args.error_rate,
+                            args.error_status, args.hang_rate, args.hang_seconds, args.reply,
+                            args.token_delay)
+    print(f"模拟Qwen服务已启动: base_url={server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"模拟Qwen服务已停止: {server.get_stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
-from .data_models import DetectionResult, DetectionInfo, AnalysisResult
+from .data_models import (DetectionResult, DetectionInfo, AnalysisResult, FramePacket, ImagePayload,
+                          TemporalSnapshot, AnalysisTrigger)
 
-__all__ = ['DetectionResult', 'DetectionInfo', 'AnalysisResult']
+__all__ = ['DetectionResult', 'DetectionInfo', 'AnalysisResult', 'FramePacket', 'ImagePayload',
+           'TemporalSnapshot', 'AnalysisTrigger']
@@ -1,8 +1,10 @@
 """
 数据模型定义
 """
+import base64
 from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
 
 @dataclass
 class DetectionResult:
@@ -14,17 +16,84 @@ class DetectionResult:
     bbox: Tuple[float, float, float, float]
 
 class DetectionInfo:
-    """检测信息管理类"""
-    def __init__(self):
-        self.counts: Dict[str, int] = {}
-        self.detections: List[DetectionResult] = []
-        self.total_count: int = 0
+    """检测信息管理类 - 以连续NumPy数组列式存储框、置信度和类别"""
+    def __init__(self, boxes: Optional[np.ndarray] = None,
+                 confidences: Optional[np.ndarray] = None,
+                 class_ids: Optional[np.ndarray] = None,
+                 class_names: Optional[Dict[int, str]] = None,
+                 track_ids: Optional[np.ndarray] = None):
+        self.boxes = self._as_column(boxes, np.float32).reshape(-1, 4)
+        self.confidences = self._as_column(confidences, np.float32)
+        self.class_ids = self._as_column(class_ids, np.int64)
+        self.class_names: Dict[int, str] = dict(class_names or {})
+        # 跟踪模式下每个框对应的持久轨迹ID
+        self.track_ids: Optional[np.ndarray] = None if track_ids is None else self._as_column(track_ids, np.int64)
+        self._counts: Optional[Dict[str, int]] = None
+        self._detections: Optional[List[DetectionResult]] = None
+    
+    @staticmethod
+    def _as_column(values, dtype) -> np.ndarray:
+        if values is None:
+            return np.empty(0, dtype=dtype)
+        return np.ascontiguousarray(values, dtype=dtype)
+    
+    @classmethod
+    def from_array(cls, data: np.ndarray, class_names: Dict[int, str]) -> 'DetectionInfo':
+        """从 (N, 6) 的 [x1, y1, x2, y2, conf, cls] 数组构建"""
+        return cls(data[:, :4], data[:, -2], data[:, -1], class_names)
+    
+    @property
+    def total_count(self) -> int:
+        return int(self.class_ids.shape[0])
+    
+    @property
+    def counts(self) -> Dict[str, int]:
+        """各类别数量 (按类别ID顺序)"""
+        if self._counts is None:
+            bins = np.bincount(self.class_ids, minlength=len(self.class_names)) if self.total_count else []
+            self._counts = {self._class_name(class_id): int(n) for class_id, n in enumerate(bins) if n > 0}
+        return self._counts
+    
+    @property
+    def detections(self) -> List[DetectionResult]:
+        """逐个检测结果 (按需构建)"""
+        if self._detections is None:
+            self._detections = list(self._iter_detections())
+        return self._detections
+    
+    def _class_name(self, class_id: int) -> str:
+        return self.class_names.get(int(class_id), str(class_id))
+    
+    def _iter_detections(self) -> Iterator[DetectionResult]:
+        centers = (self.boxes[:, :2] + self.boxes[:, 2:]) / 2
+        for box, center, confidence, class_id in zip(self.boxes.tolist(), centers.tolist(),
+                                                     self.confidences.tolist(), self.class_ids.tolist()):
+            yield DetectionResult(
+                class_name=self._class_name(class_id),
+                confidence=confidence,
+                center_x=center[0],
+                center_y=center[1],
+                bbox=tuple(box)
+            )
+    
+    def __len__(self) -> int:
+        return self.total_count
+    
+    def __iter__(self) -> Iterator[DetectionResult]:
+        return iter(self.detections)
     
     def add_detection(self, detection: DetectionResult):
-        """添加检测结果"""
-        self.detections.append(detection)
-        self.counts[detection.class_name] = self.counts.get(detection.class_name, 0) + 1
-        self.total_count += 1
+        """添加检测结果 (逐个追加，批量场景请使用from_array)"""
+        class_id = next((i for i, name in self.class_names.items() if name == detection.class_name), None)
+        if class_id is None:
+            class_id = max(self.class_names, default=-1) + 1
+            self.class_names[class_id] = detection.class_name
+        self.boxes = np.vstack([self.boxes, np.asarray(detection.bbox, dtype=np.float32).reshape(1, 4)])
+        self.confidences = np.append(self.confidences, np.float32(detection.confidence))
+        self.class_ids = np.append(self.class_ids, np.int64(class_id))
+        self.track_ids = None
+        self._counts = None
+        self._detections = None
     
     def is_empty(self) -> bool:
         """检查是否为空"""
@@ -39,9 +108,12 @@ class DetectionInfo:
     
     def clear(self):
         """清空检测信息"""
-        self.counts.clear()
-        self.detections.clear()
-        self.total_count = 0
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.confidences = np.empty(0, dtype=np.float32)
+        self.class_ids = np.empty(0, dtype=np.int64)
+        self.track_ids = None
+        self._counts = None
+        self._detections = None
 
 @dataclass
 class AnalysisResult:
@@ -50,3 +122,57 @@ class AnalysisResult:
     timestamp: float
     success: bool
     error_msg: str = ""
+    request_id: int = 0
+    submitted_at: float = 0.0
+    latency: float = 0.0
+    ttft: float = 0.0  # 流式响应的首token延迟，非流式为0
+    payload_bytes: int = 0
+    encode_time: float = 0.0
+    cached: bool = False  # 命中分析缓存，未调用API
+
+@dataclass
+class FramePacket:
+    """采集帧数据类"""
+    frame: np.ndarray
+    sequence: int
+    timestamp: float
+    dropped_frames: int = 0
+    # 多进程流水线中由检测进程随帧附带的检测结果
+    detection_info: Optional[DetectionInfo] = None
+
+@dataclass
+class AnalysisTrigger:
+    """分析触发事件"""
+    reason: str
+    priority: int
+    raised_at: float
+    bad_fraction: float
+    coalesced: int = 0  # 合并进本次触发的其他触发数
+
+@dataclass
+class TemporalSnapshot:
+    """多帧时序分析的上下文: 关键帧和分段计数摘要"""
+    keyframes: List[np.ndarray]
+    keyframe_times: List[float]
+    summary: str
+    frame_count: int
+    duration: float
+
+@dataclass
+class ImagePayload:
+    """上传给VLM的图像载荷"""
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    quality: int
+    encode_time: float
+    
+    @property
+    def size(self) -> int:
+        """编码后字节数"""
+        return len(self.data)
+    
+    def to_data_url(self) -> str:
+        """转换为base64 data URL"""
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('utf-8')}"
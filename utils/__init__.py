@@ -1,4 +1,5 @@
 from .logger import Logger
-from .performance import PerformanceMonitor
+from .performance import PerformanceMonitor, StageTracer, LatencyHistogram
+from .metrics import MetricsExporter
 
-__all__ = ['Logger', 'PerformanceMonitor']
+__all__ = ['Logger', 'PerformanceMonitor', 'StageTracer', 'LatencyHistogram', 'MetricsExporter']
@@ -0,0 +1,66 @@
+"""
+检测框运算工具 - 纯NumPy实现
+"""
+import numpy as np
+
+def xywh2xyxy(boxes: np.ndarray) -> np.ndarray:
+    """中心点宽高格式转换为左上右下角点格式"""
+    out = np.empty_like(boxes)
+    half_wh = boxes[:, 2:4] / 2
+    out[:, :2] = boxes[:, :2] - half_wh
+    out[:, 2:4] = boxes[:, :2] + half_wh
+    return out
+
+
+def box_area(boxes: np.ndarray) -> np.ndarray:
+    """计算xyxy框面积"""
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """计算两组xyxy框的IoU矩阵 (M, N)"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:4], boxes_b[None, :, 2:4])
+    wh = np.clip(bottom_right - top_left, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    union = box_area(boxes_a)[:, None] + box_area(boxes_b)[None, :] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+def box_ios(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """计算交集占较小框面积的比例矩阵 (M, N)，用于合并被分块截断的框"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:4], boxes_b[None, :, 2:4])
+    wh = np.clip(bottom_right - top_left, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    smaller = np.minimum(box_area(boxes_a)[:, None], box_area(boxes_b)[None, :])
+    return inter / np.maximum(smaller, 1e-9)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float,
+        metric: str = "iou") -> np.ndarray:
+    """非极大值抑制，返回保留框的索引 (按分数降序)"""
+    overlap = box_ios if metric == "ios" else box_iou
+    order = np.argsort(-scores)
+    keep = []
+    while order.size > 0:
+        best = order[0]
+        keep.append(best)
+        if order.size == 1:
+            break
+        ious = overlap(boxes[best:best + 1], boxes[order[1:]])[0]
+        order = order[1:][ious <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def batched_nms(boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray,
+                iou_threshold: float, metric: str = "iou") -> np.ndarray:
+    """按类别独立做NMS (通过按类别平移坐标一次完成)"""
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = class_ids.astype(boxes.dtype)[:, None] * (boxes[:, :4].max() + 1)
+    return nms(boxes[:, :4] + offsets, scores, iou_threshold, metric)
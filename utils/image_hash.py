@@ -0,0 +1,17 @@
+"""
+感知哈希工具
+"""
+import cv2
+import numpy as np
+
+def dhash(frame: np.ndarray, hash_size: int = 8) -> int:
+    """计算差异哈希 (dHash)，相似画面的哈希汉明距离小"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    resized = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (resized[:, 1:] > resized[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(hash_a: int, hash_b: int) -> int:
+    """计算两个哈希的汉明距离"""
+    return bin(hash_a ^ hash_b).count("1")
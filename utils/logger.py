@@ -1,19 +1,85 @@
 """
 日志工具模块
 """
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+import time
 from datetime import datetime
+from typing import Dict, List, Optional
+
+class JsonFormatter(logging.Formatter):
+    """JSON Lines 格式，每条日志一行"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        key = getattr(record, 'key', None)
+        if key is not None:
+            entry['key'] = key
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
 
 class Logger:
-    """日志管理类"""
+    """日志管理类
+    
+    调用线程只把日志记录放入队列，由后台 QueueListener 线程写控制台和文件，
+    慢速磁盘或终端不会阻塞检测循环。传入 key 的日志按键限流，
+    rate_limit_interval 秒内同一键只输出一次，被抑制的条数附在下一次输出中。
+    传入 log_queue (进程间队列) 时为子进程日志器: 只把记录放入该队列，由主进程 listen 写出，
+    多个进程不会同时写入和轮转同一日志文件。
+    """
     
-    def __init__(self, log_level: str = "INFO", log_file: str = "detection_log.log"):
+    _listener: Optional[logging.handlers.QueueListener] = None
+    
+    def __init__(self, log_level: str = "INFO", log_file: str = "detection_log.log",
+                 json_format: bool = False, rotation: str = "none", max_bytes: int = 10 * 1024 * 1024,
+                 backup_count: int = 5, rotate_when: str = "midnight", rate_limit_interval: float = 10.0,
+                 log_queue=None):
         self.log_file = log_file
+        self.json_format = json_format
+        self.rotation = rotation
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate_when = rotate_when
+        self.rate_limit_interval = rate_limit_interval
+        self.log_queue = log_queue
+        self.rate_lock = threading.Lock()
+        # 限流键 -> [上次输出时间, 已抑制条数]
+        self.rate_state: Dict[str, List] = {}
         self._setup_logger(log_level)
     
+    @classmethod
+    def from_config(cls, config, log_file: Optional[str] = None, log_queue=None) -> 'Logger':
+        """按配置创建日志器"""
+        return cls(config.log_level, log_file or config.log_file, config.log_json, config.log_rotation,
+                   config.log_max_bytes, config.log_backup_count, config.log_rotate_when,
+                   config.log_rate_limit_interval, log_queue)
+    
     def _setup_logger(self, log_level: str):
         """设置日志器"""
+        if self.log_queue is not None:
+            self.logger = logging.getLogger(__name__)
+            self.logger.setLevel(getattr(logging, log_level.upper()))
+            if not self.logger.handlers:
+                self.logger.addHandler(logging.handlers.QueueHandler(self.log_queue))
+                self.logger.propagate = False
+            return
+        
         # 创建日志目录
         log_dir = "logs"
         if not os.path.exists(log_dir):
@@ -22,7 +88,7 @@ class Logger:
         log_file_path = os.path.join(log_dir, self.log_file)
         
         # 配置日志格式
-        formatter = logging.Formatter(
+        formatter = JsonFormatter() if self.json_format else logging.Formatter(
             '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
         )
         
@@ -35,29 +101,92 @@ class Logger:
             # 控制台handler
             console_handler = logging.StreamHandler()
             console_handler.setFormatter(formatter)
-            self.logger.addHandler(console_handler)
             
             # 文件handler
-            file_handler = logging.FileHandler(log_file_path, encoding='utf-8')
+            file_handler = self._create_file_handler(log_file_path)
             file_handler.setFormatter(formatter)
-            self.logger.addHandler(file_handler)
     
-    def info(self, message: str):
+            # 调用线程只入队，由监听线程写出
+            log_queue = queue.SimpleQueue()
+            self.logger.addHandler(logging.handlers.QueueHandler(log_queue))
+            self.logger.propagate = False
+            listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler,
+                                                      respect_handler_level=True)
+            listener.start()
+            Logger._listener = listener
+            atexit.register(Logger.shutdown)
+    
+    def _create_file_handler(self, path: str) -> logging.Handler:
+        """按轮转方式创建文件handler"""
+        if self.rotation == "size":
+            return logging.handlers.RotatingFileHandler(path, maxBytes=self.max_bytes,
+                                                        backupCount=self.backup_count, encoding='utf-8')
+        if self.rotation == "time":
+            return logging.handlers.TimedRotatingFileHandler(path, when=self.rotate_when,
+                                                             backupCount=self.backup_count, encoding='utf-8')
+        return logging.FileHandler(path, encoding='utf-8')
+    
+    def _log(self, level: int, message: str, key: Optional[str]):
+        if not self.logger.isEnabledFor(level):
+            return
+        extra = None
+        if key is not None:
+            suppressed = self._check_rate(key)
+            if suppressed is None:
+                return
+            extra = {'key': key, 'suppressed': suppressed}
+            if suppressed:
+                message = f"{message} (期间抑制 {suppressed} 条同类日志)"
+        self.logger.log(level, message, extra=extra)
+    
+    def _check_rate(self, key: str) -> Optional[int]:
+        """限流检查，允许输出时返回此前被抑制的条数，否则返回None"""
+        now = time.monotonic()
+        with self.rate_lock:
+            state = self.rate_state.get(key)
+            if state is None:
+                self.rate_state[key] = [now, 0]
+                return 0
+            if now - state[0] < self.rate_limit_interval:
+                state[1] += 1
+                return None
+            suppressed = state[1]
+            state[0], state[1] = now, 0
+            return suppressed
+    
+    def info(self, message: str, key: Optional[str] = None):
         """记录信息日志"""
-        self.logger.info(message)
+        self._log(logging.INFO, message, key)
     
-    def error(self, message: str):
+    def error(self, message: str, key: Optional[str] = None):
         """记录错误日志"""
-        self.logger.error(message)
+        self._log(logging.ERROR, message, key)
     
-    def warning(self, message: str):
+    def warning(self, message: str, key: Optional[str] = None):
         """记录警告日志"""
-        self.logger.warning(message)
+        self._log(logging.WARNING, message, key)
     
-    def debug(self, message: str):
+    def debug(self, message: str, key: Optional[str] = None):
         """记录调试日志"""
-        self.logger.debug(message)
+        self._log(logging.DEBUG, message, key)
     
     def log_performance(self, fps: float, frame_time: float):
         """记录性能信息"""
-        self.info(f"Performance - FPS: {fps:.2f}, Frame Time: {frame_time:.3f}s")
+        self.info(f"Performance - FPS: {fps:.2f}, Frame Time: {frame_time:.3f}s", key="performance")
+
+    @staticmethod
+    def listen(log_queue) -> Optional[logging.handlers.QueueListener]:
+        """在后台线程中把其他进程放入 log_queue 的日志交给本进程的控制台和文件handler写出"""
+        if Logger._listener is None:
+            return None
+        listener = logging.handlers.QueueListener(log_queue, *Logger._listener.handlers,
+                                                  respect_handler_level=True)
+        listener.start()
+        return listener
+    
+    @staticmethod
+    def shutdown():
+        """停止后台写日志线程并写出队列中剩余的日志"""
+        listener, Logger._listener = Logger._listener, None
+        if listener is not None:
+            listener.stop()
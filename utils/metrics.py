@@ -0,0 +1,155 @@
+"""
+指标导出模块 - Prometheus/OpenMetrics 文本格式的HTTP抓取接口
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from utils.logger import Logger
+from utils.performance import LatencyHistogram
+from config.config import Config
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# 导出直方图的桶上界 (秒)，由内部对数分桶累加得到
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Optional[Dict[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class MetricsWriter:
+    """按指标族收集样本，同名指标的 HELP/TYPE 只输出一次"""
+    
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.families: Dict[str, Tuple[str, str, List[str]]] = {}
+    
+    def _family(self, name: str, metric_type: str, help_text: str) -> List[str]:
+        name = self.prefix + name
+        if name not in self.families:
+            self.families[name] = (metric_type, help_text, [])
+        return self.families[name][2]
+    
+    def gauge(self, name: str, value: float, help_text: str, labels: Optional[Dict[str, str]] = None):
+        self._family(name, "gauge", help_text).append(
+            f"{self.prefix}{name}{_format_labels(labels)} {_format_value(value)}")
+    
+    def counter(self, name: str, value: float, help_text: str, labels: Optional[Dict[str, str]] = None):
+        """计数器 (name 需以 _total 结尾)"""
+        self._family(name, "counter", help_text).append(
+            f"{self.prefix}{name}{_format_labels(labels)} {_format_value(value)}")
+    
+    def histogram(self, name: str, histogram: LatencyHistogram, help_text: str,
+                  labels: Optional[Dict[str, str]] = None):
+        samples = self._family(name, "histogram", help_text)
+        count, total, cumulative = histogram.cumulative_counts(LATENCY_BUCKETS)
+        for bound, bucket_count in zip(LATENCY_BUCKETS + (float("inf"),), cumulative + [count]):
+            bucket_labels = dict(labels or {}, le=_format_value(bound))
+            samples.append(f"{self.prefix}{name}_bucket{_format_labels(bucket_labels)} {bucket_count}")
+        samples.append(f"{self.prefix}{name}_sum{_format_labels(labels)} {_format_value(total)}")
+        samples.append(f"{self.prefix}{name}_count{_format_labels(labels)} {count}")
+    
+    def render(self) -> str:
+        lines = []
+        for name, (metric_type, help_text, samples) in self.families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """后台线程中运行的指标HTTP服务
+    
+    每次抓取 /metrics 时依次调用已注册的采集函数，由其向 MetricsWriter 写入当前值，
+    主循环不做任何额外的导出工作。
+    """
+    
+    def __init__(self, config: Config, logger: Logger, prefix: str = "realtime_vlm_"):
+        self.config = config
+        self.logger = logger
+        self.prefix = prefix
+        self.collectors: List[Callable[[MetricsWriter], None]] = []
+        self.scrape_count = 0
+        self.scrape_errors = 0
+        self.thread: Optional[threading.Thread] = None
+        self.httpd: Optional[ThreadingHTTPServer] = None
+    
+    def add_collector(self, collector: Callable[[MetricsWriter], None]):
+        """注册采集函数"""
+        self.collectors.append(collector)
+    
+    def render(self) -> str:
+        """生成一次完整的指标文本"""
+        writer = MetricsWriter(self.prefix)
+        for collector in self.collectors:
+            try:
+                collector(writer)
+            except Exception as e:
+                self.scrape_errors += 1
+                self.logger.warning(f"指标采集失败: {e}", key="metrics_collect")
+        self.scrape_count += 1
+        writer.counter("metrics_scrapes_total", self.scrape_count, "指标抓取次数")
+        writer.counter("metrics_scrape_errors_total", self.scrape_errors, "指标采集失败次数")
+        return writer.render()
+    
+    def _handler_class(self):
+        exporter = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0].rstrip("/")
+                if path == "/metrics":
+                    body = exporter.render().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", CONTENT_TYPE)
+                else:
+                    body = b"not found"
+                    self.send_response(404)
+                    self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+    
+    def start(self):
+        """绑定端口并在后台线程中启动HTTP服务 (端口被占用时抛出OSError)"""
+        self.httpd = ThreadingHTTPServer((self.config.metrics_host, self.config.metrics_port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True, name="MetricsExporter")
+        self.thread.start()
+        host, port = self.httpd.server_address[:2]
+        self.logger.info(f"指标服务已启动: http://{host}:{port}/metrics")
+    
+    def get_stats(self) -> dict:
+        """获取导出统计"""
+        return {'metrics_scrapes': self.scrape_count, 'metrics_scrape_errors': self.scrape_errors}
+    
+    def stop(self):
+        """停止服务"""
+        if self.httpd is None:
+            return
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join(timeout=3)
+        self.logger.info("指标服务已停止")
@@ -1,31 +1,356 @@
 """
 性能监控模块
 """
-from typing import Dict, List
+from collections import deque
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
+import math
+import sys
+import threading
 import time
 from utils.logger import Logger
+from config.config import Config
+
+def get_peak_rss_mb() -> float:
+    """获取进程峰值常驻内存 (MB)"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux单位为KB，macOS为字节
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        # Windows没有resource模块，退回psutil
+        try:
+            import psutil
+            info = psutil.Process().memory_info()
+            return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+        except ImportError:
+            return 0.0
+
+def get_process_stats() -> Dict[str, float]:
+    """获取进程累计CPU时间 (秒) 和当前常驻内存 (MB)"""
+    cpu_seconds = time.process_time()
+    rss_mb = 0.0
+    try:
+        # Linux: /proc/self/statm 第二列为常驻页数
+        import os
+        with open("/proc/self/statm") as f:
+            rss_mb = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        try:
+            import psutil
+            rss_mb = psutil.Process().memory_info().rss / (1024 * 1024)
+        except ImportError:
+            rss_mb = get_peak_rss_mb()
+    return {'cpu_seconds': cpu_seconds, 'rss_mb': rss_mb}
+
+class LatencyHistogram:
+    """固定内存的对数分桶延迟直方图
+    
+    覆盖 1us ~ 100s，每10倍区间 BUCKETS_PER_DECADE 个桶，分位数相对误差约 ±2.3%，
+    记录为O(1)，内存与样本数无关。
+    """
+    
+    MIN_VALUE = 1e-6
+    DECADES = 8
+    BUCKETS_PER_DECADE = 50
+    
+    def __init__(self):
+        # 0号桶收集不足MIN_VALUE的样本，最后一个桶收集溢出样本
+        self.counts = [0] * (self.DECADES * self.BUCKETS_PER_DECADE + 2)
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.min_value = math.inf
+        self.max_value = 0.0
+    
+    def record(self, seconds: float):
+        """记录一个样本 (秒)"""
+        if seconds <= self.MIN_VALUE:
+            index = 0
+        else:
+            index = min(len(self.counts) - 1,
+                        1 + int(math.log10(seconds / self.MIN_VALUE) * self.BUCKETS_PER_DECADE))
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            self.min_value = min(self.min_value, seconds)
+            self.max_value = max(self.max_value, seconds)
+    
+    def percentile(self, percentile: float) -> float:
+        """按桶中点估计分位数 (秒)，结果限制在观测到的最小/最大值之间"""
+        with self.lock:
+            if self.count == 0:
+                return 0.0
+            rank = max(1, math.ceil(percentile / 100.0 * self.count))
+            cumulative = 0
+            for index, bucket_count in enumerate(self.counts):
+                cumulative += bucket_count
+                if cumulative >= rank:
+                    break
+            value = self.MIN_VALUE * 10 ** ((index - 0.5) / self.BUCKETS_PER_DECADE) if index > 0 else self.MIN_VALUE
+            return min(max(value, self.min_value), self.max_value)
+    
+    def cumulative_counts(self, bounds: Tuple[float, ...]) -> Tuple[int, float, List[int]]:
+        """返回 (样本数, 总和, 各上界内的累计样本数)，上界向下对齐到桶边界"""
+        with self.lock:
+            counts = list(self.counts)
+            count, total = self.count, self.total
+        cumulative, running, index = [], 0, 0
+        for bound in bounds:
+            # 上界不超过bound的桶全部计入
+            last = min(len(counts) - 2, int(math.log10(bound / self.MIN_VALUE) * self.BUCKETS_PER_DECADE + 1e-9)) \
+                if bound > self.MIN_VALUE else 0
+            while index <= last:
+                running += counts[index]
+                index += 1
+            cumulative.append(running)
+        return count, total, cumulative
+    
+    def summary(self) -> Dict[str, float]:
+        """样本数、均值、p50/p95/p99和最大值 (毫秒)"""
+        if self.count == 0:
+            return {'count': 0}
+        p50, p95, p99 = (self.percentile(p) for p in (50, 95, 99))
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count * 1000, 3),
+            'p50_ms': round(p50 * 1000, 3),
+            'p95_ms': round(p95 * 1000, 3),
+            'p99_ms': round(p99 * 1000, 3),
+            'max_ms': round(self.max_value * 1000, 3)
+        }
+
+
+class _Span:
+    """计时区间，退出时把耗时记入所属阶段"""
+    
+    __slots__ = ('tracer', 'stage', 'start')
+    
+    def __init__(self, tracer: 'StageTracer', stage: str):
+        self.tracer = tracer
+        self.stage = stage
+        self.start = 0.0
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer.record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    """关闭追踪时使用的空区间"""
+    
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class StageTracer:
+    """按处理阶段统计耗时
+    
+    用法: ``with tracer.span("inference"): ...``、``@tracer.timed("encode")``，
+    或对已测得的耗时调用 ``tracer.record(stage, seconds)``。可跨线程使用。
+    """
+    
+    # 主流程阶段，统计输出按此顺序，其余阶段排在后面
+    STAGES = ("capture", "preprocess", "inference", "postprocess", "extraction",
+              "overlay", "display", "record", "encode", "api")
+    
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.lock = threading.Lock()
+    
+    def span(self, stage: str):
+        """返回计时上下文管理器"""
+        return _Span(self, stage) if self.enabled else _NULL_SPAN
+    
+    def timed(self, stage: str):
+        """函数计时装饰器"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+    
+    def record(self, stage: str, seconds: float):
+        """记录一次阶段耗时 (秒)"""
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(stage, LatencyHistogram())
+        histogram.record(seconds)
+    
+    def get_histograms(self) -> Dict[str, LatencyHistogram]:
+        """各阶段直方图 (供指标导出)"""
+        with self.lock:
+            return dict(self.histograms)
+    
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """各阶段耗时分位数"""
+        with self.lock:
+            stages = dict(self.histograms)
+        ordered = [stage for stage in self.STAGES if stage in stages]
+        ordered += sorted(stage for stage in stages if stage not in self.STAGES)
+        return {stage: stages[stage].summary() for stage in ordered}
+    
+    def reset(self):
+        """清空所有阶段统计"""
+        with self.lock:
+            self.histograms = {}
+
+
+# 未配置追踪器的组件使用的空追踪器
+NULL_TRACER = StageTracer(enabled=False)
+
+
+class AdaptiveController:
+    """自适应降级控制器 - 根据帧耗时调整推理分辨率、检测间隔和标注绘制
+    
+    降级顺序: 逐级降低image_size -> 逐级增大detection_stride -> 关闭检测框绘制，
+    恢复时按相反顺序逐级回升。超过目标立即降级，低于目标*recover_ratio才回升，
+    每次调整后冷却若干个统计窗口，避免来回振荡。
+    
+    image_size 档位按p95帧耗时判断 (降低的是每次推理的耗时)；detection_stride 和绘制档位
+    按窗口平均帧耗时判断 (降低的是摊到每帧的开销)。增大检测间隔时窗口内仍有超过5%的帧在推理，
+    p95 始终等于推理帧的耗时，无法反映这些档位的效果。
+    """
+    
+    def __init__(self, config: Config, logger: Logger):
+        self.config = config
+        self.logger = logger
+        self.levels = self._build_levels()
+        # 前 size_levels 个档位只改变image_size，其后为检测间隔和绘制档位
+        self.size_levels = sum(1 for level in self.levels if level['detection_stride'] == config.detection_stride
+                               and level['draw_detections'])
+        self.level = 0
+        self.cooldown = 0
+        self.adjustments = 0
+        # 档位变化的订阅者，如多进程模式下把设置转发给检测进程
+        self.listeners: List[Callable[[dict], None]] = []
+    
+    def add_listener(self, listener: Callable[[dict], None]):
+        """订阅档位变化"""
+        self.listeners.append(listener)
+    
+    def _build_levels(self) -> List[dict]:
+        """构建从高质量到低开销的档位表"""
+        base_size = self.config.image_size
+        base_stride = self.config.detection_stride
+        sizes = [base_size]
+        # 导出模型的输入尺寸固定，只有PyTorch后端可以调整分辨率
+        if self.config.inference_backend == "pytorch":
+            while sizes[-1] > self.config.adaptive_min_image_size:
+                next_size = max(self.config.adaptive_min_image_size, int(sizes[-1] * 0.8) // 32 * 32)
+                if next_size >= sizes[-1]:
+                    break
+                sizes.append(next_size)
+        
+        levels = [{'image_size': size, 'detection_stride': base_stride, 'draw_detections': True}
+                  for size in sizes]
+        for stride in range(base_stride + 1, self.config.adaptive_max_stride + 1):
+            levels.append({'image_size': sizes[-1], 'detection_stride': stride, 'draw_detections': True})
+        levels.append({**levels[-1], 'draw_detections': False})
+        return levels
+    
+    def _metric(self, upper_level: int, p95_frame_time: float, mean_frame_time: float) -> Tuple[str, float]:
+        """档位 upper_level-1 与 upper_level 之间切换所依据的指标"""
+        if upper_level < self.size_levels:
+            return "p95帧耗时", p95_frame_time
+        return "平均帧耗时", mean_frame_time
+    
+    def update(self, p95_frame_time: float, mean_frame_time: float) -> bool:
+        """根据最近窗口的帧耗时调整档位，返回是否发生调整"""
+        if self.cooldown > 0:
+            self.cooldown -= 1
+            return False
+        
+        target = self.config.target_frame_time
+        down_name, down_value = self._metric(self.level + 1, p95_frame_time, mean_frame_time)
+        up_name, up_value = self._metric(self.level, p95_frame_time, mean_frame_time)
+        if down_value > target and self.level < len(self.levels) - 1:
+            new_level, metric_name, metric_value = self.level + 1, down_name, down_value
+        elif up_value < target * self.config.adaptive_recover_ratio and self.level > 0:
+            new_level, metric_name, metric_value = self.level - 1, up_name, up_value
+        else:
+            return False
+        
+        old_level, self.level = self.level, new_level
+        self._apply(self.levels[new_level])
+        self.cooldown = self.config.adaptive_cooldown_windows
+        self.adjustments += 1
+        
+        settings = self.levels[new_level]
+        direction = "降级" if new_level > old_level else "回升"
+        self.logger.info(
+            f"自适应{direction}: 档位 {old_level} -> {new_level} "
+            f"({metric_name} {metric_value * 1000:.1f}ms, 目标 {target * 1000:.1f}ms) - "
+            f"image_size={settings['image_size']}, detection_stride={settings['detection_stride']}, "
+            f"绘制检测框={'开' if settings['draw_detections'] else '关'}"
+        )
+        return True
+    
+    def _apply(self, settings: dict):
+        """将档位写回运行中的配置并通知订阅者"""
+        for key, value in settings.items():
+            setattr(self.config, key, value)
+        for listener in self.listeners:
+            listener(dict(settings))
+    
+    def get_stats(self) -> dict:
+        """获取控制器状态"""
+        return {
+            'adaptive_level': self.level,
+            'adaptive_adjustments': self.adjustments,
+            **self.levels[self.level]
+        }
+
 
 class PerformanceMonitor:
     """性能监控器类"""
     
-    def __init__(self, logger: Logger, window_size: int = 30, fps_threshold: float = 10.0):
+    def __init__(self, logger: Logger, window_size: int = 30, fps_threshold: float = 10.0,
+                 controller: Optional[AdaptiveController] = None, tracer: Optional[StageTracer] = None):
         self.logger = logger
         self.window_size = window_size
         self.fps_threshold = fps_threshold
-        self.frame_times: List[float] = []
+        self.controller = controller
+        self.tracer = tracer if tracer is not None else StageTracer()
+        self.frame_times = deque(maxlen=window_size)
+        # 帧耗时的指数滑动平均，平滑系数与窗口大小对应
+        self.ewma_alpha = 2.0 / (window_size + 1)
+        self.ewma_frame_time = 0.0
         self.frame_count = 0
         self.start_time = time.time()
         
     def record_frame_time(self, frame_time: float):
         """记录帧处理时间"""
         self.frame_times.append(frame_time)
-        if len(self.frame_times) > self.window_size:
-            self.frame_times.pop(0)
+        if self.frame_count == 0:
+            self.ewma_frame_time = frame_time
+        else:
+            self.ewma_frame_time += self.ewma_alpha * (frame_time - self.ewma_frame_time)
         self.frame_count += 1
         
-    def get_current_fps(self, frame_time: float) -> float:
-        """获取当前FPS"""
-        return 1.0 / frame_time if frame_time > 0 else 0.0
+    def get_current_fps(self) -> float:
+        """获取当前FPS (按帧耗时EWMA计算，避免逐帧跳动)"""
+        return 1.0 / self.ewma_frame_time if self.ewma_frame_time > 0 else 0.0
     
     def get_average_fps(self) -> float:
         """获取平均FPS"""
@@ -34,14 +359,26 @@ class PerformanceMonitor:
         avg_time = sum(self.frame_times) / len(self.frame_times)
         return 1.0 / avg_time if avg_time > 0 else 0.0
     
+    def get_percentile_frame_time(self, percentile: float) -> float:
+        """获取窗口内帧耗时的百分位数"""
+        if not self.frame_times:
+            return 0.0
+        ordered = sorted(self.frame_times)
+        index = min(len(ordered) - 1, int(round(percentile / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+    
     def check_performance(self):
-        """检查性能并记录警告"""
+        """检查性能并记录警告，配置了控制器时按p95和平均帧耗时自适应调整"""
         if self.frame_count % self.window_size == 0 and self.frame_times:
             avg_fps = self.get_average_fps()
             if avg_fps < self.fps_threshold:
-                self.logger.warning(f"性能警告: 平均FPS仅为 {avg_fps:.1f}")
+                self.logger.warning(f"性能警告: 平均FPS仅为 {avg_fps:.1f}", key="performance_warning")
             else:
                 self.logger.debug(f"性能正常: 平均FPS为 {avg_fps:.1f}")
+            
+            if self.controller is not None:
+                mean_frame_time = sum(self.frame_times) / len(self.frame_times)
+                self.controller.update(self.get_percentile_frame_time(95), mean_frame_time)
     
     def get_summary(self) -> Dict[str, float]:
         """获取性能摘要"""
@@ -51,11 +388,18 @@ class PerformanceMonitor:
             'total_time': total_time,
             'average_fps': self.get_average_fps(),
             'average_frame_time': sum(self.frame_times) / len(self.frame_times) if self.frame_times else 0,
+            'ewma_fps': self.get_current_fps(),
             'overall_fps': self.frame_count / total_time if total_time > 0 else 0
         }
     
+    def get_stage_stats(self) -> Dict[str, Dict[str, float]]:
+        """获取各阶段耗时分位数"""
+        return self.tracer.get_stats()
+    
     def reset(self):
         """重置监控器"""
         self.frame_times.clear()
+        self.ewma_frame_time = 0.0
         self.frame_count = 0
         self.start_time = time.time()
+        self.tracer.reset()
@@ -0,0 +1,110 @@
+"""
+API容错工具 - 抖动指数退避重试和熔断器
+"""
+import random
+import threading
+import time
+from typing import Optional
+
+class CircuitOpenError(Exception):
+    """熔断器打开期间拒绝调用"""
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """超时、连接错误、429和5xx可重试，其余4xx (参数、鉴权错误) 不重试"""
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        response = getattr(error, "response", None)
+        status_code = getattr(response, "status_code", None)
+    if status_code is None:
+        return not isinstance(error, (ValueError, TypeError, CircuitOpenError))
+    return status_code == 429 or status_code >= 500
+
+
+class RetryPolicy:
+    """带完全抖动的指数退避: delay ~ U(0, min(max_delay, base_delay * 2^attempt))"""
+    
+    def __init__(self, max_retries: int, base_delay: float, max_delay: float):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+    
+    def next_delay(self, attempt: int, error: Exception, deadline: float) -> Optional[float]:
+        """返回第attempt次失败后的等待时间，不应重试或等待会超出截止时间时返回None"""
+        if attempt >= self.max_retries or not is_retryable_error(error):
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    """熔断器
+    
+    连续失败 failure_threshold 次后打开，reset_timeout 秒内拒绝所有调用；
+    之后进入半开状态放行一次试探调用，成功则关闭，失败则重新打开。
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.open_count = 0
+        self.rejected_count = 0
+    
+    def is_open(self) -> bool:
+        """是否处于熔断期 (不改变状态)"""
+        with self.lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at < self.reset_timeout
+            return self.state == self.HALF_OPEN and self.trial_in_flight
+    
+    def allow_request(self) -> bool:
+        """申请一次调用许可"""
+        with self.lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected_count += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self.trial_in_flight:
+                    self.rejected_count += 1
+                    return False
+                self.trial_in_flight = True
+            return True
+    
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.trial_in_flight = False
+    
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            self.trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.open_count += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+    
+    def get_stats(self) -> dict:
+        """获取熔断统计"""
+        with self.lock:
+            return {
+                'circuit_state': self.state,
+                'circuit_opened': self.open_count,
+                'circuit_rejected': self.rejected_count
+            }
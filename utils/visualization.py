@@ -0,0 +1,47 @@
+"""
+检测结果可视化工具
+"""
+import cv2
+import numpy as np
+from typing import Dict, Tuple
+from models.data_models import DetectionInfo
+
+# 各类别框颜色 (BGR)
+CLASS_COLORS: Dict[str, Tuple[int, int, int]] = {
+    "good": (0, 200, 0),
+    "medium": (0, 200, 255),
+    "bad": (0, 0, 255),
+}
+DEFAULT_COLOR = (255, 128, 0)
+
+def draw_detections(frame: np.ndarray, detection_info: DetectionInfo,
+                    draw_labels: bool = True) -> np.ndarray:
+    """在帧上原地绘制检测框和标签"""
+    if detection_info is None or detection_info.is_empty():
+        return frame
+    
+    boxes = np.round(detection_info.boxes).astype(np.int32)
+    for class_id in np.unique(detection_info.class_ids):
+        class_name = detection_info.class_names.get(int(class_id), str(class_id))
+        color = CLASS_COLORS.get(class_name, DEFAULT_COLOR)
+        mask = detection_info.class_ids == class_id
+        
+        # 同一类别的框组装成多边形一次性绘制
+        class_boxes = boxes[mask]
+        polygons = np.stack([
+            class_boxes[:, [0, 1]], class_boxes[:, [2, 1]],
+            class_boxes[:, [2, 3]], class_boxes[:, [0, 3]]
+        ], axis=1)
+        cv2.polylines(frame, list(polygons), True, color, 2)
+        
+        if draw_labels:
+            track_ids = detection_info.track_ids[mask].tolist() if detection_info.track_ids is not None \
+                else [None] * len(class_boxes)
+            for (x1, y1, _, _), confidence, track_id in zip(class_boxes.tolist(),
+                                                            detection_info.confidences[mask].tolist(),
+                                                            track_ids):
+                label = f"{class_name} {confidence:.2f}" if track_id is None \
+                    else f"#{track_id} {class_name} {confidence:.2f}"
+                cv2.putText(frame, label, (x1, max(y1 - 4, 10)),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 1)
+    return frame